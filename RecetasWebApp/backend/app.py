@@ -24,10 +24,18 @@ async def lifespan(app: FastAPI):
     #except Exception as e:
         #logger.warning(f"⚠️ Error iniciando job receiver: {e}")
     
+    from services.receta_pipeline import iniciar_pipeline, detener_pipeline
+    iniciar_pipeline()
+
     yield
     
     # Shutdown
     logger.info("🛑 RecetasWebApp apagándose...")
+    detener_pipeline()
+    from services.drive_service import shutdown_executor
+    shutdown_executor()
+    from database.base import dispose_async_engines
+    await dispose_async_engines()
 
 # Crear app
 app = FastAPI(
@@ -44,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 # Registrar routers
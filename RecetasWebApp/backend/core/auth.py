@@ -1,20 +1,43 @@
 # backend/core/auth.py
+import os
+import time
+import asyncio
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from core.config import settings
 from core.logger import logger
-from database.base import get_db
+from database.base import get_db, SessionLocal
 from database.web_models import UserWeb
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coste de bcrypt: los hashes con otro coste se rehashean al hacer login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# Caché de usuarios autenticados (sub del JWT -> UsuarioActual)
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_MAX = int(os.getenv("AUTH_USER_CACHE_MAX", "1024"))
+
+# Login: bcrypt corre en un pool propio y acotado (no en el threadpool de los
+# endpoints) y se limitan los intentos simultáneos por usuario, por IP y en total
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+LOGIN_MAX_CONCURRENT_PER_USER = int(os.getenv("LOGIN_MAX_CONCURRENT_PER_USER", "2"))
+LOGIN_MAX_CONCURRENT_PER_IP = int(os.getenv("LOGIN_MAX_CONCURRENT_PER_IP", "4"))
+LOGIN_MAX_PENDING = int(os.getenv("LOGIN_MAX_PENDING", "64"))
+
 # -------- PASSWORDS -------- #
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -42,6 +65,117 @@ def authenticate_user(db: Session, username: str, password: str):
         return None
     return user
 
+# -------- LOGIN (bcrypt fuera del event loop) -------- #
+
+_hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+class LoginLimiter:
+    """
+    Intentos de login en curso por usuario, por IP y en total.
+    Al superar un límite se responde 429 en lugar de encolar más trabajo de
+    bcrypt: una ráfaga de logins no puede acaparar la CPU del resto de la API.
+    """
+
+    def __init__(self, por_usuario: int = LOGIN_MAX_CONCURRENT_PER_USER,
+                 por_ip: int = LOGIN_MAX_CONCURRENT_PER_IP, total: int = LOGIN_MAX_PENDING):
+        self.por_usuario = por_usuario
+        self.por_ip = por_ip
+        self.total = total
+        self._lock = threading.Lock()
+        self._usuarios = Counter()
+        self._ips = Counter()
+        self._en_curso = 0
+
+    @contextmanager
+    def adquirir(self, username: str, ip: Optional[str]):
+        with self._lock:
+            if self._en_curso >= self.total:
+                motivo = "Demasiados inicios de sesión en curso"
+            elif self._usuarios[username] >= self.por_usuario:
+                motivo = "Demasiados intentos simultáneos para este usuario"
+            elif ip and self._ips[ip] >= self.por_ip:
+                motivo = "Demasiados intentos simultáneos desde esta IP"
+            else:
+                motivo = None
+                self._en_curso += 1
+                self._usuarios[username] += 1
+                if ip:
+                    self._ips[ip] += 1
+        if motivo:
+            logger.warning(f"[AUTH] Login rechazado ({motivo}): usuario={username} ip={ip}")
+            raise HTTPException(status_code=429, detail=motivo, headers={"Retry-After": "1"})
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._en_curso -= 1
+                self._usuarios[username] -= 1
+                if self._usuarios[username] <= 0:
+                    del self._usuarios[username]
+                if ip:
+                    self._ips[ip] -= 1
+                    if self._ips[ip] <= 0:
+                        del self._ips[ip]
+
+
+login_limiter = LoginLimiter()
+
+
+async def _en_pool_hash(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _en_pool_hash(pwd_context.hash, password)
+
+
+def _hash_de_usuario(username: str):
+    db = SessionLocal()
+    try:
+        return db.query(UserWeb.id, UserWeb.hashed_password).filter(UserWeb.username == username).first()
+    finally:
+        db.close()
+
+
+def _guardar_hash(user_id: int, nuevo_hash: str):
+    db = SessionLocal()
+    try:
+        db.query(UserWeb).filter(UserWeb.id == user_id).update(
+            {UserWeb.hashed_password: nuevo_hash}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def authenticate_user_async(username: str, password: str, ip: Optional[str] = None) -> bool:
+    """
+    Igual que authenticate_user, pero bcrypt corre en el pool acotado y con
+    límites de concurrencia (429 si se superan). Si el hash usa un coste
+    distinto de BCRYPT_ROUNDS se rehashea y se guarda de forma transparente.
+    """
+    with login_limiter.adquirir(username, ip):
+        fila = await run_in_threadpool(_hash_de_usuario, username)
+        if not fila:
+            return False
+
+        ok, nuevo_hash = await _en_pool_hash(pwd_context.verify_and_update, password, fila.hashed_password)
+        if not ok:
+            return False
+
+        if nuevo_hash:
+            try:
+                await run_in_threadpool(_guardar_hash, fila.id, nuevo_hash)
+                logger.info(f"[AUTH] Hash de {username} actualizado a bcrypt rounds={BCRYPT_ROUNDS}")
+            except Exception as e:
+                # El login es válido aunque no se haya podido guardar el hash nuevo
+                logger.warning(f"[AUTH] No se pudo rehashear la contraseña de {username}: {e}")
+        return True
+
 # -------- JWT -------- #
 
 def create_access_token(subject: str, expires_delta: Optional[timedelta] = None):
@@ -56,22 +190,112 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
+# -------- USUARIO ACTUAL (CACHEADO) -------- #
+
+@dataclass(frozen=True)
+class UsuarioActual:
+    """Lo que los endpoints necesitan del usuario, sin sesión ni objeto ORM detrás."""
+    id: int
+    username: str
+    is_active: bool
+    full_name: Optional[str] = None
+    email: Optional[str] = None
+
+    @classmethod
+    def from_orm(cls, user: UserWeb) -> "UsuarioActual":
+        return cls(
+            id=user.id,
+            username=user.username,
+            is_active=user.is_active is not False,
+            full_name=user.full_name,
+            email=user.email,
+        )
+
+
+class UserCache:
+    """
+    LRU acotado con TTL. Solo guarda usuarios encontrados (los inexistentes
+    siempre van a la BD). Los cambios hechos en este proceso vía ORM lo
+    invalidan al momento; los de otros procesos, como mucho tras el TTL.
+    """
+
+    def __init__(self, ttl: float = AUTH_USER_CACHE_TTL, max_size: int = AUTH_USER_CACHE_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # username -> (expira, UsuarioActual)
+
+    def get(self, username: str) -> Optional[UsuarioActual]:
+        with self._lock:
+            item = self._data.get(username)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._data[username]
+                return None
+            self._data.move_to_end(username)
+            return item[1]
+
+    def put(self, usuario: UsuarioActual):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[usuario.username] = (time.monotonic() + self.ttl, usuario)
+            self._data.move_to_end(usuario.username)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, username: Optional[str] = None):
+        with self._lock:
+            if username is None:
+                self._data.clear()
+            else:
+                self._data.pop(username, None)
+
+
+user_cache = UserCache()
+
 
+@event.listens_for(UserWeb, "after_update")
+@event.listens_for(UserWeb, "after_delete")
+def _invalidar_usuario(mapper, connection, target):
+    """Cualquier cambio o baja de un usuario (vía ORM) lo saca de la caché."""
+    user_cache.invalidate(target.username)
+    # Si cambió el username, olvidar también el anterior
+    for anterior in inspect(target).attrs.username.history.deleted:
+        user_cache.invalidate(anterior)
+
+
+def _cargar_usuario(username: str) -> Optional[UsuarioActual]:
+    db = SessionLocal()
+    try:
         user = db.query(UserWeb).filter(UserWeb.username == username).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        return UsuarioActual.from_orm(user) if user else None
+    finally:
+        db.close()
+
 
-        return user
-    
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UsuarioActual:
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido o expirado")
 
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    usuario = user_cache.get(username)
+    if usuario is None:
+        usuario = await run_in_threadpool(_cargar_usuario, username)
+        if not usuario:
+            raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        user_cache.put(usuario)
+
+    if not usuario.is_active:
+        raise HTTPException(status_code=401, detail="Usuario inactivo")
+    return usuario
+
 
 # -------- MODEL -------- #
 
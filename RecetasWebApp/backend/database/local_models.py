@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
 from database.base import Base
 from datetime import datetime
 
@@ -30,11 +30,21 @@ class RecetaLocal(Base):
     indicaciones = Column(Text, nullable=True)
     xml_path = Column(String, nullable=True)
     pdf_path = Column(String, nullable=True)
+    pdf_password = Column(String, nullable=True)
     checksum = Column(String, nullable=True)
     fecha_emision = Column(DateTime, nullable=True)
     origen = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Listado paginado por (created_at, id_receta) con filtros; estadísticas por origen/PDF
+    __table_args__ = (
+        Index("ix_recetas_local_created_at_id", "created_at", "id_receta"),
+        Index("ix_recetas_local_origen_created", "origen", "created_at", "id_receta"),
+        Index("ix_recetas_local_medico_created", "medico_id", "created_at", "id_receta"),
+        Index("ix_recetas_local_paciente_created", "paciente_id", "created_at", "id_receta"),
+        Index("ix_recetas_local_origen_pdf", "origen", "pdf_path"),
+    )
+
 class MedicamentoLocal(Base):
     __tablename__ = "medicamentos_local"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -44,3 +54,6 @@ class MedicamentoLocal(Base):
     frecuencia = Column(String, nullable=True)
     duracion = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index("ix_medicamentos_local_receta", "receta_id", "id"),
+    )
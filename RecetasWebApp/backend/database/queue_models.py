@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index, UniqueConstraint
+from database.base import Base
+from datetime import datetime
+
+class TrabajoCola(Base):
+    """Trabajo de los jobs sender/receiver (un archivo XML por fila)."""
+    __tablename__ = "cola_trabajos"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cola = Column(String, nullable=False)            # "sender" | "receiver"
+    archivo = Column(String, nullable=False)         # ruta absoluta del XML
+    prioridad = Column(Integer, default=0)           # menor = antes
+    estado = Column(String, default="pendiente")     # pendiente | en_proceso | completado | error | dead_letter
+    intentos = Column(Integer, default=0)
+    next_run_at = Column(DateTime, default=datetime.utcnow)
+    lease_until = Column(DateTime, nullable=True)
+    worker_id = Column(String, nullable=True)
+    ultimo_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("cola", "archivo", name="uq_cola_trabajos_archivo"),
+        # reclamar(): por cola y estado, en orden (prioridad, id) sin ordenar en memoria
+        Index("ix_cola_trabajos_reclamo_orden", "cola", "estado", "prioridad", "id"),
+    )
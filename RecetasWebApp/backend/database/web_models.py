@@ -1,5 +1,6 @@
 # backend/database/web_models.py  (añadir o editar)
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Text, Index
+from sqlalchemy.orm import relationship
 from database.base import Base
 from datetime import datetime
 
@@ -36,6 +37,22 @@ class RecetaWeb(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     sent = Column(Boolean, default=False)
 
+    # Índices según las consultas reales: listado paginado por (created_at, id),
+    # filtros por médico/paciente/enviada y export_pending (sent = 0)
+    __table_args__ = (
+        Index("ix_recetas_web_created_at_id", "created_at", "id"),
+        Index("ix_recetas_web_medico_created", "medico_id", "created_at", "id"),
+        Index("ix_recetas_web_paciente_created", "paciente_id", "created_at", "id"),
+        Index("ix_recetas_web_sent_created", "sent", "created_at", "id"),
+    )
+
+    medicamentos = relationship(
+        "MedicamentoWeb",
+        back_populates="receta",
+        order_by="MedicamentoWeb.id",
+        cascade="all, delete-orphan"
+    )
+
 class MedicamentoWeb(Base):
     __tablename__ = "medicamentos_web"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -45,6 +62,12 @@ class MedicamentoWeb(Base):
     frecuencia = Column(String, nullable=True)
     duracion = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index("ix_medicamentos_web_receta", "receta_id", "id"),
+    )
+
+    receta = relationship("RecetaWeb", back_populates="medicamentos")
+
 # NUEVO: Usuario para auth
 class UserWeb(Base):
     __tablename__ = "users"
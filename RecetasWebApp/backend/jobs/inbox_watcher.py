@@ -0,0 +1,163 @@
+# backend/jobs/inbox_watcher.py
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from core.logger import logger
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """Envoltorio mínimo de inotify vía ctypes (solo Linux, sin dependencias)."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch falló para {path}")
+
+    def read(self, timeout: float) -> Optional[List[str]]:
+        """
+        Espera eventos hasta `timeout` segundos.
+        Devuelve los nombres de archivo, o None si la cola del kernel se desbordó.
+        """
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return []
+
+        names = []
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class InboxWatcher:
+    """
+    Vigila un directorio y devuelve los archivos nuevos en lotes.
+
+    Modos:
+      - "inotify": eventos del kernel (Linux). Los archivos se detectan en ms.
+      - "stat":    sondea el mtime del directorio y solo lo lista si cambió.
+      - "auto":    inotify si está disponible, si no "stat".
+
+    Los eventos se agrupan (debounce): tras el primer archivo se sigue
+    esperando `debounce` segundos de silencio antes de devolver el lote.
+    """
+
+    def __init__(self, path: str, suffix: str = ".xml", mode: str = "auto",
+                 debounce: float = 0.2, poll_interval: float = 1.0, max_batch_wait: float = 2.0):
+        self.path = path
+        self.suffix = suffix.lower()
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.max_batch_wait = max_batch_wait
+        self._inotify = None
+        self._dir_mtime = None
+        self._known = set()
+
+        os.makedirs(path, exist_ok=True)
+
+        if mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(path)
+            except Exception as e:
+                if mode == "inotify":
+                    raise
+                logger.warning(f"[WATCHER] inotify no disponible ({e}), usando sondeo por mtime")
+        elif mode == "inotify":
+            raise RuntimeError("El modo inotify solo está disponible en Linux")
+
+        self.mode = "inotify" if self._inotify else "stat"
+        if self.mode == "stat":
+            self._dir_mtime = os.stat(path).st_mtime_ns
+            self._known = set(self._list())
+        logger.info(f"[WATCHER] Vigilando {path} (modo {self.mode})")
+
+    def _list(self) -> List[str]:
+        return [f for f in os.listdir(self.path) if f.lower().endswith(self.suffix)]
+
+    def _to_paths(self, names) -> List[str]:
+        return sorted(
+            os.path.join(self.path, n) for n in set(names)
+            if n.lower().endswith(self.suffix) and os.path.exists(os.path.join(self.path, n))
+        )
+
+    def _poll_once(self) -> List[str]:
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._dir_mtime:
+            return []
+        self._dir_mtime = mtime
+        current = set(self._list())
+        nuevos = current - self._known
+        self._known = current
+        return list(nuevos)
+
+    def _wait_raw(self, timeout: float) -> Optional[List[str]]:
+        if self._inotify:
+            return self._inotify.read(timeout)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            nuevos = self._poll_once()
+            restante = deadline - time.monotonic()
+            if nuevos or restante <= 0:
+                return nuevos
+            time.sleep(min(self.poll_interval, restante))
+
+    def wait(self, timeout: float) -> List[str]:
+        """
+        Bloquea hasta que llegan archivos nuevos o vence `timeout`.
+        Devuelve rutas completas (lista vacía si no llegó nada).
+        """
+        names = self._wait_raw(timeout)
+        if names is None:
+            # Desbordamiento: reescanear el directorio completo
+            return self._to_paths(self._list())
+        if not names:
+            return []
+
+        # Debounce: acumular mientras sigan llegando archivos
+        lote = set(names)
+        limite = time.monotonic() + self.max_batch_wait
+        while time.monotonic() < limite:
+            mas = self._wait_raw(self.debounce if self._inotify else min(self.debounce, self.poll_interval))
+            if mas is None:
+                return self._to_paths(self._list())
+            if not mas:
+                break
+            lote.update(mas)
+
+        return self._to_paths(lote)
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
@@ -4,19 +4,19 @@ import sys
 import time
 import glob
 import secrets
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from lxml import etree
 from database.base import SessionLocal, LocalSessionLocal
 from database.local_models import RecetaLocal
 from database.web_models import RecetaWeb, PacienteWeb, MedicoWeb
-from services.checksum import validar_checksum
 from services.drive_service import sync_drive_to_local
-from services.xsd_validator import validate_xml_against_xsd
-from services.xml_generator import parse_receta_xml
+from services.xml_document import XmlDocument
 from services.pdf_generator import generate_receta_pdf
-from services.pdf_protect import proteger_pdf_con_contrasena
 from services.email_sender import enviar_receta_completa
+from jobs.inbox_watcher import InboxWatcher
+from services import job_queue
 from core.logger import logger
 from datetime import datetime
 
@@ -30,6 +30,16 @@ LOCAL_DIR = os.path.join(ROOT, "data", "generados")
 MEDICOS_DIR = os.path.join(ROOT, "data", "medicos_validos")
 PACIENTES_DIR = os.path.join(ROOT, "data", "pacientes_validos")
 
+# Procesos para la etapa CPU de las recetas (XSD, checksum, PDF).
+# 0 o 1 = modo secuencial; las escrituras a BD siempre se hacen en el proceso principal.
+RECEIVER_WORKERS = int(os.getenv("RECEIVER_WORKERS", "0"))
+_pool = None
+
+RECEIVER_BATCH_SIZE = int(os.getenv("RECEIVER_BATCH_SIZE", "100"))
+RECEIVER_INTERVAL = int(os.getenv("RECEIVER_INTERVAL_SECONDS", "10"))  # segundos
+# "auto" (inotify o sondeo por mtime), "inotify", "stat" o "poll" (sleep fijo + glob)
+WATCH_MODE = os.getenv("JOBS_WATCH_MODE", "auto").lower()
+
 os.makedirs(MEDICOS_DIR, exist_ok=True)
 os.makedirs(PACIENTES_DIR, exist_ok=True)
 
@@ -50,165 +60,210 @@ def move_file(src: str, dest: str) -> bool:
         logger.error(f"[MOVE] Error: {e}")
         return False
 
-def process_receta_xml(xml_path: str, origen: str) -> dict:
-    """Procesa receta XML completa: validación → PDF → BD → envío correo."""
+def preparar_receta_xml(xml_path: str) -> dict:
+    """
+    Etapa CPU de una receta: parseo → XSD → checksum → extracción → PDF protegido.
+
+    No toca la BD ni mueve el XML, por lo que puede ejecutarse en un proceso
+    del pool. El PDF se escribe en una ruta temporal ("pdf_tmp_path"): aún no
+    se sabe si la receta es un duplicado, y un duplicado no debe sobrescribir
+    el PDF (ni la contraseña) de la receta ya guardada.
+    Devuelve un dict serializable que consume aplicar_receta_xml().
+    Si falla, el dict incluye "error_suffix" con el sufijo del archivo de error.
+    """
     filename = os.path.basename(xml_path)
-    logger.info(f"[PROCESS] Inicio ({origen}): {xml_path}")
 
+    # 0️⃣ Parsear UNA sola vez (XSD, checksum y extracción usan el mismo árbol)
     try:
-        # 1️⃣ Validar XSD
-        valid, errors = validate_xml_against_xsd(xml_path, "receta.xsd")
-        if not valid:
-            logger.error(f"[XSD] INVALID: {filename}")
-            error_path = os.path.join(ERRORES_DIR, f"{filename}.xsd_error")
-            move_file(xml_path, error_path)
-            return {"ok": False, "file": filename, "error": f"XSD: {errors}"}
+        doc = XmlDocument.from_path(xml_path)
+    except etree.XMLSyntaxError as e:
+        logger.error(f"[XSD] Error de sintaxis XML: {filename} - {e}")
+        return {"ok": False, "file": filename, "error_suffix": "xsd_error",
+                "error": f"XSD: Error de sintaxis XML: {e}"}
+
+    # 1️⃣ Validar XSD
+    valid, errors = doc.validate("receta.xsd")
+    if not valid:
+        logger.error(f"[XSD] INVALID: {filename}")
+        return {"ok": False, "file": filename, "error_suffix": "xsd_error", "error": f"XSD: {errors}"}
+
+    # 2️⃣ Validar CHECKSUM
+    if not doc.validar_checksum():
+        logger.error(f"[CHECKSUM] INVALID: {filename}")
+        return {"ok": False, "file": filename, "error_suffix": "checksum_error", "error": "Checksum inválido"}
+
+    # 3️⃣ Extraer datos
+    try:
+        receta_data = doc.datos_receta()
+    except Exception as e:
+        logger.error(f"[PARSE] Error: {e}")
+        return {"ok": False, "file": filename, "error_suffix": "parse_error", "error": f"Parse: {str(e)}"}
 
-        # 2️⃣ Validar CHECKSUM
-        if not validar_checksum(xml_path):
-            logger.error(f"[CHECKSUM] INVALID: {filename}")
-            error_path = os.path.join(ERRORES_DIR, f"{filename}.checksum_error")
-            move_file(xml_path, error_path)
-            return {"ok": False, "file": filename, "error": "Checksum inválido"}
-        # 2️⃣ Parsear XML
-        try:
-            receta_data = parse_receta_xml(xml_path)
-        except Exception as e:
-            logger.error(f"[PARSE] Error: {e}")
-            error_path = os.path.join(ERRORES_DIR, f"{filename}.parse_error")
-            move_file(xml_path, error_path)
-            return {"ok": False, "file": filename, "error": f"Parse: {str(e)}"}
+    # 4️⃣ Generar PDF protegido (render y cifrado en un solo paso, un solo archivo)
+    pdf_filename = f"receta_{receta_data.get('id_receta')}.pdf"
+    pdf_path = os.path.join(PDFS_DIR, pdf_filename)
+    pdf_tmp_path = f"{pdf_path}.{secrets.token_hex(4)}.pendiente"
+    contrasena_pdf = secrets.token_urlsafe(12)
 
-        # 3️⃣ Obtener datos adicionales desde BD Web
-        web_db = SessionLocal()
+    try:
+        logger.info(f"[PDF] Generando: {pdf_path}")
+        generate_receta_pdf(receta_data, pdf_tmp_path, contrasena=contrasena_pdf)
+    except Exception as e:
+        logger.warning(f"[PDF] ⚠️ Error generando PDF: {e}")
+        pdf_path = pdf_tmp_path = None
+        contrasena_pdf = None
+
+    return {"ok": True, "file": filename, "receta_data": receta_data, "pdf_path": pdf_path,
+            "pdf_tmp_path": pdf_tmp_path, "pdf_password": contrasena_pdf}
+
+
+def _descartar_pdf(pdf_tmp_path: str):
+    """Borra un PDF temporal que no llegó a usarse (duplicado o error de BD)."""
+    if pdf_tmp_path:
         try:
-            paciente = web_db.query(PacienteWeb).filter(
-                PacienteWeb.id == receta_data.get('paciente_id')
-            ).first()
+            os.remove(pdf_tmp_path)
+        except OSError as e:
+            logger.warning(f"[PDF] No se pudo borrar {pdf_tmp_path}: {e}")
 
-            medico = web_db.query(MedicoWeb).filter(
-                MedicoWeb.id == receta_data.get('medico_id')
-            ).first()
 
-            email_paciente = paciente.correo if paciente else None
+def aplicar_receta_xml(xml_path: str, preparado: dict, origen: str) -> dict:
+    """
+    Etapa de escritura de una receta: mueve el XML y guarda en BD Local y Web.
 
-        finally:
-            web_db.close()
+    Es la única etapa que escribe en las BDs; en modo concurrente se ejecuta
+    siempre en el proceso principal (un solo escritor).
+    """
+    filename = os.path.basename(xml_path)
 
-        # 4️⃣ Generar PDF
-        pdf_filename = f"receta_{receta_data.get('id_receta')}.pdf"
-        pdf_path = os.path.join(PDFS_DIR, pdf_filename)
+    if not preparado.get("ok"):
+        error_path = os.path.join(ERRORES_DIR, f"{filename}.{preparado['error_suffix']}")
+        move_file(xml_path, error_path)
+        return {"ok": False, "file": filename, "error": preparado.get("error")}
 
-        try:
-            logger.info(f"[PDF] Generando: {pdf_path}")
-            generate_receta_pdf(receta_data, pdf_path)
-        except Exception as e:
-            logger.warning(f"[PDF] ⚠️ Error generando PDF: {e}")
-            pdf_path = None
+    receta_data = preparado["receta_data"]
+    pdf_path = preparado.get("pdf_path")
+    pdf_tmp_path = preparado.get("pdf_tmp_path")
+    pdf_password = preparado.get("pdf_password")
 
-        # 5️⃣ Proteger PDF
-        contrasena_pdf = None
-        if pdf_path and os.path.exists(pdf_path):
+    # 6️⃣ Mover XML a procesados
+    success_path = os.path.join(PROCESADOS_DIR, f"{filename}.ok")
+    move_file(xml_path, success_path)
+
+    # 7️⃣ Guardar en BD Local
+    local_db = LocalSessionLocal()
+    try:
+        # Parsear fecha
+        fecha_emision_str = receta_data.get('fecha_emision')
+        fecha_emision_dt = None
+        if fecha_emision_str:
             try:
-                contrasena_pdf = secrets.token_urlsafe(12)
-                pdf_path = proteger_pdf_con_contrasena(pdf_path, contrasena_pdf)
-                logger.info(f"[PDF PROTECT] PDF protegido correctamente")
-            except Exception as e:
-                logger.warning(f"[PDF PROTECT] ⚠️ Error: {e}")
+                fecha_emision_dt = datetime.fromisoformat(fecha_emision_str)
+            except:
+                logger.warning(f"[DATE] Fecha inválida: {fecha_emision_str}")
+
+        # Verificar si ya existe en BD local
+        existe = local_db.query(RecetaLocal).filter(
+            RecetaLocal.id_receta == receta_data.get('id_receta')
+        ).first()
+
+        if existe:
+            logger.warning(
+                f"[DB LOCAL] Receta DUPLICADA ignorada: {receta_data.get('id_receta')}"
+            )
+            # El PDF de la receta existente (y su contraseña) no se tocan
+            _descartar_pdf(pdf_tmp_path)
+            return {
+                "ok": True,
+                "file": filename,
+                "id_receta": receta_data.get('id_receta'),
+                "duplicado": True,
+                "origen": origen
+            }
+
+        # Crear registro nuevo
+        receta_local = RecetaLocal(
+            id_receta=receta_data.get('id_receta'),
+            paciente_id=receta_data.get('paciente_id'),
+            medico_id=receta_data.get('medico_id'),
+            diagnostico=receta_data.get('diagnostico'),
+            indicaciones=receta_data.get('indicaciones'),
+            xml_path=success_path,
+            pdf_path=pdf_path,
+            pdf_password=pdf_password,
+            checksum=receta_data.get('checksum'),
+            fecha_emision=fecha_emision_dt,
+            origen=origen
+        )
+
+        local_db.add(receta_local)
+        local_db.commit()
+        logger.info(f"[DB LOCAL] Receta guardada correctamente")
+
+        # Solo ahora (fila insertada, contraseña guardada) el PDF pasa a su ruta definitiva
+        if pdf_tmp_path:
+            try:
+                os.replace(pdf_tmp_path, pdf_path)
+            except OSError as e:
+                logger.error(f"[PDF] No se pudo mover {pdf_tmp_path} -> {pdf_path}: {e}")
+                _descartar_pdf(pdf_tmp_path)
+                pdf_path = pdf_password = None
+                receta_local.pdf_path = receta_local.pdf_password = None
+                local_db.commit()
 
-        # 6️⃣ Mover XML a procesados
-        success_path = os.path.join(PROCESADOS_DIR, f"{filename}.ok")
-        move_file(xml_path, success_path)
+    except Exception as e:
+        local_db.rollback()
+        _descartar_pdf(pdf_tmp_path)
+        logger.error(f"[DB LOCAL] Error: {e}")
+        error_path = os.path.join(ERRORES_DIR, f"{filename}.db_error")
+        move_file(xml_path, error_path)
+        return {"ok": False, "file": filename, "error": f"DB: {str(e)}"}
 
-        # 7️⃣ Guardar en BD Local
-        local_db = LocalSessionLocal()
-        try:
-            # Parsear fecha
-            fecha_emision_str = receta_data.get('fecha_emision')
-            fecha_emision_dt = None
-            if fecha_emision_str:
-                try:
-                    fecha_emision_dt = datetime.fromisoformat(fecha_emision_str)
-                except:
-                    logger.warning(f"[DATE] Fecha inválida: {fecha_emision_str}")
-
-            # Verificar si ya existe en BD local
-            existe = local_db.query(RecetaLocal).filter(
-                RecetaLocal.id_receta == receta_data.get('id_receta')
-            ).first()
-
-            if existe:
-                logger.warning(
-                    f"[DB LOCAL] Receta DUPLICADA ignorada: {receta_data.get('id_receta')}"
-                )
-                return {
-                    "ok": True,
-                    "file": filename,
-                    "id_receta": receta_data.get('id_receta'),
-                    "duplicado": True,
-                    "origen": origen
-                }
-
-            # Crear registro nuevo
-            receta_local = RecetaLocal(
-                id_receta=receta_data.get('id_receta'),
-                paciente_id=receta_data.get('paciente_id'),
-                medico_id=receta_data.get('medico_id'),
-                diagnostico=receta_data.get('diagnostico'),
-                indicaciones=receta_data.get('indicaciones'),
-                xml_path=success_path,
-                pdf_path=pdf_path,
-                checksum=receta_data.get('checksum'),
-                fecha_emision=fecha_emision_dt,
-                origen=origen
-            )
+    finally:
+        local_db.close()
 
-            local_db.add(receta_local)
-            local_db.commit()
-            logger.info(f"[DB LOCAL] Receta guardada correctamente")
+    # 8️⃣ Guardar en BD Web (no importa duplicados)
+    try:
+        web_db = SessionLocal()
+        receta_web = RecetaWeb(
+            id_receta=receta_data.get('id_receta'),
+            paciente_id=receta_data.get('paciente_id'),
+            medico_id=receta_data.get('medico_id'),
+            diagnostico=receta_data.get('diagnostico'),
+            indicaciones=receta_data.get('indicaciones'),
+            xml_path=xml_path,
+            pdf_path=pdf_path,
+            pdf_password=pdf_password,
+            checksum=receta_data.get('checksum'),
+            fecha_emision=fecha_emision_dt,
+            origen=origen
+        )
+        web_db.add(receta_web)
+        web_db.commit()
 
-        except Exception as e:
-            local_db.rollback()
-            logger.error(f"[DB LOCAL] Error: {e}")
-            error_path = os.path.join(ERRORES_DIR, f"{filename}.db_error")
-            move_file(xml_path, error_path)
-            return {"ok": False, "file": filename, "error": f"DB: {str(e)}"}
+    except Exception as e:
+        web_db.rollback()
+        logger.warning(f"[DB WEB] Warning insertando receta: {e}")
 
-        finally:
-            local_db.close()
+    finally:
+        web_db.close()
 
-        # 8️⃣ Guardar en BD Web (no importa duplicados)
-        try:
-            web_db = SessionLocal()
-            receta_web = RecetaWeb(
-                id_receta=receta_data.get('id_receta'),
-                paciente_id=receta_data.get('paciente_id'),
-                medico_id=receta_data.get('medico_id'),
-                diagnostico=receta_data.get('diagnostico'),
-                indicaciones=receta_data.get('indicaciones'),
-                xml_path=xml_path,
-                pdf_path=pdf_path,
-                checksum=receta_data.get('checksum'),
-                fecha_emision=fecha_emision_dt,
-                origen=origen
-            )
-            web_db.add(receta_web)
-            web_db.commit()
+    return {
+        "ok": True,
+        "file": filename,
+        "id_receta": receta_data.get('id_receta'),
+        "pdf_protegido": pdf_path is not None,
+        "origen": origen
+    }
 
-        except Exception as e:
-            web_db.rollback()
-            logger.warning(f"[DB WEB] Warning insertando receta: {e}")
 
-        finally:
-            web_db.close()
+def process_receta_xml(xml_path: str, origen: str) -> dict:
+    """Procesa receta XML completa: validación → PDF → BD → envío correo."""
+    filename = os.path.basename(xml_path)
+    logger.info(f"[PROCESS] Inicio ({origen}): {xml_path}")
 
-        return {
-            "ok": True,
-            "file": filename,
-            "id_receta": receta_data.get('id_receta'),
-            "pdf_protegido": pdf_path is not None,
-            "origen": origen
-        }
+    try:
+        preparado = preparar_receta_xml(xml_path)
+        return aplicar_receta_xml(xml_path, preparado, origen)
 
     except Exception as e:
         logger.error(f"[PROCESS] Error general: {e}", exc_info=True)
@@ -216,71 +271,199 @@ def process_receta_xml(xml_path: str, origen: str) -> dict:
         move_file(xml_path, error_path)
         return {"ok": False, "file": filename, "error": str(e)}
 
-def check_inbox():
-    """Descarga desde Drive y luego procesa XMLs."""
 
-    # 1. Descargar nuevos archivos
-    nuevos = sync_drive_to_local()
-    if nuevos > 0:
-        logger.info(f"[INBOX] 🚀 Descargados desde Drive: {nuevos}")
-    else:
-        logger.info(f"[INBOX] No hay nuevos archivos en Drive")
+def _get_pool():
+    """Pool de procesos del receiver (se crea una vez y se reutiliza entre ciclos)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RECEIVER_WORKERS)
+        logger.info(f"[INBOX] Pool de {RECEIVER_WORKERS} procesos iniciado")
+    return _pool
 
-    # 2. Procesar XML locales
-    xml_files = glob.glob(os.path.join(INBOX_DIR, "*.xml"))
 
-    if not xml_files:
-        logger.debug("[INBOX] Sin archivos por procesar")
-        return
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+def _process_recetas_concurrente(recetas: list, origen: str) -> dict:
+    """
+    Prepara las recetas en el pool (XSD, checksum, PDF) y las aplica
+    en este proceso a medida que terminan: un único escritor de BD.
+    """
+    pool = _get_pool()
+    futures = {pool.submit(preparar_receta_xml, path): path for path in recetas}
+    resultados = {}
 
+    for future in as_completed(futures):
+        xml_path = futures[future]
+        filename = os.path.basename(xml_path)
+        try:
+            preparado = future.result()
+            resultados[xml_path] = aplicar_receta_xml(xml_path, preparado, origen)
+        except Exception as e:
+            logger.error(f"[PROCESS] Error general: {e}", exc_info=True)
+            move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.error"))
+            resultados[xml_path] = {"ok": False, "file": filename, "error": str(e)}
+
+    return resultados
+
+
+def procesar_archivos(xml_files: list) -> dict:
+    """
+    Procesa un lote de XML del inbox respetando el orden médicos → pacientes → recetas.
+    Devuelve {ruta: resultado} para cada archivo reconocido.
+    """
     logger.info(f"[INBOX] Procesando {len(xml_files)} archivos...")
 
-    for xml_path in xml_files:
+    # 🩵 Orden correcto: médicos y pacientes ANTES que las recetas que los referencian
+    medicos, pacientes, recetas = [], [], []
+    for xml_path in sorted(xml_files):
         fname = os.path.basename(xml_path)
-
-        # 🩵 Orden correcto:
         if fname.startswith("medico_"):
-            process_medico_xml(xml_path, origen="drive")
-
+            medicos.append(xml_path)
         elif fname.startswith("paciente_"):
-            process_paciente_xml(xml_path, origen="drive")
-
+            pacientes.append(xml_path)
         elif fname.startswith("receta_"):
-            process_receta_xml(xml_path, origen="drive")
-
+            recetas.append(xml_path)
         else:
             logger.warning(f"[INBOX] Archivo desconocido ignorado: {fname}")
 
-        
+    resultados = {}
+    for xml_path in medicos:
+        resultados[xml_path] = process_medico_xml(xml_path, origen="drive")
+
+    for xml_path in pacientes:
+        resultados[xml_path] = process_paciente_xml(xml_path, origen="drive")
+
+    if RECEIVER_WORKERS > 1 and len(recetas) > 1:
+        resultados.update(_process_recetas_concurrente(recetas, origen="drive"))
+    else:
+        for xml_path in recetas:
+            resultados[xml_path] = process_receta_xml(xml_path, origen="drive")
+
+    return resultados
+
+
+def procesar_cola(limite: int = RECEIVER_BATCH_SIZE) -> int:
+    """
+    Reclama trabajos de la cola "receiver" por lotes y los procesa.
+    Con varios workers, cada archivo lo procesa solo quien lo reclamó.
+    Devuelve el número de trabajos atendidos.
+    """
+    atendidos = 0
+    while True:
+        trabajos = job_queue.reclamar("receiver", limite)
+        if not trabajos:
+            return atendidos
+
+        presentes = []
+        for trabajo in trabajos:
+            if os.path.exists(trabajo.archivo):
+                presentes.append(trabajo.archivo)
+            else:
+                job_queue.fallar(trabajo.id, "Archivo no encontrado en drive_inbox")
+
+        resultados = procesar_archivos(presentes) if presentes else {}
+
+        for trabajo in trabajos:
+            if trabajo.archivo not in resultados:
+                continue
+            resultado = resultados[trabajo.archivo] or {}
+            if resultado.get("ok"):
+                job_queue.completar(trabajo.id)
+            else:
+                job_queue.fallar(trabajo.id, str(resultado.get("error", "Error desconocido")))
+        atendidos += len(trabajos)
+
+
+def _sync_drive():
+    nuevos = sync_drive_to_local()
+    if nuevos > 0:
+        logger.info(f"[INBOX] 🚀 Descargados desde Drive: {nuevos}")
+    else:
+        logger.info(f"[INBOX] No hay nuevos archivos en Drive")
+    return nuevos
+
+
+def check_inbox():
+    """Descarga desde Drive y luego procesa XMLs."""
+
+    # 1. Descargar nuevos archivos
+    _sync_drive()
+
+    # 2. Encolar y procesar XML locales
+    xml_files = glob.glob(os.path.join(INBOX_DIR, "*.xml"))
+    job_queue.encolar("receiver", xml_files)
+
+    if procesar_cola() == 0:
+        logger.debug("[INBOX] Sin archivos por procesar")
+
 
 def job_receiver():
     """JOB que corre continuamente."""
     logger.info("[JOB RECEIVER] Iniciado")
-    
+
+    if WATCH_MODE == "poll":
+        while True:
+            try:
+                check_inbox()
+            except Exception as e:
+                logger.error(f"[JOB] Error: {e}", exc_info=True)
+
+            time.sleep(RECEIVER_INTERVAL)
+
+    # Modo por eventos: los archivos locales (incluidos los que descarga
+    # la sincronización con Drive) se procesan en cuanto aparecen; Drive se
+    # consulta cada RECEIVER_INTERVAL, llegue o no actividad local.
+    watcher = InboxWatcher(INBOX_DIR, suffix=".xml", mode=WATCH_MODE)
+    ultima_sync = time.monotonic()
+    try:
+        check_inbox()
+    except Exception as e:
+        logger.error(f"[JOB] Error: {e}", exc_info=True)
+
     while True:
         try:
-            check_inbox()
+            restante = RECEIVER_INTERVAL - (time.monotonic() - ultima_sync)
+            nuevos = watcher.wait(max(restante, 0))
+            if nuevos:
+                job_queue.encolar("receiver", nuevos)
+            if time.monotonic() - ultima_sync >= RECEIVER_INTERVAL:
+                # Se anota antes de sincronizar: si Drive falla no se reintenta en bucle
+                ultima_sync = time.monotonic()
+                _sync_drive()
+            # También atiende reintentos y leases vencidos de otros workers
+            procesar_cola()
         except Exception as e:
             logger.error(f"[JOB] Error: {e}", exc_info=True)
-        
-        time.sleep(10)
-def process_medico_xml(xml_path: str, origen: str):
+            time.sleep(1)
+
+
+def process_medico_xml(xml_path: str, origen: str) -> dict:
     filename = os.path.basename(xml_path)
     logger.info(f"[MEDICO] Procesando {filename} ({origen})")
 
     try:
-        valid, errors = validate_xml_against_xsd(xml_path, "medico.xsd")
+        try:
+            doc = XmlDocument.from_path(xml_path)
+        except etree.XMLSyntaxError as e:
+            logger.error(f"[MEDICO XSD] Error de sintaxis XML: {filename} - {e}")
+            move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.xsd_error"))
+            return {"ok": False, "file": filename, "error": f"XSD: Error de sintaxis XML: {e}"}
+
+        valid, errors = doc.validate("medico.xsd")
         if not valid:
             logger.error(f"[MEDICO XSD] INVALID: {filename}")
             move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.xsd_error"))
-            return
-# Añadir aquí:
-        if not validar_checksum(xml_path):
+            return {"ok": False, "file": filename, "error": f"XSD: {errors}"}
+        if not doc.validar_checksum():
             logger.error(f"[MEDICO CHECKSUM] INVALID: {filename}")
             move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.checksum_error"))
-            return
-        tree = etree.parse(xml_path)
-        root = tree.getroot()
+            return {"ok": False, "file": filename, "error": "Checksum inválido"}
+        root = doc.root
 
         mid = root.findtext("id")
         nombre = root.findtext("nombre")
@@ -314,25 +497,33 @@ def process_medico_xml(xml_path: str, origen: str):
             db.close()
 
         move_file(xml_path, os.path.join(MEDICOS_DIR, f"{filename}.ok"))
+        return {"ok": True, "file": filename}
 
     except Exception as e:
         logger.error(f"[MEDICO] Error general: {e}", exc_info=True)
-def process_paciente_xml(xml_path: str, origen: str):
+        return {"ok": False, "file": filename, "error": str(e)}
+def process_paciente_xml(xml_path: str, origen: str) -> dict:
     filename = os.path.basename(xml_path)
     logger.info(f"[PACIENTE] Procesando {filename} ({origen})")
 
     try:
-        valid, errors = validate_xml_against_xsd(xml_path, "paciente.xsd")
+        try:
+            doc = XmlDocument.from_path(xml_path)
+        except etree.XMLSyntaxError as e:
+            logger.error(f"[PACIENTE XSD] Error de sintaxis XML: {filename} - {e}")
+            move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.xsd_error"))
+            return {"ok": False, "file": filename, "error": f"XSD: Error de sintaxis XML: {e}"}
+
+        valid, errors = doc.validate("paciente.xsd")
         if not valid:
             logger.error(f"[PACIENTE XSD] INVALID: {filename}")
             move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.xsd_error"))
-            return
-        if not validar_checksum(xml_path):
+            return {"ok": False, "file": filename, "error": f"XSD: {errors}"}
+        if not doc.validar_checksum():
             logger.error(f"[PACIENTE CHECKSUM] INVALID: {filename}")
             move_file(xml_path, os.path.join(ERRORES_DIR, f"{filename}.checksum_error"))
-            return
-        tree = etree.parse(xml_path)
-        root = tree.getroot()
+            return {"ok": False, "file": filename, "error": "Checksum inválido"}
+        root = doc.root
 
         pid = root.findtext("id")
         nombre = root.findtext("nombre")
@@ -375,9 +566,11 @@ def process_paciente_xml(xml_path: str, origen: str):
             db.close()
 
         move_file(xml_path, os.path.join(PACIENTES_DIR, f"{filename}.ok"))
+        return {"ok": True, "file": filename}
 
     except Exception as e:
         logger.error(f"[PACIENTE] Error general: {e}", exc_info=True)
+        return {"ok": False, "file": filename, "error": str(e)}
 
 if __name__ == "__main__":
     job_receiver()
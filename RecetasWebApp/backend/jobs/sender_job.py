@@ -2,60 +2,157 @@ import os
 import time
 import shutil
 from core.logger import logger
-from services.drive_service import upload_xml_bytes
+from services.drive_service import upload_xml_bytes_batch, FOLDER_OUTBOX_ID
+from jobs.inbox_watcher import InboxWatcher
+from services import job_queue
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 OUTBOX = os.path.join(ROOT, "data", "drive_outbox")
 PROCESADOS_OUTBOX = os.path.join(ROOT, "data", "procesados_outbox")
+ERRORES_OUTBOX = os.path.join(ROOT, "data", "errores_outbox")
 
 INTERVALO = int(os.getenv("SENDER_INTERVAL_SECONDS", "10"))  # segundos
+# "auto" (inotify o sondeo por mtime), "inotify", "stat" o "poll" (sleep fijo + listdir)
+WATCH_MODE = os.getenv("JOBS_WATCH_MODE", "auto").lower()
+SENDER_BATCH_SIZE = int(os.getenv("SENDER_BATCH_SIZE", "50"))
+EXPORT_SCAN_SECONDS = int(os.getenv("EXPORT_SCAN_SECONDS", "300"))
+_ultimo_scan_export = float("-inf")
 
 os.makedirs(OUTBOX, exist_ok=True)
 os.makedirs(PROCESADOS_OUTBOX, exist_ok=True)
 
+def enviar_archivos(paths) -> dict:
+    """
+    Sube a Drive los XML indicados (rutas completas) y los mueve a procesados_outbox/.
+    Las subidas del lote se hacen en paralelo (upload_xml_bytes_batch).
+    Devuelve {ruta: None si se envió, excepción si falló}. Los fallidos se quedan
+    donde están: procesar_cola() decide si se reintentan o van a dead letter.
+    """
+    resultados = {}
+    items = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                items.append((path, f.read()))
+        except Exception as e:
+            logger.error(f"Error procesando {os.path.basename(path)}: {e}")
+            resultados[path] = e
+
+    # Subir a Drive (simulado o real)
+    subidas = upload_xml_bytes_batch(
+        [(os.path.basename(path), xml_bytes) for path, xml_bytes in items], FOLDER_OUTBOX_ID
+    )
+
+    for (path, _), res in zip(items, subidas):
+        xml_file = os.path.basename(path)
+        try:
+            if isinstance(res, Exception):
+                raise res
+            logger.info(f"XML {xml_file} enviado -> {res}")
+
+            # Mover a carpeta de procesados
+            dest = os.path.join(PROCESADOS_OUTBOX, xml_file)
+            shutil.move(path, dest)
+            logger.info(f"Archivo {xml_file} movido a procesados_outbox/")
+            resultados[path] = None
+
+        except Exception as e:
+            logger.error(f"Error procesando {xml_file}: {e}")
+            resultados[path] = e
+
+    return resultados
+
+def _mover_a_errores(path: str) -> str:
+    os.makedirs(ERRORES_OUTBOX, exist_ok=True)
+    dest = os.path.join(ERRORES_OUTBOX, os.path.basename(path))
+    if os.path.abspath(path) == os.path.abspath(dest):
+        return dest
+    try:
+        shutil.move(path, dest)
+    except Exception:
+        return path
+    return dest
+
+def procesar_cola(limite: int = SENDER_BATCH_SIZE) -> int:
+    """
+    Reclama trabajos de la cola "sender" por lotes y los sube a Drive.
+    Los errores transitorios se reprograman con backoff exponencial; los
+    permanentes (o tras agotar DRIVE_RETRY_MAX_ATTEMPTS) van a dead letter
+    y su archivo a errores_outbox/.
+    """
+    atendidos = 0
+    while True:
+        trabajos = job_queue.reclamar("sender", limite)
+        if not trabajos:
+            return atendidos
+
+        resultados = enviar_archivos([t.archivo for t in trabajos])
+        for trabajo in trabajos:
+            error = resultados.get(trabajo.archivo)
+            if error is None:
+                job_queue.completar(trabajo.id)
+            elif job_queue.programar_reintento(trabajo, error) == "dead_letter":
+                job_queue.enviar_a_dead_letter(trabajo.id, str(error), archivo=_mover_a_errores(trabajo.archivo))
+        atendidos += len(trabajos)
+
+def revisar_outbox():
+    """Lista drive_outbox/ completo, encola lo pendiente y lo envía."""
+    if not os.path.exists(OUTBOX):
+        logger.warning(f"Carpeta {OUTBOX} no existe")
+        return
+
+    archivos = [f for f in os.listdir(OUTBOX) if f.lower().endswith(".xml")]
+
+    if not archivos:
+        logger.debug("No hay archivos XML en drive_outbox/")
+    else:
+        logger.info(f"Encontrados {len(archivos)} archivo(s) XML para enviar")
+
+    job_queue.encolar("sender", [os.path.join(OUTBOX, f) for f in archivos])
+    procesar_cola()
+
+def reintentar_exportaciones():
+    """
+    Reintentos automáticos de /recetas/reintentar: cada EXPORT_SCAN_SECONDS
+    encola las recetas no enviadas y, en cada ciclo, sube las que ya toca reintentar.
+    """
+    global _ultimo_scan_export
+    from scripts.export_recetas import export_pending, procesar_cola_export
+
+    if time.monotonic() - _ultimo_scan_export >= EXPORT_SCAN_SECONDS:
+        _ultimo_scan_export = time.monotonic()
+        export_pending()
+    else:
+        procesar_cola_export()
+
 def job_sender():
     logger.info("JOB SENDER iniciado - Monitoreando carpeta drive_outbox/")
-    
+
+    if WATCH_MODE == "poll":
+        while True:
+            try:
+                revisar_outbox()
+                reintentar_exportaciones()
+            except Exception as e:
+                logger.error(f"Error en job_sender: {e}")
+
+            time.sleep(INTERVALO)
+
+    # Modo por eventos: un listado inicial y después solo los archivos nuevos
+    watcher = InboxWatcher(OUTBOX, suffix=".xml", mode=WATCH_MODE)
+    try:
+        revisar_outbox()
+    except Exception as e:
+        logger.error(f"Error en job_sender: {e}")
+
     while True:
         try:
-            if not os.path.exists(OUTBOX):
-                logger.warning(f"Carpeta {OUTBOX} no existe")
-                time.sleep(INTERVALO)
-                continue
-                
-            archivos = [f for f in os.listdir(OUTBOX) if f.lower().endswith(".xml")]
-            
-            if not archivos:
-                logger.debug("No hay archivos XML en drive_outbox/")
-            else:
-                logger.info(f"Encontrados {len(archivos)} archivo(s) XML para enviar")
-
-            for xml_file in archivos:
-                path = os.path.join(OUTBOX, xml_file)
-                try:
-                    with open(path, "rb") as f:
-                        xml_bytes = f.read()
-                    
-                    # Subir a Drive (simulado o real)
-                    res = upload_xml_bytes(xml_file, xml_bytes)
-                    logger.info(f"XML {xml_file} enviado -> {res}")
-                    
-                    # Mover a carpeta de procesados
-                    dest = os.path.join(PROCESADOS_OUTBOX, xml_file)
-                    shutil.move(path, dest)
-                    logger.info(f"Archivo {xml_file} movido a procesados_outbox/")
-                    
-                except Exception as e:
-                    logger.error(f"Error procesando {xml_file}: {e}")
-                    # Mover a errores si falla
-                    errores_dir = os.path.join(ROOT, "data", "errores_outbox")
-                    os.makedirs(errores_dir, exist_ok=True)
-                    try:
-                        shutil.move(path, os.path.join(errores_dir, xml_file))
-                    except:
-                        pass
-                        
+            nuevos = watcher.wait(INTERVALO)
+            if nuevos:
+                logger.info(f"Detectados {len(nuevos)} archivo(s) XML nuevos para enviar")
+                job_queue.encolar("sender", nuevos)
+            procesar_cola()
+            reintentar_exportaciones()
         except Exception as e:
             logger.error(f"Error en job_sender: {e}")
-        
-        time.sleep(INTERVALO)
+            time.sleep(1)
@@ -0,0 +1,131 @@
+# backend/scripts/bench_pdf.py
+"""
+Benchmark de generación de PDFs de receta (PDFs por segundo).
+
+  antes:       generate_receta_pdf anterior (copiado abajo tal cual: estilos
+               en cada llamada, sin lista de medicamentos)
+  sin caché:   RecetaPdfRenderer nuevo en cada PDF
+  después:     un RecetaPdfRenderer reutilizado (estilos y elementos fijos una vez)
+
+Los PDFs se generan en memoria para medir solo CPU, no disco.
+Ejecutar desde el directorio backend con el venv activado:
+  python scripts/bench_pdf.py [-n 300] [--medicamentos 5]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+# Agregar el directorio backend al path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, backend_dir)
+
+from datetime import datetime
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from services.pdf_generator import RecetaPdfRenderer
+
+
+def pdf_anterior(receta_data: dict, destino):
+    """Cuerpo de generate_receta_pdf antes de RecetaPdfRenderer (referencia del benchmark)."""
+    doc = SimpleDocTemplate(destino, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24,
+                                 textColor=colors.HexColor('#1f4788'), spaceAfter=30, alignment=1)
+    story.append(Paragraph("RECETA MÉDICA", title_style))
+    story.append(Spacer(1, 0.3*inch))
+    info_data = [
+        ["ID RECETA:", receta_data.get('id_receta', 'N/A')],
+        ["FECHA EMISIÓN:", receta_data.get('fecha_emision', datetime.utcnow().isoformat())],
+        ["PACIENTE ID:", receta_data.get('paciente_id', 'N/A')],
+        ["MÉDICO ID:", receta_data.get('medico_id', 'N/A')],
+    ]
+    info_table = Table(info_data, colWidths=[2*inch, 3.5*inch])
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8e8e8')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    story.append(info_table)
+    story.append(Spacer(1, 0.4*inch))
+    story.append(Paragraph("<b>DIAGNÓSTICO:</b>", styles['Heading2']))
+    story.append(Paragraph(receta_data.get('diagnostico', 'No especificado'), styles['Normal']))
+    story.append(Spacer(1, 0.3*inch))
+    story.append(Paragraph("<b>INDICACIONES/MEDICAMENTOS:</b>", styles['Heading2']))
+    story.append(Paragraph(receta_data.get('indicaciones', 'No especificadas'), styles['Normal']))
+    story.append(Spacer(1, 0.5*inch))
+    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=1)
+    story.append(Paragraph(
+        f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}<br/>Checksum: {receta_data.get('checksum', 'N/A')[:16]}...",
+        footer_style
+    ))
+    doc.build(story)
+
+
+def receta_ejemplo(n_medicamentos: int) -> dict:
+    return {
+        "id_receta": "3f1c2a9e-0000-4000-8000-000000000001",
+        "paciente_id": "P-0001",
+        "medico_id": "M-0001",
+        # Sin &/< : la versión anterior los interpretaba como marcado y fallaba
+        "diagnostico": "Faringitis aguda con fiebre de 38.5°C",
+        "indicaciones": "Reposo relativo.\nAbundantes líquidos.",
+        "fecha_emision": "2024-01-02T03:04:05",
+        "checksum": "5b71d0d2b9186e23a0f1692a63f63de87564828a37b57b113e2dcc0d39ba3964",
+        "medicamentos": [
+            {"nombre": f"Medicamento {i}", "dosis": "500 mg", "frecuencia": "Cada 8 horas", "duracion": "7 días"}
+            for i in range(n_medicamentos)
+        ],
+    }
+
+
+def medir(nombre: str, n: int, generar, rondas: int = 3) -> float:
+    generar()  # calentamiento (fuentes, imports perezosos de ReportLab)
+    mejor = 0.0
+    # Mejor de varias rondas: reduce el ruido de otros procesos en la máquina
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(n):
+            generar()
+        mejor = max(mejor, n / (time.perf_counter() - inicio))
+    print(f"{nombre:<10} {mejor:8.1f} PDFs/s")
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=300, help="PDFs por medición")
+    parser.add_argument("--medicamentos", type=int, default=5)
+    args = parser.parse_args()
+
+    datos = receta_ejemplo(args.medicamentos)
+
+    def antes():
+        pdf_anterior(datos, io.BytesIO())
+
+    def sin_cache():
+        RecetaPdfRenderer().render(datos, io.BytesIO())
+
+    renderer = RecetaPdfRenderer()
+
+    def despues():
+        renderer.render(datos, io.BytesIO())
+
+    print(f"{args.n} PDFs, {args.medicamentos} medicamentos por receta")
+    a = medir("antes", args.n, antes)
+    medir("sin caché", args.n, sin_cache)
+    d = medir("después", args.n, despues)
+    print(f"Mejora: x{d / a:.2f} (y ahora el PDF incluye la tabla de medicamentos)")
+
+
+if __name__ == "__main__":
+    main()
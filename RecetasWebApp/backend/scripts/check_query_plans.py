@@ -0,0 +1,130 @@
+# backend/scripts/check_query_plans.py
+"""
+Comprueba con EXPLAIN QUERY PLAN (SQLite) que las consultas calientes de los
+routers y jobs usan índices: ninguna debe recorrer la tabla completa y los
+listados paginados deben salir ya ordenados del índice (sin TEMP B-TREE).
+
+Por defecto crea el esquema en una BD en memoria (no necesita datos):
+  python scripts/check_query_plans.py
+Para revisar las BDs reales (tras migrate_add_indexes.py):
+  python scripts/check_query_plans.py --real
+Sale con código 1 si alguna consulta no usa índices.
+"""
+import os
+import re
+import sys
+from datetime import datetime
+
+# Agregar el directorio backend al path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import create_engine, select, func, and_, or_
+from database.base import Base, engine, local_engine
+from database.web_models import RecetaWeb, MedicamentoWeb
+from database.local_models import RecetaLocal, MedicamentoLocal
+
+LIMITE = 51
+FECHA = datetime(2024, 1, 1)
+
+
+def _cursor(col_fecha, col_id, valor_id):
+    return or_(col_fecha < FECHA, and_(col_fecha == FECHA, col_id < valor_id))
+
+
+def consultas_web():
+    """(nombre, sentencia, exige_orden_por_indice)"""
+    listado = select(RecetaWeb.id, RecetaWeb.id_receta, RecetaWeb.created_at)
+    orden = (RecetaWeb.created_at.desc(), RecetaWeb.id.desc())
+    return [
+        ("recetas: listado", listado.order_by(*orden).limit(LIMITE), True),
+        ("recetas: listado con cursor",
+         listado.where(_cursor(RecetaWeb.created_at, RecetaWeb.id, 100)).order_by(*orden).limit(LIMITE), True),
+        ("recetas: por médico",
+         listado.where(RecetaWeb.medico_id == "m1").order_by(*orden).limit(LIMITE), True),
+        ("recetas: por paciente",
+         listado.where(RecetaWeb.paciente_id == "p1").order_by(*orden).limit(LIMITE), True),
+        ("recetas: no enviadas",
+         listado.where(RecetaWeb.sent == False).order_by(*orden).limit(LIMITE), True),  # noqa: E712
+        ("export_pending",
+         select(RecetaWeb.id).where(RecetaWeb.xml_path != None, RecetaWeb.sent == False), False),  # noqa: E711,E712
+        ("recetas: por id_receta", select(RecetaWeb.id).where(RecetaWeb.id_receta == "abc"), False),
+        ("medicamentos del listado",
+         select(MedicamentoWeb.receta_id, MedicamentoWeb.nombre)
+         .where(MedicamentoWeb.receta_id.in_([1, 2, 3])).order_by(MedicamentoWeb.id), False),
+    ]
+
+
+def consultas_local():
+    listado = select(RecetaLocal.id_receta, RecetaLocal.created_at)
+    orden = (RecetaLocal.created_at.desc(), RecetaLocal.id_receta.desc())
+    return [
+        ("recetas locales: listado", listado.order_by(*orden).limit(LIMITE), True),
+        ("recetas locales: listado con cursor",
+         listado.where(_cursor(RecetaLocal.created_at, RecetaLocal.id_receta, "x")).order_by(*orden).limit(LIMITE), True),
+        ("recetas locales: por origen",
+         listado.where(RecetaLocal.origen == "drive").order_by(*orden).limit(LIMITE), True),
+        ("recetas locales: por médico",
+         listado.where(RecetaLocal.medico_id == "m1").order_by(*orden).limit(LIMITE), True),
+        ("stats",
+         select(RecetaLocal.origen, func.count(), func.count(RecetaLocal.pdf_path)).group_by(RecetaLocal.origen), True),
+        ("medicamentos locales",
+         select(MedicamentoLocal.nombre).where(MedicamentoLocal.receta_id == "x"), False),
+    ]
+
+
+def _param(v):
+    return v.isoformat(" ") if isinstance(v, datetime) else v
+
+
+def explicar(eng, stmt) -> list:
+    compiled = stmt.compile(dialect=eng.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(_param(compiled.params[k]) for k in compiled.positiontup)
+    with eng.connect() as conn:
+        filas = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return [f[-1] for f in filas]
+
+
+def problemas(plan: list, exige_orden: bool) -> list:
+    errores = []
+    for linea in plan:
+        # "SCAN tabla" sin "USING ... INDEX" = recorrido completo de la tabla
+        if re.match(r"^SCAN \w+$", linea.strip()):
+            errores.append(f"recorrido completo: {linea}")
+        if exige_orden and "TEMP B-TREE" in linea:
+            errores.append(f"ordenación fuera de índice: {linea}")
+    return errores
+
+
+def check(eng, consultas) -> int:
+    fallos = 0
+    for nombre, stmt, exige_orden in consultas:
+        plan = explicar(eng, stmt)
+        errores = problemas(plan, exige_orden)
+        estado = "✗" if errores else "✓"
+        print(f"{estado} {nombre}: {' | '.join(plan)}")
+        for e in errores:
+            print(f"    {e}")
+        fallos += bool(errores)
+    return fallos
+
+
+def main(real: bool = False) -> int:
+    if real:
+        web_eng, local_eng = engine, local_engine
+    else:
+        web_eng = local_eng = create_engine("sqlite://")
+        Base.metadata.create_all(bind=web_eng)
+
+    if web_eng.dialect.name != "sqlite":
+        print("Este chequeo usa EXPLAIN QUERY PLAN de SQLite; en otros motores revisar con EXPLAIN.")
+        return 0
+
+    fallos = check(web_eng, consultas_web()) + check(local_eng, consultas_local())
+    print("=" * 50)
+    print("✅ Todas las consultas usan índices" if not fallos else f"❌ {fallos} consulta(s) sin índice")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(real="--real" in sys.argv))
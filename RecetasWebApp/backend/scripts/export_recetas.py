@@ -3,6 +3,8 @@ import sys
 from database.base import SessionLocal
 from database.web_models import RecetaWeb
 from core.logger import logger
+from services import job_queue
+from services.receta_pipeline import COLA_UPLOAD, id_receta_de_archivo
 
 try:
     from services.drive_service import upload_xml_bytes
@@ -16,39 +18,106 @@ except Exception as e:
 DRIVE_FOLDER = os.getenv("DRIVE_EXPORT_FOLDER_RECETAS_ID", "1hshMryU26Lf2MCCSeF7w1Ws-DQNjZhKL").strip()
 
 
-def try_upload_to_drive(local_path: str, filename: str):
+def subir_a_drive(local_path: str, filename: str):
+    """Sube un XML a la carpeta de recetas en Drive. Lanza la excepción si falla."""
     if not drive_available:
-        logger.error("[DRIVE] Servicio no disponible")
-        return False
+        raise RuntimeError("Servicio de Drive no disponible")
 
     if not DRIVE_FOLDER:
-        logger.error("[DRIVE] DRIVE_EXPORT_FOLDER_RECETAS_ID vacío o no configurado")
-        return False
+        raise RuntimeError("DRIVE_EXPORT_FOLDER_RECETAS_ID vacío o no configurado")
 
     if not os.path.exists(local_path):
-        logger.error(f"[DRIVE] Archivo no existe en disco: {local_path}")
-        return False
+        raise FileNotFoundError(f"Archivo no existe en disco: {local_path}")
 
     logger.info(f"[DRIVE] Intentando subir: {filename} -> carpeta {DRIVE_FOLDER}")
 
+    with open(local_path, "rb") as f:
+        xml_bytes = f.read()
+
     try:
-        with open(local_path, "rb") as f:
-            xml_bytes = f.read()
+        upload_xml_bytes(xml_bytes, filename, DRIVE_FOLDER)
+    except TypeError:
+        upload_xml_bytes(filename, xml_bytes, DRIVE_FOLDER)
 
-        try:
-            upload_xml_bytes(xml_bytes, filename, DRIVE_FOLDER)
-        except TypeError:
-            upload_xml_bytes(filename, xml_bytes, DRIVE_FOLDER)
+    logger.info(f"[DRIVE] Subida exitosa: {filename}")
 
-        logger.info(f"[DRIVE] Subida exitosa: {filename}")
-        return True
 
+def try_upload_to_drive(local_path: str, filename: str):
+    try:
+        subir_a_drive(local_path, filename)
+        return True
     except Exception as e:
         logger.error(f"[DRIVE] Error subiendo {filename}: {e}", exc_info=True)
         return False
 
 
+def _receta_de_archivo(db, archivo: str):
+    """Receta del XML `archivo` (receta_<id_receta>.xml), buscada por id_receta (único e indexado)."""
+    return db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta_de_archivo(archivo)).first()
+
+
+def procesar_cola_export(limite: int = 50) -> dict:
+    """
+    Sube las recetas encoladas en la cola "export" cuyo reintento ya toca.
+    Errores transitorios → backoff exponencial con jitter; permanentes o
+    sin intentos restantes → dead letter (ver /local-admin/cola/dead-letter).
+    """
+    results = []
+    reintentos = 0
+    dead_letters = 0
+    db = SessionLocal()
+    try:
+        while True:
+            trabajos = job_queue.reclamar("export", limite)
+            if not trabajos:
+                break
+
+            for trabajo in trabajos:
+                filename = os.path.basename(trabajo.archivo)
+                receta = _receta_de_archivo(db, trabajo.archivo)
+                if receta is not None and receta.sent:
+                    # Ya marcada como enviada por otra vía: nada que subir
+                    job_queue.completar(trabajo.id)
+                    continue
+                if receta is None:
+                    # Error permanente: sin receta no hay nada que marcar como enviado, y completar
+                    # el trabajo haría que el siguiente escaneo lo reactivara y volviera a subirlo
+                    error = "No hay receta con el id_receta de este XML"
+                    job_queue.enviar_a_dead_letter(trabajo.id, error)
+                    logger.error(f"[COLA export] {filename} → dead letter: {error}")
+                    dead_letters += 1
+                    results.append({"file": filename, "uploaded": False, "ok": False, "error": error})
+                    continue
+
+                try:
+                    subir_a_drive(trabajo.archivo, filename)
+                except Exception as e:
+                    logger.error(f"[DRIVE] Error subiendo {filename}: {e}")
+                    if job_queue.programar_reintento(trabajo, e) == "reintento":
+                        reintentos += 1
+                    else:
+                        dead_letters += 1
+                    results.append({"file": filename, "uploaded": False, "ok": False, "error": str(e)})
+                    continue
+
+                receta.sent = True
+                db.commit()
+                job_queue.completar(trabajo.id)
+                results.append({
+                    "id": receta.id,
+                    "file": filename,
+                    "uploaded": True,
+                    "ok": True
+                })
+
+        return {"results": results, "reintentos_programados": reintentos, "dead_letter": dead_letters}
+
+    finally:
+        db.close()
+
+
 def export_pending():
+    """Encola las recetas no enviadas y sube las que ya pueden intentarse."""
     db = SessionLocal()
     try:
         recetas = db.query(RecetaWeb).filter(
@@ -62,37 +131,31 @@ def export_pending():
             if r.xml_path and os.path.exists(r.xml_path)
         ]
 
+        # Las recetas creadas desde la web las sube la etapa receta_upload del pipeline
+        # (con sus reintentos y dead letter): no se exportan también por aquí
+        if recetas:
+            en_pipeline = job_queue.archivos_con_trabajo(COLA_UPLOAD, [r.xml_path for r in recetas])
+            recetas = [r for r in recetas if os.path.abspath(r.xml_path) not in en_pipeline]
+
         if not recetas:
             return {"exported": 0, "total": 0, "details": []}
 
-        results = []
-
-        for m in recetas:
-            filename = os.path.basename(m.xml_path)
-
-            # --- Intentar subir ---
-            uploaded = try_upload_to_drive(m.xml_path, filename)
-
-            if uploaded:
-                m.sent = True
-                db.commit()
-
-            results.append({
-                "id": m.id,
-                "file": filename,
-                "uploaded": uploaded,
-                "ok": uploaded
-            })
-
-        return {
-            "exported": len([x for x in results if x["ok"]]),
-            "total": len(recetas),
-            "details": results
-        }
+        job_queue.encolar("export", [r.xml_path for r in recetas])
 
     finally:
         db.close()
 
+    procesado = procesar_cola_export()
+    results = procesado["results"]
+
+    return {
+        "exported": len([x for x in results if x["ok"]]),
+        "total": len(recetas),
+        "details": results,
+        "reintentos_programados": procesado["reintentos_programados"],
+        "dead_letter": procesado["dead_letter"]
+    }
+
 
 if __name__ == "__main__":
     result = export_pending()
@@ -2,6 +2,8 @@
 """
 Inicializa/crea las tablas definidas en backend/database/*.py
 Ejecutar: python backend/scripts/init_db.py
+Usa WEB_DB_URL / LOCAL_DB_URL: funciona con SQLite y con PostgreSQL
+(en PostgreSQL la base de datos debe existir; las tablas e índices se crean aquí).
 """
 import os
 import sys
@@ -16,10 +18,13 @@ sys.path.insert(0, ROOT_DIR)
 sys.path.insert(0, BACKEND_DIR)
 
 # --- IMPORTS CORRECTOS (desde backend/) ---
-from backend.database.base import Base, engine, local_engine
-from backend.database.local_models import *  # noqa: F401
-from backend.database.web_models import *  # noqa: F401
-from backend.core.logger import logger
+# Los modelos importan "database.base": usar el mismo módulo para que Base.metadata
+# tenga las tablas (con "backend.database.base" sería otra copia, vacía)
+from database.base import Base, engine, local_engine
+from database.local_models import *  # noqa: F401
+from database.web_models import *  # noqa: F401
+from database.queue_models import *  # noqa: F401
+from core.logger import logger
 
 
 
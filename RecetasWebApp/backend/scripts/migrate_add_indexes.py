@@ -0,0 +1,79 @@
+# backend/scripts/migrate_add_indexes.py
+"""
+Migración: Crea los índices declarados en database/*_models.py que falten
+en las BDs ya existentes (web.db y local.db). create_all no añade índices
+a tablas que ya existen, por eso hace falta este paso.
+Ejecutar desde el directorio backend con el venv activado:
+  python scripts/migrate_add_indexes.py
+Después se puede comprobar el plan de las consultas con:
+  python scripts/check_query_plans.py
+"""
+import os
+import sys
+
+# Agregar el directorio backend al path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, backend_dir)
+
+try:
+    from sqlalchemy import inspect, text
+    from database.base import Base, engine, local_engine
+    import database.web_models  # noqa: F401
+    import database.local_models  # noqa: F401
+    from core.logger import logger
+except ImportError as e:
+    print(f"Error al importar módulos: {e}")
+    print("Asegúrate de estar en el directorio backend y tener el venv activado.")
+    sys.exit(1)
+
+# Tablas de cada BD cuyos índices se gestionan aquí
+TABLAS_WEB = ["recetas_web", "medicamentos_web"]
+TABLAS_LOCAL = ["recetas_local", "medicamentos_local"]
+
+
+def migrate_engine(eng, tablas, nombre: str) -> int:
+    """Crea los índices que falten en `tablas`. Devuelve cuántos se crearon."""
+    inspector = inspect(eng)
+    existentes_tablas = set(inspector.get_table_names())
+    creados = 0
+
+    for tabla in tablas:
+        if tabla not in existentes_tablas:
+            logger.info(f"[MIGRACIÓN {nombre}] La tabla {tabla} no existe, se omite (init_db la creará con sus índices).")
+            continue
+
+        existentes = {ix["name"] for ix in inspector.get_indexes(tabla)}
+        for index in Base.metadata.tables[tabla].indexes:
+            if index.name in existentes:
+                continue
+            logger.info(f"[MIGRACIÓN {nombre}] Creando índice {index.name} en {tabla}...")
+            index.create(bind=eng)
+            creados += 1
+            print(f"✓ Índice {index.name} creado en {tabla} ({nombre}).")
+
+    if creados and eng.dialect.name == "sqlite":
+        # Actualizar estadísticas para que el planificador elija los índices nuevos
+        with eng.connect() as conn:
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+    return creados
+
+
+def migrate():
+    """Crea los índices que falten en ambas BDs."""
+    try:
+        total = migrate_engine(engine, TABLAS_WEB, "WEB")
+        total += migrate_engine(local_engine, TABLAS_LOCAL, "LOCAL")
+        if total == 0:
+            logger.info("Todos los índices ya existen. No se requiere migración.")
+            print("✓ Todos los índices ya existen. No se requiere migración.")
+        else:
+            logger.info(f"{total} índice(s) creados exitosamente.")
+    except Exception as e:
+        logger.error(f"Error en migración: {e}")
+        print(f"✗ Error en migración: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,24 +1,53 @@
-import sqlite3
+# backend/scripts/migrate_add_pdf_password.py
+"""
+Migración: Agrega la columna pdf_password a recetas_web (BD web) y a
+recetas_local (BD local) si no existe.
+Usa los engines configurados (WEB_DB_URL / LOCAL_DB_URL), así funciona igual en SQLite y PostgreSQL.
+Ejecutar desde el directorio backend con el venv activado:
+  python scripts/migrate_add_pdf_password.py
+"""
 import os
+import sys
 
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "web.db"))
+# Agregar el directorio backend al path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, backend_dir)
 
-def migrate():
+try:
+    from sqlalchemy import text, inspect
+    from database.base import engine, local_engine
+    from core.logger import logger
+except ImportError as e:
+    print(f"Error al importar módulos: {e}")
+    print("Asegúrate de estar en el directorio backend y tener el venv activado.")
+    sys.exit(1)
+
+def migrate_tabla(eng, tabla: str):
+    """Agrega la columna pdf_password a `tabla` si no existe."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Intentar agregar columna
-        cursor.execute("ALTER TABLE recetas_web ADD COLUMN pdf_password VARCHAR(255) NULL;")
-        conn.commit()
-        print("✅ Columna pdf_password agregada correctamente")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("✅ La columna pdf_password ya existe")
+        columns = [col['name'] for col in inspect(eng).get_columns(tabla)]
+        if 'pdf_password' in columns:
+            print(f"✅ La columna pdf_password ya existe en {tabla}")
+            return
+
+        with eng.connect() as conn:
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN pdf_password VARCHAR(255) NULL"))
+            conn.commit()
+        logger.info(f"Columna pdf_password agregada a {tabla}.")
+        print(f"✅ Columna pdf_password agregada correctamente a {tabla}")
+    except Exception as e:
+        error_msg = str(e).lower()
+        if "duplicate column" in error_msg or "already exists" in error_msg:
+            print(f"✅ La columna pdf_password ya existe en {tabla}")
         else:
-            print(f"❌ Error: {e}")
-    finally:
-        conn.close()
+            logger.error(f"Error en migración de {tabla}: {e}")
+            print(f"❌ Error ({tabla}): {e}")
+
+def migrate():
+    """Agrega la columna pdf_password en ambas BDs."""
+    migrate_tabla(engine, "recetas_web")
+    # Las recetas recibidas guardan su propia contraseña (también la de los PDFs regenerados)
+    migrate_tabla(local_engine, "recetas_local")
 
 if __name__ == "__main__":
-    migrate()
\ No newline at end of file
+    migrate()
@@ -3,7 +3,8 @@
 Migración: Agrega la columna pdf_path a la tabla recetas_web si no existe.
 Ejecutar desde el directorio backend con el venv activado:
   python scripts/migrate_add_pdf_path.py
-O ejecutar el SQL directamente:
+Usa el engine configurado (WEB_DB_URL): SQLite o PostgreSQL.
+En SQLite también se puede ejecutar el SQL directamente:
   sqlite3 web.db < scripts/migrate_add_pdf_path.sql
 """
 import os
@@ -0,0 +1,45 @@
+# backend/scripts/regenerar_pdfs.py
+"""
+Regenera en lote los PDFs de receta (render + cifrado en un pool de procesos).
+Ejecutar desde el directorio backend con el venv activado:
+  python scripts/regenerar_pdfs.py                   # recetas web sin PDF
+  python scripts/regenerar_pdfs.py --tabla todas     # web y locales sin PDF
+  python scripts/regenerar_pdfs.py --todas -w 8      # rehacer todos los PDFs web con 8 procesos
+"""
+import os
+import sys
+import argparse
+
+# Agregar el directorio backend al path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, backend_dir)
+
+from services.pdf_backfill import (
+    regenerar_pdfs, TABLAS, PDF_BACKFILL_WORKERS, PDF_BACKFILL_CHUNK, PDF_BACKFILL_COMMIT_EVERY
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regeneración masiva de PDFs de receta")
+    parser.add_argument("--tabla", choices=TABLAS + ("todas",), default="web")
+    parser.add_argument("--todas", action="store_true", help="Regenerar también las recetas que ya tienen PDF")
+    parser.add_argument("-w", "--workers", type=int, default=PDF_BACKFILL_WORKERS, help="Procesos (1 = sin pool)")
+    parser.add_argument("--chunk", type=int, default=PDF_BACKFILL_CHUNK, help="Filas leídas por bloque")
+    parser.add_argument("--commit-cada", type=int, default=PDF_BACKFILL_COMMIT_EVERY, help="Filas por commit")
+    args = parser.parse_args()
+
+    tablas = TABLAS if args.tabla == "todas" else (args.tabla,)
+    errores = 0
+    for tabla in tablas:
+        progreso = regenerar_pdfs(
+            tabla, solo_faltantes=not args.todas, workers=args.workers,
+            chunk=args.chunk, commit_cada=args.commit_cada,
+            on_progreso=lambda p: print(f"\r{p}", end="", flush=True),
+        )
+        print()
+        errores += progreso.errores
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
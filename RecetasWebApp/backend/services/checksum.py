@@ -19,26 +19,35 @@ def validar_checksum(xml_path):
     # Cargar XML EXACTAMENTE como está
     parser = etree.XMLParser(remove_blank_text=False)
     tree = etree.parse(xml_path, parser)
-    root = tree.getroot()
+    return validar_checksum_root(tree.getroot())
 
-    # 1. Extraer checksum original
-    checksum_original = root.find(".//checksum").text.strip()
 
-    # 2. Eliminar checksum del árbol
+def validar_checksum_root(root):
+    """
+    Igual que validar_checksum() pero sobre un árbol ya parseado.
+    El árbol queda intacto: el nodo <checksum> se reinserta al terminar.
+    """
+    # 1. Extraer checksum original
     checksum_node = root.find(".//checksum")
+    checksum_original = checksum_node.text.strip()
+
+    # 2. Quitar checksum del árbol (temporalmente)
     parent = checksum_node.getparent()
+    index = parent.index(checksum_node)
     parent.remove(checksum_node)
 
-    # 3. Serializar SIN pretty print
-    xml_bytes = etree.tostring(
-        root,
-        encoding="utf-8",
-        xml_declaration=False,
-        pretty_print=False
-    )
+    try:
+        # 3. Serializar SIN pretty print
+        xml_bytes = etree.tostring(
+            root,
+            encoding="utf-8",
+            xml_declaration=False,
+            pretty_print=False
+        )
+    finally:
+        parent.insert(index, checksum_node)
 
     # 4. Calcular checksum real
     checksum_recalculado = hashlib.sha256(xml_bytes).hexdigest()
 
     return checksum_recalculado == checksum_original, checksum_recalculado, checksum_original
-
@@ -1,6 +1,11 @@
 # backend/services/drive_service.py
 import os
+import json
+import atexit
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,6 +29,18 @@ GOOGLE_TOKEN_URI = os.getenv("GOOGLE_DRIVE_TOKEN_URI", "https://oauth2.googleapi
 FOLDER_OUTBOX_ID = os.getenv("GOOGLE_DRIVE_FOLDER_OUTBOX_ID", "")
 FOLDER_INBOX_ID = os.getenv("GOOGLE_DRIVE_FOLDER_INBOX_ID", "")
 
+# Refrescar el access token cuando le queden menos de estos segundos
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("GOOGLE_DRIVE_TOKEN_REFRESH_MARGIN", "300"))
+
+# Lotes: máximo de peticiones por batch (límite de Drive: 100) y transferencias simultáneas
+DRIVE_BATCH_SIZE = 100
+DRIVE_MAX_CONCURRENCY = int(os.getenv("GOOGLE_DRIVE_MAX_CONCURRENCY", "8"))
+
+# Sincronización: "incremental" (watermark de modifiedTime) o "full" (listar todo)
+SYNC_MODE = os.getenv("DRIVE_SYNC_MODE", "incremental").lower()
+SYNC_STATE_PATH = os.path.join(DATA_ROOT, "drive_sync_state.json")
+DRIVE_LIST_PAGE_SIZE = 1000
+
 def upload_simulated(filepath):
     os.makedirs(OUTBOX, exist_ok=True)
     dest = os.path.join(OUTBOX, os.path.basename(filepath))
@@ -50,27 +67,25 @@ def upload_bytes_simulated(filename, data: bytes):
     return {"mode": "simulated", "path": dest_outbox, "inbox_path": dest_inbox}
 
 
-def _build_service_account_drive():
-    """Construye el cliente de Drive usando Service Account (modo anterior)."""
+def _build_service_account_credentials():
+    """Credenciales de Service Account (modo anterior)."""
     try:
         from google.oauth2 import service_account
-        from googleapiclient.discovery import build
     except Exception:
         logger.error(
             "Dependencias Google API no instaladas: pip install google-api-python-client google-auth"
         )
         raise
 
-    creds = service_account.Credentials.from_service_account_file(
+    return service_account.Credentials.from_service_account_file(
         SERVICE_ACCOUNT_JSON,
         scopes=["https://www.googleapis.com/auth/drive.file"],
     )
-    return build("drive", "v3", credentials=creds)
 
 
-def _build_oauth_drive():
+def _build_oauth_credentials():
     """
-    Construye el cliente de Drive usando OAuth2 con tu cuenta personal.
+    Credenciales OAuth2 con tu cuenta personal.
 
     Requiere en .env:
       GOOGLE_DRIVE_CLIENT_ID
@@ -86,15 +101,13 @@ def _build_oauth_drive():
 
     try:
         from google.oauth2.credentials import Credentials
-        from google.auth.transport.requests import Request
-        from googleapiclient.discovery import build
     except Exception:
         logger.error(
             "Dependencias Google API no instaladas: pip install google-api-python-client google-auth"
         )
         raise
 
-    creds = Credentials(
+    return Credentials(
         token=None,
         refresh_token=GOOGLE_REFRESH_TOKEN,
         token_uri=GOOGLE_TOKEN_URI,
@@ -102,22 +115,74 @@ def _build_oauth_drive():
         client_secret=GOOGLE_CLIENT_SECRET,
         scopes=["https://www.googleapis.com/auth/drive.file"],
     )
-    # Refrescar el access token usando el refresh token (sin interacción)
-    creds.refresh(Request())
-    return build("drive", "v3", credentials=creds)
+
+
+# --- Cliente de Drive reutilizable ---
+# Las credenciales son únicas por proceso y se refrescan ANTES de expirar.
+# El objeto service (httplib2 no es thread-safe) es uno por hilo.
+_creds = None
+_creds_generation = 0
+_creds_lock = threading.Lock()
+_local = threading.local()
+
+
+def _token_por_expirar(creds) -> bool:
+    if not creds.token or creds.expiry is None:
+        return True
+    return creds.expiry - datetime.utcnow() < timedelta(seconds=TOKEN_REFRESH_MARGIN_SECONDS)
+
+
+def _get_credentials():
+    """Devuelve las credenciales del proceso, refrescando el token si está por expirar."""
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            if GOOGLE_REFRESH_TOKEN:
+                logger.info("[Drive] Usando OAuth2 (cuenta personal)")
+                _creds = _build_oauth_credentials()
+            else:
+                logger.info("[Drive] Usando Service Account")
+                _creds = _build_service_account_credentials()
+
+        if _token_por_expirar(_creds):
+            from google.auth.transport.requests import Request
+            # Refrescar el access token usando el refresh token (sin interacción)
+            _creds.refresh(Request())
+            logger.info(f"[Drive] Token refrescado (expira {_creds.expiry})")
+        return _creds
 
 
 def _get_drive_service():
     """
-    Devuelve un cliente de Drive.
+    Devuelve el cliente de Drive del hilo actual.
     - Si hay refresh token configurado -> usa OAuth2 (tu unidad personal).
     - Si no -> usa Service Account (modo anterior).
+    El cliente se construye una vez por hilo; las llamadas siguientes solo
+    verifican que el token no esté por expirar.
     """
-    if GOOGLE_REFRESH_TOKEN:
-        logger.info("[Drive] Usando OAuth2 (cuenta personal)")
-        return _build_oauth_drive()
-    logger.info("[Drive] Usando Service Account")
-    return _build_service_account_drive()
+    creds = _get_credentials()
+    service = getattr(_local, "service", None)
+    if service is None or getattr(_local, "generation", None) != _creds_generation:
+        try:
+            from googleapiclient.discovery import build
+        except Exception:
+            logger.error(
+                "Dependencias Google API no instaladas: pip install google-api-python-client google-auth"
+            )
+            raise
+        service = build("drive", "v3", credentials=creds, cache_discovery=False)
+        _local.service = service
+        _local.generation = _creds_generation
+        logger.info(f"[Drive] Cliente creado para hilo {threading.current_thread().name}")
+    return service
+
+
+def reset_drive_client():
+    """Descarta credenciales y clientes cacheados (p. ej. tras cambiar el .env)."""
+    global _creds, _creds_generation
+    with _creds_lock:
+        _creds = None
+        _creds_generation += 1
 
 
 
@@ -158,7 +223,7 @@ def upload_xml_bytes(filename, data: bytes, folder_id: str):
         return upload_bytes_real(filename, data, folder_id)
 
 
-def list_files_simulated(folder_id: str = None):
+def list_files_simulated(folder_id: str = None, modified_since: str = None):
     """Lista archivos XML en el directorio local de inbox (modo simulado)."""
     os.makedirs(INBOX, exist_ok=True)
     files = []
@@ -166,40 +231,60 @@ def list_files_simulated(folder_id: str = None):
         for f in os.listdir(INBOX):
             if f.lower().endswith(".xml"):
                 file_path = os.path.join(INBOX, f)
+                if not os.path.exists(file_path):
+                    continue
+                modified = datetime.utcfromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                if modified_since and modified < modified_since:
+                    continue
                 files.append({
                     "id": f,
                     "name": f,
                     "path": file_path,
-                    "size": os.path.getsize(file_path) if os.path.exists(file_path) else 0
+                    "size": os.path.getsize(file_path),
+                    "modifiedTime": modified
                 })
     return files
 
 
-def list_files_real(folder_id: str = None):
-    """Lista archivos XML de una carpeta en Google Drive."""
+def list_files_real(folder_id: str = None, modified_since: str = None):
+    """
+    Lista archivos XML de una carpeta en Google Drive (todas las páginas).
+    Si se indica modified_since (RFC 3339), solo devuelve los modificados desde entonces.
+    """
     try:
         service = _get_drive_service()
-        query = "mimeType='text/xml' or mimeType='application/xml'"
+        query = "(mimeType='text/xml' or mimeType='application/xml') and trashed=false"
         if folder_id:
             query += f" and '{folder_id}' in parents"
         elif FOLDER_INBOX_ID:
             query += f" and '{FOLDER_INBOX_ID}' in parents"
-        
-        results = service.files().list(
-            q=query,
-            fields="files(id, name, size, modifiedTime)",
-            supportsAllDrives=True,
-            includeItemsFromAllDrives=True
-        ).execute()
+        if modified_since:
+            query += f" and modifiedTime >= '{modified_since}'"
         
         files = []
-        for item in results.get("files", []):
-            files.append({
-                "id": item["id"],
-                "name": item["name"],
-                "size": int(item.get("size", 0)),
-                "modifiedTime": item.get("modifiedTime", "")
-            })
+        page_token = None
+        while True:
+            results = service.files().list(
+                q=query,
+                fields="nextPageToken, files(id, name, size, modifiedTime)",
+                pageSize=DRIVE_LIST_PAGE_SIZE,
+                pageToken=page_token,
+                orderBy="modifiedTime",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute()
+            
+            for item in results.get("files", []):
+                files.append({
+                    "id": item["id"],
+                    "name": item["name"],
+                    "size": int(item.get("size", 0)),
+                    "modifiedTime": item.get("modifiedTime", "")
+                })
+            
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
         return files
     except Exception as e:
         logger.error(f"Error al listar archivos de Drive: {e}")
@@ -234,28 +319,27 @@ def download_file_real(file_id: str, dest_path: str = None):
         
         service = _get_drive_service()
         
-        # Obtener metadatos del archivo
-        file_metadata = service.files().get(
-            fileId=file_id,
-            supportsAllDrives=True
-        ).execute()
-        
-        filename = file_metadata.get("name", f"file_{file_id}.xml")
-        
         if not dest_path:
+            # Obtener metadatos del archivo (solo hace falta para conocer el nombre)
+            file_metadata = service.files().get(
+                fileId=file_id,
+                supportsAllDrives=True
+            ).execute()
+            filename = file_metadata.get("name", f"file_{file_id}.xml")
             os.makedirs(INBOX, exist_ok=True)
             dest_path = os.path.join(INBOX, filename)
         else:
+            filename = os.path.basename(dest_path)
             os.makedirs(os.path.dirname(dest_path), exist_ok=True)
         
         # Descargar contenido
         request = service.files().get_media(fileId=file_id)
-        fh = io.FileIO(dest_path, "wb")
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
+        with io.FileIO(dest_path, "wb") as fh:
+            downloader = MediaIoBaseDownload(fh, request)
+            
+            done = False
+            while done is False:
+                status, done = downloader.next_chunk()
         
         logger.info(f"[Drive Real] Descargado {filename} a {dest_path}")
         return dest_path
@@ -264,12 +348,95 @@ def download_file_real(file_id: str, dest_path: str = None):
         raise
 
 
-def list_drive_files(folder_id: str = None):
+# --- Operaciones por lotes ---
+# Drive no admite subidas/descargas de contenido dentro de un batch HTTP:
+# los metadatos van en batch (hasta 100 por petición) y las transferencias
+# se ejecutan en paralelo con un pool acotado (un cliente por hilo).
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Pool de transferencias del proceso (se crea una vez y se reutiliza entre lotes).
+    Sus hilos viven tanto como el proceso, así cada uno conserva su cliente de Drive.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, DRIVE_MAX_CONCURRENCY), thread_name_prefix="drive")
+                logger.info(f"[Drive] Pool de {DRIVE_MAX_CONCURRENCY} hilos de transferencia iniciado")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def _en_paralelo(func, args_list: list) -> list:
+    """Ejecuta func(*args) para cada elemento; devuelve resultados o excepciones en orden."""
+    if not args_list:
+        return []
+    pool = _get_executor()
+    futures = [pool.submit(func, *args) for args in args_list]
+    resultados = []
+    for future in futures:
+        try:
+            resultados.append(future.result())
+        except Exception as e:
+            resultados.append(e)
+    return resultados
+
+
+def get_metadata_batch_real(file_ids: list) -> dict:
+    """Obtiene {file_id: metadatos | excepción} usando batch requests de Drive."""
+    service = _get_drive_service()
+    resultados = {}
+
+    def _callback(request_id, response, exception):
+        resultados[request_id] = exception if exception is not None else response
+
+    for i in range(0, len(file_ids), DRIVE_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_callback)
+        for file_id in file_ids[i:i + DRIVE_BATCH_SIZE]:
+            batch.add(
+                service.files().get(
+                    fileId=file_id,
+                    fields="id, name, size, modifiedTime",
+                    supportsAllDrives=True
+                ),
+                request_id=file_id
+            )
+        batch.execute()
+    return resultados
+
+
+def get_metadata_batch_simulated(file_ids: list) -> dict:
+    resultados = {}
+    for file_id in file_ids:
+        path = file_id if os.path.exists(file_id) else os.path.join(INBOX, file_id)
+        if os.path.exists(path):
+            resultados[file_id] = {"id": file_id, "name": os.path.basename(path), "size": os.path.getsize(path)}
+        else:
+            resultados[file_id] = FileNotFoundError(f"Archivo no encontrado: {file_id}")
+    return resultados
+
+
+def list_drive_files(folder_id: str = None, modified_since: str = None):
     """Lista archivos XML de Drive (simulado o real)."""
     if SIMULATED:
-        return list_files_simulated(folder_id)
+        return list_files_simulated(folder_id, modified_since)
     else:
-        return list_files_real(folder_id)
+        return list_files_real(folder_id, modified_since)
 
 
 def download_drive_file(file_id: str, dest_path: str = None):
@@ -278,26 +445,124 @@ def download_drive_file(file_id: str, dest_path: str = None):
         return download_file_simulated(file_id, dest_path)
     else:
         return download_file_real(file_id, dest_path)
+def get_drive_metadata(file_ids: list) -> dict:
+    """Metadatos de varios archivos en una sola ronda (simulado o real)."""
+    if SIMULATED:
+        return get_metadata_batch_simulated(file_ids)
+    return get_metadata_batch_real(file_ids)
+
+
+def upload_xml_bytes_batch(items: list, folder_id: str) -> list:
+    """
+    Sube varios archivos en paralelo. items: [(filename, data), ...].
+    Devuelve, en el mismo orden, el resultado de upload_xml_bytes o la excepción.
+    """
+    return _en_paralelo(upload_xml_bytes, [(filename, data, folder_id) for filename, data in items])
+
+
+def download_drive_files(items: list) -> list:
+    """
+    Descarga varios archivos en paralelo. items: [{"id", "name"?, "dest_path"?}, ...].
+    Los nombres que falten se resuelven con un solo batch de metadatos.
+    Devuelve, en el mismo orden, la ruta descargada o la excepción.
+    """
+    sin_destino = [it["id"] for it in items if not it.get("dest_path") and not it.get("name")]
+    metadatos = get_drive_metadata(sin_destino) if sin_destino else {}
+
+    args_list = []
+    for it in items:
+        dest_path = it.get("dest_path")
+        if not dest_path:
+            meta = metadatos.get(it["id"])
+            nombre = it.get("name") or (meta.get("name") if isinstance(meta, dict) else None)
+            dest_path = os.path.join(INBOX, nombre or f"file_{it['id']}.xml")
+        args_list.append((it["id"], dest_path))
+
+    return _en_paralelo(download_drive_file, args_list)
+
+
+def _leer_estado_sync(folder_id: str) -> dict:
+    """
+    Estado incremental: {"modified_since": RFC 3339 | None, "ids": [ids ya vistos en ese instante],
+    "reintentar": [{"id", "name", "modifiedTime"} de descargas fallidas]}.
+    """
+    try:
+        with open(SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            estado = json.load(f).get(folder_id or "_default") or {}
+    except (FileNotFoundError, ValueError):
+        estado = {}
+    return {
+        "modified_since": estado.get("modified_since"),
+        "ids": estado.get("ids", []),
+        "reintentar": estado.get("reintentar", []),
+    }
+
+
+def _guardar_estado_sync(folder_id: str, modified_since: str, ids: list, reintentar: list = None):
+    estado = {}
+    try:
+        with open(SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    estado[folder_id or "_default"] = {"modified_since": modified_since, "ids": ids, "reintentar": reintentar or []}
+    tmp_path = SYNC_STATE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+    os.replace(tmp_path, SYNC_STATE_PATH)
+
+
+def reset_sync_watermark(folder_id: str = None):
+    """Olvida el watermark: la siguiente sincronización lista la carpeta completa."""
+    _guardar_estado_sync(folder_id or FOLDER_INBOX_ID, None, [])
+
+
 def sync_drive_to_local():
     """
     Sincroniza archivos XML desde Google Drive hacia data/drive_inbox.
-    Utiliza list_drive_files() y download_drive_file() (simulado o real).
+    Utiliza list_drive_files() y download_drive_files() (simulado o real).
+
+    En modo incremental (DRIVE_SYNC_MODE=incremental, por defecto) solo se
+    listan los archivos con modifiedTime >= al último watermark guardado,
+    así el costo es proporcional a lo nuevo y no al historial de la carpeta.
+    El watermark siempre avanza; las descargas fallidas se guardan aparte y
+    en el ciclo siguiente se reintentan solo esas (sin volver a listar lo ya
+    descargado, que el receiver quizá ya movió fuera del inbox).
     """
     try:
         os.makedirs(INBOX, exist_ok=True)
 
-        archivos_drive = list_drive_files(FOLDER_INBOX_ID)
-        logger.info(f"[Drive Sync] Archivos detectados en Drive: {len(archivos_drive)}")
+        incremental = SYNC_MODE == "incremental"
+        estado = (_leer_estado_sync(FOLDER_INBOX_ID) if incremental
+                  else {"modified_since": None, "ids": [], "reintentar": []})
+        watermark = estado["modified_since"]
+        # Los archivos justo en el watermark ya se procesaron en el ciclo anterior
+        ya_vistos = set(estado["ids"])
+        reintentar = {it["id"]: it for it in estado["reintentar"]}
+
+        archivos_drive = list_drive_files(FOLDER_INBOX_ID, modified_since=watermark)
+        logger.info(
+            f"[Drive Sync] Archivos detectados en Drive: {len(archivos_drive)}"
+            + (f" (desde {watermark})" if watermark else "")
+        )
 
-        nuevos = 0
+        pendientes = []
+        listados = {item["id"] for item in archivos_drive}
+        # Descargas fallidas de ciclos anteriores que no vuelven en el listado
+        candidatos = [it for it in reintentar.values() if it["id"] not in listados] + archivos_drive
 
-        for item in archivos_drive:
+        for item in candidatos:
             nombre = item["name"]
 
             # Solo XML
             if not nombre.lower().endswith(".xml"):
                 continue
 
+            # Sin cambios desde el ciclo anterior (salvo que su descarga fallara)
+            if (item["id"] in ya_vistos and item.get("modifiedTime") == watermark
+                    and item["id"] not in reintentar):
+                continue
+
             destino = os.path.join(INBOX, nombre)
 
             # Evitar duplicados
@@ -306,9 +571,37 @@ def sync_drive_to_local():
                 continue
 
             logger.info(f"[Drive Sync] ⬇️ Descargando {nombre} ...")
+            pendientes.append({
+                "id": item["id"],
+                "name": nombre,
+                "dest_path": destino,
+                "modifiedTime": item.get("modifiedTime", "")
+            })
 
-            download_drive_file(item["id"], destino)
-            nuevos += 1
+        # Descargas en paralelo (el nombre ya viene del listado: sin files().get por archivo)
+        resultados = download_drive_files(pendientes)
+        nuevos = 0
+        for item, resultado in zip(pendientes, resultados):
+            if isinstance(resultado, Exception):
+                logger.error(f"[Drive Sync] ❌ Error descargando {item['name']}: {resultado}")
+            else:
+                nuevos += 1
+
+        # Avanzar el watermark siempre; los fallidos quedan en "reintentar"
+        # (un archivo que ya no existe en Drive se descarta).
+        if incremental:
+            nuevo_watermark = max((it.get("modifiedTime", "") for it in archivos_drive), default="") or watermark
+            ids = sorted(it["id"] for it in archivos_drive if it.get("modifiedTime") == nuevo_watermark)
+            if nuevo_watermark == watermark:
+                ids = sorted(set(ids) | ya_vistos)
+            pendientes_reintento = [
+                {"id": it["id"], "name": it["name"], "modifiedTime": it.get("modifiedTime", "")}
+                for it, resultado in zip(pendientes, resultados)
+                if isinstance(resultado, Exception) and getattr(getattr(resultado, "resp", None), "status", None) != 404
+            ]
+            if (nuevo_watermark != watermark or set(ids) != ya_vistos
+                    or {it["id"] for it in pendientes_reintento} != set(reintentar)):
+                _guardar_estado_sync(FOLDER_INBOX_ID, nuevo_watermark, ids, pendientes_reintento)
 
         logger.info(f"[Drive Sync] Sincronización completada. Nuevos archivos: {nuevos}")
         return nuevos
@@ -1,12 +1,155 @@
 import os
 import smtplib
+import threading
 import time
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from core.logger import logger
 
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT_SECONDS", "60"))
+# Si una conexión lleva más de esto sin usarse, se verifica con NOOP antes de reutilizarla
+SMTP_NOOP_AFTER = 5.0
+# Segundos entre el correo con el PDF y el de la contraseña
+EMAIL_PASSWORD_DELAY_SECONDS = float(os.getenv("EMAIL_PASSWORD_DELAY_SECONDS", "0"))
+
+
+class SMTPConnectionPool:
+    """
+    Sesiones SMTP autenticadas y reutilizables (STARTTLS + login una sola vez).
+
+    Las conexiones ociosas más de `idle_timeout` segundos se cierran y se
+    reabren al pedirlas (los proveedores cortan sesiones inactivas). Si el
+    servidor cerró la sesión durante un envío, se reconecta y se reintenta una vez.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str,
+                 max_size: int = SMTP_POOL_SIZE, idle_timeout: float = SMTP_IDLE_TIMEOUT,
+                 starttls: bool = True, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = []  # [(smtp, último uso)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.conexiones_abiertas = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        logger.info(f"[EMAIL] Conectando a {self.host}:{self.port}...")
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+                logger.info(f"[EMAIL] TLS iniciado")
+            if self.user and self.password:
+                server.login(self.user, self.password)
+                logger.info(f"[EMAIL] Autenticado")
+        except Exception:
+            self._cerrar(server)
+            raise
+        self.conexiones_abiertas += 1
+        return server
+
+    @staticmethod
+    def _cerrar(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _tomar(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, ultimo_uso = self._idle.pop()
+            edad = time.monotonic() - ultimo_uso
+            if edad > self.idle_timeout:
+                self._cerrar(server)
+                continue
+            if edad > SMTP_NOOP_AFTER:
+                try:
+                    if server.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP fallido")
+                except Exception:
+                    self._cerrar(server)
+                    continue
+            return server
+        return self._connect()
+
+    @contextmanager
+    def connection(self):
+        """Presta una sesión SMTP lista para enviar; se devuelve al pool al salir."""
+        self._slots.acquire()
+        server = None
+        try:
+            server = self._tomar()
+            yield server
+        except (smtplib.SMTPServerDisconnected, OSError):
+            if server is not None:
+                self._cerrar(server)
+                server = None
+            raise
+        finally:
+            if server is not None:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+            self._slots.release()
+
+    def send_message(self, msg):
+        """Envía msg reutilizando una sesión; reconecta una vez si el servidor la cerró."""
+        for intento in (1, 2):
+            try:
+                with self.connection() as server:
+                    server.send_message(msg)
+                return
+            except smtplib.SMTPServerDisconnected:
+                if intento == 2:
+                    raise
+                logger.warning("[EMAIL] Sesión SMTP cerrada por el servidor, reconectando...")
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._cerrar(server)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, user: str, password: str, starttls: bool = True) -> SMTPConnectionPool:
+    """Pool compartido por proceso para cada (host, port, usuario)."""
+    key = (host, port, user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.password != password or pool.starttls != starttls:
+            if pool is not None:
+                pool.close_all()
+            pool = SMTPConnectionPool(host, port, user, password, starttls=starttls)
+            _pools[key] = pool
+        return pool
+
+
+def close_smtp_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
 class EmailSender:
     """Envía correos con PDF adjunto."""
     
@@ -19,6 +162,10 @@ class EmailSender:
         elif self.provider == "outlook":
             self.smtp_server = "smtp-mail.outlook.com"
             self.smtp_port = 587
+        elif self.provider == "smtp":
+            # Servidor genérico (p. ej. un servidor local de pruebas tipo aiosmtpd)
+            self.smtp_server = os.getenv("SMTP_HOST", "localhost")
+            self.smtp_port = int(os.getenv("SMTP_PORT", "25"))
         else:
             raise ValueError(f"Provider no soportado: {provider}")
         
@@ -29,6 +176,9 @@ class EmailSender:
         
         if not self.email or not self.password:
             logger.warning(f"[EMAIL] ⚠️ Credenciales incompletas para {self.provider}")
+
+        starttls = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+        self.pool = get_smtp_pool(self.smtp_server, self.smtp_port, self.email, self.password, starttls)
     
     def enviar_receta_pdf(self, 
                          email_destino: str, 
@@ -79,16 +229,9 @@ Sistema de Recetario Médico
                 part.add_header('Content-Disposition', f'attachment; filename="{filename_only}"')
                 msg.attach(part)
             
-            logger.info(f"[EMAIL] Conectando a {self.smtp_server}:{self.smtp_port}...")
-            
-            # Enviar
-            with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30) as server:
-                server.starttls()
-                logger.info(f"[EMAIL] TLS iniciado")
-                server.login(self.email, self.password)
-                logger.info(f"[EMAIL] Autenticado")
-                server.send_message(msg)
-                logger.info(f"[EMAIL] Mensaje enviado")
+            # Enviar (sesión SMTP reutilizada del pool)
+            self.pool.send_message(msg)
+            logger.info(f"[EMAIL] Mensaje enviado")
             
             logger.info(f"[EMAIL] ✅ PDF enviado a {email_destino}")
             return True
@@ -134,10 +277,7 @@ Sistema de Recetario Médico
             
             logger.info(f"[EMAIL] Enviando contraseña a {email_destino}...")
             
-            with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30) as server:
-                server.starttls()
-                server.login(self.email, self.password)
-                server.send_message(msg)
+            self.pool.send_message(msg)
             
             logger.info(f"[EMAIL] ✅ Contraseña enviada a {email_destino}")
             return True
@@ -170,9 +310,10 @@ def enviar_receta_completa(email_paciente: str,
         logger.warning("[EMAIL] ⚠️ No se pudo enviar PDF")
         return False
     
-    # Pausa
-    logger.info("[EMAIL] ⏳ Esperando 3 segundos...")
-    time.sleep(3)
+    # Pausa opcional entre los dos correos (en el pipeline es el retraso con que se encola receta_password)
+    if EMAIL_PASSWORD_DELAY_SECONDS > 0:
+        logger.info(f"[EMAIL] ⏳ Esperando {EMAIL_PASSWORD_DELAY_SECONDS:g} segundos...")
+        time.sleep(EMAIL_PASSWORD_DELAY_SECONDS)
     
     # Enviar contraseña
     logger.info(f"[EMAIL] 🔐 Enviando contraseña...")
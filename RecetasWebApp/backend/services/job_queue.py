@@ -0,0 +1,337 @@
+# backend/services/job_queue.py
+import os
+import socket
+import secrets
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, or_, func, update
+from database.base import LocalSessionLocal, local_engine
+from database.queue_models import TrabajoCola
+from services.retry import RETRY_MAX_ATTEMPTS, calcular_backoff, es_transitorio
+from core.logger import logger
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+DEAD_LETTER = "dead_letter"
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_tabla_lista = False
+
+
+def ensure_table():
+    """
+    Crea la tabla cola_trabajos en la BD local si no existe (una vez por proceso),
+    junto con los índices que le falten en una BD ya existente.
+    """
+    global _tabla_lista
+    if not _tabla_lista:
+        TrabajoCola.__table__.create(bind=local_engine, checkfirst=True)
+        for index in TrabajoCola.__table__.indexes:
+            index.create(bind=local_engine, checkfirst=True)
+        _tabla_lista = True
+
+
+def prioridad_por_nombre(archivo: str) -> int:
+    """Médicos y pacientes antes que las recetas que los referencian."""
+    nombre = os.path.basename(archivo)
+    if nombre.startswith("medico_") or nombre.startswith("paciente_"):
+        return 0
+    return 1
+
+
+def encolar(cola: str, archivos: List[str], retraso_segundos: float = 0) -> int:
+    """
+    Encola archivos (idempotente por cola+archivo).
+    Un archivo ya completado o en error que vuelve a aparecer se reactiva
+    (los dead letters solo se reactivan con reintentar_dead_letters()).
+    Con `retraso_segundos` los trabajos no están listos hasta pasado ese tiempo.
+    Devuelve cuántos trabajos quedaron pendientes.
+    """
+    if not archivos:
+        return 0
+    ensure_table()
+    archivos = [os.path.abspath(a) for a in archivos]
+    db = LocalSessionLocal()
+    try:
+        existentes = {
+            t.archivo: t for t in db.query(TrabajoCola).filter(
+                TrabajoCola.cola == cola,
+                TrabajoCola.archivo.in_(archivos)
+            )
+        }
+        nuevos = 0
+        listo_en = datetime.utcnow() + timedelta(seconds=retraso_segundos)
+        for archivo in archivos:
+            trabajo = existentes.get(archivo)
+            if trabajo is None:
+                db.add(TrabajoCola(
+                    cola=cola,
+                    archivo=archivo,
+                    prioridad=prioridad_por_nombre(archivo),
+                    estado=PENDIENTE,
+                    next_run_at=listo_en,
+                ))
+                nuevos += 1
+            elif trabajo.estado in (COMPLETADO, ERROR):
+                trabajo.estado = PENDIENTE
+                trabajo.intentos = 0
+                trabajo.next_run_at = listo_en
+                trabajo.lease_until = None
+                trabajo.ultimo_error = None
+                nuevos += 1
+        db.commit()
+        if nuevos:
+            logger.info(f"[COLA {cola}] {nuevos} trabajo(s) encolado(s)")
+        return nuevos
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def reclamar(cola: str, limite: int = 100, lease_seconds: int = LEASE_SECONDS,
+             worker_id: str = WORKER_ID) -> List[TrabajoCola]:
+    """
+    Reclama hasta `limite` trabajos listos de la cola.
+
+    Un trabajo está listo si está pendiente y su next_run_at ya pasó, o si
+    estaba en proceso pero su lease venció (el worker murió). Los candidatos
+    se buscan por separado en cada estado (cada consulta sale en orden del
+    índice (cola, estado, prioridad, id)) y se toman con un único UPDATE
+    condicional marcado con un token de reclamo: dos workers nunca reclaman
+    la misma fila, y cada uno relee solo las que lleven su token.
+    """
+    ensure_table()
+    db = LocalSessionLocal()
+    try:
+        now = datetime.utcnow()
+        ramas = (
+            and_(TrabajoCola.estado == PENDIENTE, TrabajoCola.next_run_at <= now),
+            and_(TrabajoCola.estado == EN_PROCESO, TrabajoCola.lease_until < now),
+        )
+        candidatos = []
+        for rama in ramas:
+            candidatos.extend(
+                db.query(TrabajoCola.prioridad, TrabajoCola.id)
+                .filter(TrabajoCola.cola == cola, rama)
+                .order_by(TrabajoCola.prioridad, TrabajoCola.id)
+                .limit(limite)
+                .all()
+            )
+        candidatos = [row.id for row in sorted(candidatos)[:limite]]
+        if not candidatos:
+            return []
+
+        # worker_id + sufijo aleatorio: distingue reclamos de hilos del mismo proceso
+        token = f"{worker_id}/{secrets.token_hex(4)}"
+        db.execute(
+            update(TrabajoCola)
+            .where(TrabajoCola.id.in_(candidatos), or_(*ramas))
+            .values({
+                TrabajoCola.estado: EN_PROCESO,
+                TrabajoCola.lease_until: now + timedelta(seconds=lease_seconds),
+                TrabajoCola.worker_id: token,
+                TrabajoCola.intentos: TrabajoCola.intentos + 1,
+                TrabajoCola.updated_at: now,
+            })
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        trabajos = db.query(TrabajoCola).filter(
+            TrabajoCola.id.in_(candidatos), TrabajoCola.worker_id == token
+        ).order_by(TrabajoCola.prioridad, TrabajoCola.id).all()
+        db.expunge_all()
+        return trabajos
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def completar(trabajo_id: int):
+    _finalizar(trabajo_id, COMPLETADO, None)
+
+
+def fallar(trabajo_id: int, error: str, reintentar_en: Optional[datetime] = None):
+    """
+    Marca un trabajo como fallido. Si se indica `reintentar_en`, vuelve a
+    pendiente para esa fecha; si no, queda en estado error.
+    """
+    if reintentar_en is not None:
+        _finalizar(trabajo_id, PENDIENTE, error, next_run_at=reintentar_en)
+    else:
+        _finalizar(trabajo_id, ERROR, error)
+
+
+def _finalizar(trabajo_id: int, estado: str, error: Optional[str], next_run_at: Optional[datetime] = None):
+    db = LocalSessionLocal()
+    try:
+        valores = {
+            TrabajoCola.estado: estado,
+            TrabajoCola.lease_until: None,
+            TrabajoCola.ultimo_error: error,
+            TrabajoCola.updated_at: datetime.utcnow(),
+        }
+        if next_run_at is not None:
+            valores[TrabajoCola.next_run_at] = next_run_at
+        db.query(TrabajoCola).filter(TrabajoCola.id == trabajo_id).update(valores, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def programar_reintento(trabajo: TrabajoCola, error: Exception, max_intentos: int = RETRY_MAX_ATTEMPTS) -> str:
+    """
+    Decide qué hacer con un trabajo fallido:
+      - error transitorio con intentos disponibles → pendiente con next_run_at = ahora + backoff
+      - error permanente o presupuesto agotado → dead letter
+    Devuelve "reintento" o "dead_letter".
+    """
+    if es_transitorio(error) and trabajo.intentos < max_intentos:
+        espera = calcular_backoff(trabajo.intentos)
+        fallar(trabajo.id, str(error), reintentar_en=datetime.utcnow() + timedelta(seconds=espera))
+        logger.warning(
+            f"[COLA {trabajo.cola}] {os.path.basename(trabajo.archivo)} falló "
+            f"(intento {trabajo.intentos}/{max_intentos}); reintento en {espera:.1f}s"
+        )
+        return "reintento"
+
+    enviar_a_dead_letter(trabajo.id, str(error))
+    logger.error(f"[COLA {trabajo.cola}] {os.path.basename(trabajo.archivo)} → dead letter: {error}")
+    return "dead_letter"
+
+
+def enviar_a_dead_letter(trabajo_id: int, error: str, archivo: Optional[str] = None):
+    """Mueve un trabajo a dead letter (opcionalmente registrando la nueva ruta del archivo)."""
+    db = LocalSessionLocal()
+    try:
+        valores = {
+            TrabajoCola.estado: DEAD_LETTER,
+            TrabajoCola.lease_until: None,
+            TrabajoCola.ultimo_error: error,
+            TrabajoCola.updated_at: datetime.utcnow(),
+        }
+        if archivo is not None:
+            valores[TrabajoCola.archivo] = os.path.abspath(archivo)
+        db.query(TrabajoCola).filter(TrabajoCola.id == trabajo_id).update(valores, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def listar_dead_letters(cola: Optional[str] = None, limite: int = 100) -> List[dict]:
+    ensure_table()
+    db = LocalSessionLocal()
+    try:
+        query = db.query(TrabajoCola).filter(TrabajoCola.estado == DEAD_LETTER)
+        if cola:
+            query = query.filter(TrabajoCola.cola == cola)
+        return [
+            {
+                "id": t.id,
+                "cola": t.cola,
+                "archivo": t.archivo,
+                "intentos": t.intentos,
+                "ultimo_error": t.ultimo_error,
+                "updated_at": t.updated_at.isoformat() if t.updated_at else None,
+            }
+            for t in query.order_by(TrabajoCola.id).limit(limite)
+        ]
+    finally:
+        db.close()
+
+
+def reintentar_dead_letters(cola: Optional[str] = None, ids: Optional[List[int]] = None) -> int:
+    """Vuelve a poner en pendiente los dead letters indicados (o todos los de la cola)."""
+    ensure_table()
+    db = LocalSessionLocal()
+    try:
+        query = db.query(TrabajoCola).filter(TrabajoCola.estado == DEAD_LETTER)
+        if cola:
+            query = query.filter(TrabajoCola.cola == cola)
+        if ids:
+            query = query.filter(TrabajoCola.id.in_(ids))
+        now = datetime.utcnow()
+        total = query.update({
+            TrabajoCola.estado: PENDIENTE,
+            TrabajoCola.intentos: 0,
+            TrabajoCola.next_run_at: now,
+            TrabajoCola.lease_until: None,
+            TrabajoCola.updated_at: now,
+        }, synchronize_session=False)
+        db.commit()
+        logger.info(f"[COLA] {total} dead letter(s) reactivado(s)")
+        return total
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def resumen(cola: Optional[str] = None) -> dict:
+    """Conteo de trabajos por estado."""
+    ensure_table()
+    db = LocalSessionLocal()
+    try:
+        query = db.query(TrabajoCola.estado, func.count(TrabajoCola.id))
+        if cola:
+            query = query.filter(TrabajoCola.cola == cola)
+        return {estado: total for estado, total in query.group_by(TrabajoCola.estado)}
+    finally:
+        db.close()
+
+
+def estado_por_archivo(archivo: str, colas: List[str]) -> dict:
+    """Estado del trabajo de `archivo` en cada cola: {cola: {estado, intentos, ...}} (solo las que existan)."""
+    ensure_table()
+    db = LocalSessionLocal()
+    try:
+        query = db.query(TrabajoCola).filter(
+            TrabajoCola.archivo == os.path.abspath(archivo),
+            TrabajoCola.cola.in_(colas)
+        )
+        return {
+            t.cola: {
+                "estado": t.estado,
+                "intentos": t.intentos,
+                "ultimo_error": t.ultimo_error,
+                "next_run_at": t.next_run_at.isoformat() if t.next_run_at else None,
+                "updated_at": t.updated_at.isoformat() if t.updated_at else None,
+            }
+            for t in query
+        }
+    finally:
+        db.close()
+
+
+def archivos_con_trabajo(cola: str, archivos: List[str]) -> set:
+    """Rutas absolutas de `archivos` que ya tienen un trabajo (en cualquier estado) en `cola`."""
+    ensure_table()
+    rutas = [os.path.abspath(a) for a in archivos]
+    db = LocalSessionLocal()
+    try:
+        encontrados = set()
+        # Por bloques: SQLite limita el número de parámetros de un IN
+        for i in range(0, len(rutas), 500):
+            encontrados.update(
+                row.archivo for row in db.query(TrabajoCola.archivo).filter(
+                    TrabajoCola.cola == cola,
+                    TrabajoCola.archivo.in_(rutas[i:i + 500])
+                )
+            )
+        return encontrados
+    finally:
+        db.close()
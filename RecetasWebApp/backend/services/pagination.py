@@ -0,0 +1,142 @@
+# backend/services/pagination.py
+"""
+Paginación por cursor (keyset) para los listados de la API.
+
+En lugar de OFFSET se filtra por la última fila devuelta: `WHERE (created_at, id) < (...)`
+sobre columnas indexadas, así el coste de cada página no crece con el historial.
+El cursor es opaco para el cliente (JSON en base64 url-safe).
+"""
+import os
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_, func, select
+
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "50"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "500"))
+# Segundos que se reutiliza un COUNT(*) para la cabecera X-Total-Count
+LIST_COUNT_CACHE_TTL = float(os.getenv("LIST_COUNT_CACHE_TTL", "30"))
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _a_json(valor):
+    if isinstance(valor, datetime):
+        return {"$dt": valor.isoformat()}
+    return valor
+
+
+def _de_json(valor):
+    if isinstance(valor, dict) and "$dt" in valor:
+        return datetime.fromisoformat(valor["$dt"])
+    return valor
+
+
+def encode_cursor(valores: Sequence) -> str:
+    data = json.dumps([_a_json(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, n: int) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode("utf-8"))
+        if not isinstance(valores, list) or len(valores) != n:
+            raise ValueError("longitud incorrecta")
+        return [_de_json(v) for v in valores]
+    except Exception as e:
+        raise CursorInvalido(f"Cursor inválido: {e}")
+
+
+async def keyset_page(db, stmt, columnas: Sequence, limit: int, cursor: Optional[str] = None,
+                      descending: bool = True, scalars: bool = False,
+                      fila_a_clave: Optional[Callable] = None) -> Tuple[list, Optional[str]]:
+    """
+    Ejecuta `stmt` (select) en la AsyncSession `db` y devuelve (filas, next_cursor)
+    de una página ordenada por `columnas` (la última debe ser única, p.ej. la PK,
+    para que el orden sea total). Con scalars=True devuelve entidades ORM en vez de filas.
+
+    El filtro del cursor se expande como
+    `c1 < v1 OR (c1 = v1 AND c2 < v2) OR ...`, que SQLite y PostgreSQL
+    resuelven con el índice compuesto. Se piden limit+1 filas para saber
+    si hay página siguiente sin un COUNT.
+    """
+    if cursor:
+        valores = decode_cursor(cursor, len(columnas))
+        condiciones = []
+        for i, col in enumerate(columnas):
+            previas = [columnas[j] == valores[j] for j in range(i)]
+            paso = col < valores[i] if descending else col > valores[i]
+            condiciones.append(and_(*previas, paso))
+        stmt = stmt.where(or_(*condiciones))
+
+    orden = [c.desc() if descending else c.asc() for c in columnas]
+    result = await db.execute(stmt.order_by(*orden).limit(limit + 1))
+    filas = result.scalars().all() if scalars else result.all()
+
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        if fila_a_clave:
+            clave = fila_a_clave(ultima)
+        else:
+            clave = [getattr(ultima, c.key) for c in columnas]
+        next_cursor = encode_cursor(clave)
+    return filas, next_cursor
+
+
+async def count_total(db, stmt) -> int:
+    """COUNT(*) de las filas que devuelve `stmt` (con sus filtros, sin orden ni límite)."""
+    result = await db.execute(select(func.count()).select_from(stmt.order_by(None).subquery()))
+    return result.scalar_one()
+
+
+class CountCache:
+    """
+    Caché de totales por (listado, filtros) con TTL.
+    Evita un COUNT(*) completo en cada página; las altas invalidan el listado.
+    """
+
+    def __init__(self, ttl: float = LIST_COUNT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = {}
+
+    async def get_or_count(self, listado: str, filtros: dict, contar: Callable[[], Awaitable[int]]) -> int:
+        key = (listado, tuple(sorted((k, str(v)) for k, v in filtros.items() if v is not None)))
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] > ahora:
+                return item[1]
+
+        total = await contar()
+        with self._lock:
+            self._data[key] = (ahora + self.ttl, total)
+        return total
+
+    def invalidate(self, listado: Optional[str] = None):
+        with self._lock:
+            if listado is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if k[0] == listado]:
+                    del self._data[key]
+
+
+count_cache = CountCache()
+
+
+def set_page_headers(response, next_cursor: Optional[str], total: Optional[int] = None):
+    """Cabeceras de paginación: el cuerpo sigue siendo una lista (compatible con clientes previos)."""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
@@ -0,0 +1,344 @@
+# backend/services/pdf_backfill.py
+"""
+Regeneración masiva de PDFs de receta (RecetaWeb / RecetaLocal).
+
+Sirve para rellenar las recetas sin PDF (pdf_path NULL, "sin_pdf" en
+/local-admin/stats) o para rehacerlos todos tras cambiar la plantilla.
+
+  - Las filas se leen por bloques con keyset sobre la PK (solo columnas, sin ORM).
+  - Cada bloque trae sus medicamentos en una consulta.
+  - El render + cifrado (CPU) se reparte en un pool de procesos.
+  - Las contraseñas nuevas se guardan (RecetaWeb y/o RecetaLocal) antes de
+    renderizar cada bloque; pdf_path se guarda con UPDATE masivos y un commit cada
+    PDF_BACKFILL_COMMIT_EVERY filas.
+  - El progreso (procesadas, PDFs/s, ETA) se notifica tras cada bloque.
+
+Uso: scripts/regenerar_pdfs.py o POST /api/local-admin/pdfs/regenerar.
+"""
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+
+from sqlalchemy import select, update, func
+from core.logger import logger
+from database.base import SessionLocal, LocalSessionLocal, DATA_DIR
+from database.web_models import RecetaWeb, MedicamentoWeb
+from database.local_models import RecetaLocal, MedicamentoLocal
+from services.receta_pipeline import GENERADOS_DIR, generar_password_pdf
+
+PDF_BACKFILL_WORKERS = int(os.getenv("PDF_BACKFILL_WORKERS") or os.cpu_count() or 2)
+PDF_BACKFILL_CHUNK = int(os.getenv("PDF_BACKFILL_CHUNK", "500"))
+PDF_BACKFILL_COMMIT_EVERY = int(os.getenv("PDF_BACKFILL_COMMIT_EVERY", "1000"))
+# Mismo directorio que usa jobs/receiver_job.py para los PDFs de recetas recibidas
+PDFS_LOCAL_DIR = os.path.join(DATA_DIR, "pdf")
+
+TABLAS = ("web", "local")
+# Errores que se registran con detalle (el resto solo cuenta)
+_MAX_ERRORES_LOG = 20
+
+
+@dataclass
+class ProgresoBackfill:
+    tabla: str
+    total: int
+    procesadas: int = 0
+    ok: int = 0
+    errores: int = 0
+    estado: str = "en_proceso"   # en_proceso | completado | cancelado | error
+    error: Optional[str] = None
+    inicio: float = field(default_factory=time.monotonic)
+    duracion: float = 0.0
+
+    @property
+    def pdfs_por_segundo(self) -> float:
+        return self.procesadas / self.duracion if self.duracion > 0 else 0.0
+
+    @property
+    def eta_segundos(self) -> Optional[float]:
+        velocidad = self.pdfs_por_segundo
+        if not velocidad:
+            return None
+        return max(self.total - self.procesadas, 0) / velocidad
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("inicio")
+        data["duracion"] = round(self.duracion, 1)
+        data["pdfs_por_segundo"] = round(self.pdfs_por_segundo, 1)
+        eta = self.eta_segundos
+        data["eta_segundos"] = round(eta) if eta is not None else None
+        return data
+
+    def __str__(self) -> str:
+        pct = 100.0 * self.procesadas / self.total if self.total else 100.0
+        eta = self.eta_segundos
+        eta_txt = f" ETA {eta / 60:.1f} min" if eta is not None and self.estado == "en_proceso" else ""
+        return (f"[{self.tabla}] {self.procesadas}/{self.total} ({pct:.1f}%) "
+                f"ok={self.ok} errores={self.errores} {self.pdfs_por_segundo:.0f} PDFs/s{eta_txt}")
+
+
+# --- Trabajo de cada proceso del pool ---
+
+def _init_worker():
+    # Un INFO por PDF desde N procesos ahoga el log: los workers solo avisan de problemas
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+
+def _renderizar(item):
+    """(clave, receta_data, destino, contrasena) -> (clave, ruta | None, error | None)."""
+    from services.pdf_generator import generate_receta_pdf
+
+    clave, receta_data, destino, contrasena = item
+    try:
+        return clave, generate_receta_pdf(receta_data, destino, contrasena=contrasena), None
+    except Exception as e:
+        return clave, None, f"{type(e).__name__}: {e}"
+
+
+# --- Lectura por bloques ---
+
+def _config(tabla: str) -> dict:
+    if tabla == "web":
+        return {"modelo": RecetaWeb, "pk": RecetaWeb.id, "medicamento": MedicamentoWeb,
+                "session": SessionLocal, "dir": GENERADOS_DIR}
+    if tabla == "local":
+        return {"modelo": RecetaLocal, "pk": RecetaLocal.id_receta, "medicamento": MedicamentoLocal,
+                "session": LocalSessionLocal, "dir": PDFS_LOCAL_DIR}
+    raise ValueError(f"Tabla no soportada: {tabla} (usar {', '.join(TABLAS)})")
+
+
+def _medicamentos(db, modelo_med, claves: list) -> dict:
+    por_receta = {c: [] for c in claves}
+    filas = db.execute(
+        select(modelo_med.receta_id, modelo_med.nombre, modelo_med.dosis, modelo_med.frecuencia, modelo_med.duracion)
+        .where(modelo_med.receta_id.in_(claves))
+        .order_by(modelo_med.receta_id, modelo_med.id)
+    )
+    for m in filas:
+        por_receta[m.receta_id].append(
+            {"nombre": m.nombre, "dosis": m.dosis, "frecuencia": m.frecuencia, "duracion": m.duracion}
+        )
+    return por_receta
+
+
+def _passwords_web(id_recetas: list) -> dict:
+    """{id_receta: (id web, pdf_password)} de las recetas locales que también existen en la BD web."""
+    db = SessionLocal()
+    try:
+        filas = db.execute(
+            select(RecetaWeb.id_receta, RecetaWeb.id, RecetaWeb.pdf_password).where(RecetaWeb.id_receta.in_(id_recetas))
+        )
+        return {f.id_receta: (f.id, f.pdf_password) for f in filas}
+    finally:
+        db.close()
+
+
+def _guardar(db, modelo, filas: list):
+    """UPDATE masivo por PK (executemany) y un solo commit."""
+    if not filas:
+        return
+    try:
+        db.execute(update(modelo), filas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _guardar_passwords_web(db, filas: list):
+    """Guarda en RecetaWeb las contraseñas nuevas (con `db` si ya es una sesión web)."""
+    if not filas:
+        return
+    if db is not None:
+        _guardar(db, RecetaWeb, filas)
+        return
+    web_db = SessionLocal()
+    try:
+        _guardar(web_db, RecetaWeb, filas)
+    finally:
+        web_db.close()
+
+
+def _preparar_bloque(tabla: str, cfg: dict, db, filas) -> tuple:
+    """
+    Items para el pool + contraseñas nuevas a guardar antes de renderizar:
+    (items, [{"id", "pdf_password"}] para RecetaWeb, [{"id_receta", "pdf_password"}] para RecetaLocal).
+    """
+    claves = [getattr(f, cfg["pk"].key) for f in filas]
+    medicamentos = _medicamentos(db, cfg["medicamento"], claves)
+    web_por_id_receta = _passwords_web([f.id_receta for f in filas]) if tabla == "local" else {}
+
+    items, passwords_web, passwords_local = [], [], []
+    for f, clave in zip(filas, claves):
+        if tabla == "web":
+            contrasena = f.pdf_password
+            if not contrasena:
+                contrasena = generar_password_pdf()
+                passwords_web.append({"id": clave, "pdf_password": contrasena})
+        else:
+            # La receta local usa su contraseña; si no tiene, la de la receta web o una nueva,
+            # que queda guardada en la fila local (y en la web si existe y no tenía)
+            id_web, contrasena_web = web_por_id_receta.get(f.id_receta, (None, None))
+            contrasena = f.pdf_password or contrasena_web or generar_password_pdf()
+            if not f.pdf_password:
+                passwords_local.append({"id_receta": clave, "pdf_password": contrasena})
+            if id_web is not None and not contrasena_web:
+                passwords_web.append({"id": id_web, "pdf_password": contrasena})
+        receta_data = {
+            "id_receta": f.id_receta,
+            "paciente_id": f.paciente_id,
+            "medico_id": f.medico_id,
+            "diagnostico": f.diagnostico,
+            "indicaciones": f.indicaciones,
+            "fecha_emision": f.fecha_emision.isoformat() if f.fecha_emision else None,
+            "checksum": f.checksum,
+            "medicamentos": medicamentos[clave],
+        }
+        destino = os.path.join(cfg["dir"], f"receta_{f.id_receta}.pdf")
+        items.append((clave, receta_data, destino, contrasena))
+    return items, passwords_web, passwords_local
+
+
+def regenerar_pdfs(tabla: str = "web", solo_faltantes: bool = True, workers: int = PDF_BACKFILL_WORKERS,
+                   chunk: int = PDF_BACKFILL_CHUNK, commit_cada: int = PDF_BACKFILL_COMMIT_EVERY,
+                   on_progreso: Optional[Callable[[ProgresoBackfill], None]] = None,
+                   detener: Optional[threading.Event] = None) -> ProgresoBackfill:
+    """
+    Regenera los PDFs de `tabla` ("web" o "local"). Con solo_faltantes=True
+    solo las filas con pdf_path NULL. Devuelve el progreso final.
+    """
+    cfg = _config(tabla)
+    modelo, pk = cfg["modelo"], cfg["pk"]
+    os.makedirs(cfg["dir"], exist_ok=True)
+
+    columnas = [pk, modelo.id_receta, modelo.paciente_id, modelo.medico_id, modelo.diagnostico,
+                modelo.indicaciones, modelo.fecha_emision, modelo.checksum, modelo.pdf_password]
+    columnas = list(dict.fromkeys(columnas))  # en local la PK es id_receta
+    filtros = [modelo.pdf_path.is_(None)] if solo_faltantes else []
+
+    db = cfg["session"]()
+    try:
+        total = db.scalar(select(func.count()).select_from(modelo).where(*filtros))
+        progreso = ProgresoBackfill(tabla=tabla, total=total)
+        logger.info(f"[BACKFILL] Regenerando {total} PDF(s) de recetas {tabla} con {workers} proceso(s)")
+
+        pool = None
+        if workers > 1:
+            # spawn: seguro aunque se lance desde un hilo del servidor (fork + hilos no lo es)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker)
+        try:
+            ultimo = None
+            pendientes = []
+            while True:
+                if detener is not None and detener.is_set():
+                    progreso.estado = "cancelado"
+                    break
+
+                stmt = select(*columnas).where(*filtros)
+                if ultimo is not None:
+                    stmt = stmt.where(pk > ultimo)
+                filas = db.execute(stmt.order_by(pk).limit(chunk)).all()
+                if not filas:
+                    break
+                ultimo = getattr(filas[-1], pk.key)
+
+                items, passwords_web, passwords_local = _preparar_bloque(tabla, cfg, db, filas)
+                # Las contraseñas nuevas se guardan antes de cifrar nada: si el proceso
+                # muere a mitad, ningún PDF en disco queda con una contraseña perdida
+                _guardar_passwords_web(db if tabla == "web" else None, passwords_web)
+                _guardar(db, RecetaLocal, passwords_local)
+                if pool is not None:
+                    resultados = pool.map(_renderizar, items, chunksize=max(1, len(items) // (workers * 4)))
+                else:
+                    resultados = map(_renderizar, items)
+
+                for clave, ruta, error in resultados:
+                    if error:
+                        progreso.errores += 1
+                        if progreso.errores <= _MAX_ERRORES_LOG:
+                            logger.warning(f"[BACKFILL] Receta {clave}: {error}")
+                        continue
+                    progreso.ok += 1
+                    pendientes.append({pk.key: clave, "pdf_path": ruta})
+
+                if len(pendientes) >= commit_cada:
+                    _guardar(db, modelo, pendientes)
+                    pendientes = []
+
+                progreso.procesadas += len(filas)
+                progreso.duracion = time.monotonic() - progreso.inicio
+                logger.info(f"[BACKFILL] {progreso}")
+                if on_progreso:
+                    on_progreso(progreso)
+
+            _guardar(db, modelo, pendientes)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        if progreso.estado == "en_proceso":
+            progreso.estado = "completado"
+        progreso.duracion = time.monotonic() - progreso.inicio
+        logger.info(f"[BACKFILL] Fin ({progreso.estado}): {progreso}")
+        if on_progreso:
+            on_progreso(progreso)
+        return progreso
+    finally:
+        db.close()
+
+
+# --- Ejecución en segundo plano (endpoint de administración) ---
+
+_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+_detener = threading.Event()
+_estado: Optional[dict] = None
+
+
+def estado_backfill() -> Optional[dict]:
+    with _lock:
+        return dict(_estado) if _estado else None
+
+
+def iniciar_backfill(tabla: str, solo_faltantes: bool = True, workers: int = PDF_BACKFILL_WORKERS) -> dict:
+    """Lanza regenerar_pdfs en un hilo. Lanza RuntimeError si ya hay una regeneración en curso."""
+    global _hilo, _estado
+    _config(tabla)  # valida la tabla antes de lanzar el hilo
+
+    with _lock:
+        if _hilo is not None and _hilo.is_alive():
+            raise RuntimeError("Ya hay una regeneración de PDFs en curso")
+        _detener.clear()
+        _estado = {"tabla": tabla, "estado": "iniciando", "solo_faltantes": solo_faltantes, "workers": workers}
+
+    def publicar(progreso: ProgresoBackfill):
+        global _estado
+        with _lock:
+            _estado = {**progreso.as_dict(), "solo_faltantes": solo_faltantes, "workers": workers}
+
+    def ejecutar():
+        global _estado
+        try:
+            regenerar_pdfs(tabla, solo_faltantes, workers, on_progreso=publicar, detener=_detener)
+        except Exception as e:
+            logger.error(f"[BACKFILL] Error: {e}", exc_info=True)
+            with _lock:
+                _estado = {**(_estado or {}), "estado": "error", "error": str(e)}
+
+    _hilo = threading.Thread(target=ejecutar, name="pdf-backfill", daemon=True)
+    _hilo.start()
+    return estado_backfill()
+
+
+def cancelar_backfill() -> bool:
+    """Pide parar tras el bloque en curso. Devuelve False si no había nada en marcha."""
+    if _hilo is None or not _hilo.is_alive():
+        return False
+    _detener.set()
+    return True
@@ -2,34 +2,50 @@ from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.pdfgen import canvas
+from reportlab.lib.pdfencrypt import StandardEncryption
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from xml.sax.saxutils import escape
 from datetime import datetime
+from typing import Optional
 from core.logger import logger
+import io
 import os
+import threading
 
-def generate_receta_pdf(receta_data: dict, output_path: str) -> str:
+# Cifrado de los PDF con contraseña: 40 o 128 (RC4, como PyPDF2) o 256 (AES, requiere pyaes)
+PDF_ENCRYPTION_STRENGTH = int(os.getenv("PDF_ENCRYPTION_STRENGTH", "128"))
+
+
+def _texto(valor, defecto: str = "") -> str:
+    """Texto de usuario listo para Paragraph (los <, > y & no se interpretan como marcado)."""
+    if valor is None or valor == "":
+        valor = defecto
+    return escape(str(valor)).replace("\n", "<br/>")
+
+
+class RecetaPdfRenderer:
     """
-    Genera un PDF de receta a partir de un dict de datos.
-    
-    Args:
-        receta_data: dict con id_receta, paciente_id, medico_id, diagnostico, indicaciones, etc
-        output_path: ruta donde guardar el PDF
-    
-    Returns:
-        Path del archivo generado
+    Plantilla de PDF de receta "precompilada".
+
+    Hojas de estilo, ParagraphStyle, TableStyle y los elementos fijos de la
+    página (título, encabezados de sección, espaciadores) se construyen una
+    vez en __init__; render() solo crea los flowables con los datos de cada
+    receta. Los flowables fijos se reutilizan entre documentos, por eso una
+    instancia no debe usarse desde varios hilos a la vez (ver get_renderer()).
     """
-    try:
-        # Crear directorio si no existe
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Crear PDF
-        doc = SimpleDocTemplate(output_path, pagesize=letter)
+
+    COL_INFO = [2 * inch, 3.5 * inch]
+    COL_MEDICAMENTOS = [2.2 * inch, 1.4 * inch, 1.6 * inch, 1.3 * inch]
+    CAMPOS_MEDICAMENTO = ("nombre", "dosis", "frecuencia", "duracion")
+    PADDING_CELDA = 12  # LEFTPADDING + RIGHTPADDING por defecto de Table
+
+    def __init__(self, pagesize=letter):
+        self.pagesize = pagesize
         styles = getSampleStyleSheet()
-        story = []
-        
-        # Título
-        title_style = ParagraphStyle(
+        self.normal = styles['Normal']
+        self.heading2 = styles['Heading2']
+        self.title_style = ParagraphStyle(
             'CustomTitle',
             parent=styles['Heading1'],
             fontSize=24,
@@ -37,19 +53,16 @@ def generate_receta_pdf(receta_data: dict, output_path: str) -> str:
             spaceAfter=30,
             alignment=1  # Center
         )
-        story.append(Paragraph("RECETA MÉDICA", title_style))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Información básica
-        info_data = [
-            ["ID RECETA:", receta_data.get('id_receta', 'N/A')],
-            ["FECHA EMISIÓN:", receta_data.get('fecha_emision', datetime.utcnow().isoformat())],
-            ["PACIENTE ID:", receta_data.get('paciente_id', 'N/A')],
-            ["MÉDICO ID:", receta_data.get('medico_id', 'N/A')],
-        ]
-        
-        info_table = Table(info_data, colWidths=[2*inch, 3.5*inch])
-        info_table.setStyle(TableStyle([
+        self.footer_style = ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=colors.grey,
+            alignment=1
+        )
+        self.celda_style = ParagraphStyle('Celda', parent=styles['Normal'], fontSize=9, leading=11)
+
+        self.info_table_style = TableStyle([
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8e8e8')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
@@ -57,40 +70,136 @@ def generate_receta_pdf(receta_data: dict, output_path: str) -> str:
             ('FONTSIZE', (0, 0), (-1, -1), 10),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        story.append(info_table)
-        story.append(Spacer(1, 0.4*inch))
-        
-        # Diagnóstico
-        story.append(Paragraph("<b>DIAGNÓSTICO:</b>", styles['Heading2']))
-        diagnostico = receta_data.get('diagnostico', 'No especificado')
-        story.append(Paragraph(diagnostico, styles['Normal']))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Indicaciones
-        story.append(Paragraph("<b>INDICACIONES/MEDICAMENTOS:</b>", styles['Heading2']))
-        indicaciones = receta_data.get('indicaciones', 'No especificadas')
-        story.append(Paragraph(indicaciones, styles['Normal']))
-        story.append(Spacer(1, 0.5*inch))
-        
-        # Pie de página
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            textColor=colors.grey,
-            alignment=1
-        )
-        story.append(Paragraph(
-            f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}<br/>Checksum: {receta_data.get('checksum', 'N/A')[:16]}...",
-            footer_style
-        ))
-        
-        # Construir PDF
-        doc.build(story)
-        logger.info(f"[PDF] ✅ PDF generado: {output_path}")
+        ])
+        self.medicamentos_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTNAME', (0, 1), (-1, -1), self.celda_style.fontName),
+            ('FONTSIZE', (0, 1), (-1, -1), self.celda_style.fontSize),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f4f6fa')]),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ])
+
+        # Elementos fijos de la página
+        self.titulo = Paragraph("RECETA MÉDICA", self.title_style)
+        self.h_diagnostico = Paragraph("<b>DIAGNÓSTICO:</b>", self.heading2)
+        self.h_medicamentos = Paragraph("<b>MEDICAMENTOS:</b>", self.heading2)
+        self.h_indicaciones = Paragraph("<b>INDICACIONES:</b>", self.heading2)
+        self.sin_medicamentos = Paragraph("Sin medicamentos registrados", self.normal)
+        self.espacio_03 = Spacer(1, 0.3 * inch)
+        self.espacio_04 = Spacer(1, 0.4 * inch)
+        self.espacio_05 = Spacer(1, 0.5 * inch)
+        self.cabecera_medicamentos = ["Medicamento", "Dosis", "Frecuencia", "Duración"]
+        self._anchos_texto = [w - self.PADDING_CELDA for w in self.COL_MEDICAMENTOS]
+
+    def _celda(self, valor, ancho: float):
+        # Un Paragraph cuesta parseo + wrap + breakLines; solo hace falta si el texto no cabe en una línea
+        texto = "" if valor is None else str(valor)
+        if "\n" not in texto and stringWidth(texto, self.celda_style.fontName, self.celda_style.fontSize) <= ancho:
+            return texto
+        return Paragraph(_texto(texto), self.celda_style)
+
+    def _tabla_medicamentos(self, medicamentos: list):
+        if not medicamentos:
+            return self.sin_medicamentos
+        filas = [self.cabecera_medicamentos]
+        for m in medicamentos:
+            filas.append([
+                self._celda(m.get(campo), ancho)
+                for campo, ancho in zip(self.CAMPOS_MEDICAMENTO, self._anchos_texto)
+            ])
+        tabla = Table(filas, colWidths=self.COL_MEDICAMENTOS, repeatRows=1)
+        tabla.setStyle(self.medicamentos_table_style)
+        return tabla
+
+    def story(self, receta_data: dict) -> list:
+        """Flowables de una receta: fijos + contenido de `receta_data`."""
+        info_data = [
+            ["ID RECETA:", receta_data.get('id_receta') or 'N/A'],
+            ["FECHA EMISIÓN:", receta_data.get('fecha_emision') or datetime.utcnow().isoformat()],
+            ["PACIENTE ID:", receta_data.get('paciente_id') or 'N/A'],
+            ["MÉDICO ID:", receta_data.get('medico_id') or 'N/A'],
+        ]
+        info_table = Table(info_data, colWidths=self.COL_INFO)
+        info_table.setStyle(self.info_table_style)
+
+        checksum = (receta_data.get('checksum') or 'N/A')[:16]
+        return [
+            self.titulo,
+            self.espacio_03,
+            info_table,
+            self.espacio_04,
+            self.h_diagnostico,
+            Paragraph(_texto(receta_data.get('diagnostico'), 'No especificado'), self.normal),
+            self.espacio_03,
+            self.h_medicamentos,
+            self._tabla_medicamentos(receta_data.get('medicamentos') or []),
+            self.espacio_03,
+            self.h_indicaciones,
+            Paragraph(_texto(receta_data.get('indicaciones'), 'No especificadas'), self.normal),
+            self.espacio_05,
+            Paragraph(
+                f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}<br/>Checksum: {escape(checksum)}...",
+                self.footer_style
+            ),
+        ]
+
+    def render(self, receta_data: dict, destino, contrasena: Optional[str] = None) -> None:
+        """
+        Escribe el PDF en `destino` (ruta o archivo binario, p.ej. BytesIO).
+        Con `contrasena`, ReportLab cifra los objetos mientras los escribe:
+        no hace falta releer el PDF para protegerlo.
+        """
+        encrypt = StandardEncryption(contrasena, strength=PDF_ENCRYPTION_STRENGTH) if contrasena else None
+        doc = SimpleDocTemplate(destino, pagesize=self.pagesize, encrypt=encrypt)
+        doc.build(self.story(receta_data))
+
+    def render_bytes(self, receta_data: dict, contrasena: Optional[str] = None) -> bytes:
+        buffer = io.BytesIO()
+        self.render(receta_data, buffer, contrasena)
+        return buffer.getvalue()
+
+
+_local = threading.local()
+
+
+def get_renderer() -> RecetaPdfRenderer:
+    """Renderer del hilo actual (se construye una vez por hilo/proceso)."""
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = _local.renderer = RecetaPdfRenderer()
+    return renderer
+
+
+def generate_receta_pdf(receta_data: dict, output_path: str, contrasena: Optional[str] = None) -> str:
+    """
+    Genera un PDF de receta a partir de un dict de datos.
+
+    Args:
+        receta_data: dict con id_receta, paciente_id, medico_id, diagnostico, indicaciones,
+                     medicamentos (lista de dicts nombre/dosis/frecuencia/duracion), etc
+        output_path: ruta donde guardar el PDF
+        contrasena: si se indica, el PDF sale ya protegido (un solo archivo, sin copia sin cifrar)
+
+    Returns:
+        Path del archivo generado
+    """
+    try:
+        # Crear directorio si no existe
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        # Se renderiza en memoria y se escribe una sola vez (tmp + replace: nunca queda un PDF a medias)
+        data = get_renderer().render_bytes(receta_data, contrasena)
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+        logger.info(f"[PDF] ✅ PDF generado{' y protegido' if contrasena else ''}: {output_path}")
         return output_path
-    
+
     except Exception as e:
         logger.error(f"[PDF] ❌ Error generando PDF: {e}", exc_info=True)
         raise
@@ -5,7 +5,9 @@ from core.logger import logger
 
 def proteger_pdf_con_contrasena(pdf_path: str, contrasena: str, output_path: str = None) -> str:
     """
-    Protege un PDF con contraseña.
+    Protege un PDF YA EXISTENTE con contraseña (relee y reescribe el archivo).
+    Los PDFs nuevos salen cifrados directamente de
+    generate_receta_pdf(..., contrasena=...), sin este segundo paso.
     
     Args:
         pdf_path: ruta del PDF original
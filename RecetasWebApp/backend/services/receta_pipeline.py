@@ -0,0 +1,275 @@
+# backend/services/receta_pipeline.py
+"""
+Pipeline post-commit de las recetas creadas desde la web.
+
+POST /recetas solo deja durables la fila y el XML; el resto se hace aquí, en
+segundo plano, como trabajos de la cola persistente (services/job_queue.py):
+
+  receta_pdf      → genera el PDF, lo protege y guarda ruta + contraseña
+                    (al terminar encola receta_email)
+  receta_email    → envía el PDF al paciente (al terminar encola receta_password)
+  receta_password → envía la contraseña del PDF en un segundo correo
+  receta_upload   → sube el XML a Drive y marca la receta como enviada
+
+Los dos correos son etapas separadas: si falla el de la contraseña solo se
+reintenta ese, el paciente no recibe el PDF repetido.
+
+Cada etapa se reintenta con backoff si el error es transitorio y acaba en
+dead letter si no; GET /recetas/{id}/estado expone el estado de cada una.
+"""
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from core.logger import logger
+from database.base import SessionLocal, DATA_DIR
+from database.web_models import RecetaWeb, MedicamentoWeb, PacienteWeb, MedicoWeb
+from services import job_queue
+from services.retry import ErrorReintentable
+
+COLA_PDF = "receta_pdf"
+COLA_EMAIL = "receta_email"
+COLA_PASSWORD = "receta_password"
+COLA_UPLOAD = "receta_upload"
+# Nombre de la etapa (para la API) → cola
+ETAPAS = {"pdf": COLA_PDF, "email": COLA_EMAIL, "password": COLA_PASSWORD, "upload": COLA_UPLOAD}
+
+GENERADOS_DIR = os.path.join(DATA_DIR, "generados")
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_POLL_SECONDS = float(os.getenv("PIPELINE_POLL_SECONDS", "5"))
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "20"))
+# false si las etapas las procesa otro proceso (p.ej. python -m services.receta_pipeline)
+PIPELINE_ENABLED = os.getenv("PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_despertar = threading.Event()
+_detener = threading.Event()
+_hilo: Optional[threading.Thread] = None
+
+
+class EtapaPendiente(ErrorReintentable):
+    """La etapa no puede hacerse todavía (p.ej. el correo sin PDF): se reintenta con backoff."""
+
+
+def ruta_xml(id_receta: str) -> str:
+    return os.path.join(GENERADOS_DIR, f"receta_{id_receta}.xml")
+
+
+def id_receta_de_archivo(archivo: str) -> str:
+    nombre = os.path.basename(archivo)
+    if nombre.startswith("receta_"):
+        nombre = nombre[len("receta_"):]
+    if nombre.endswith(".xml"):
+        nombre = nombre[:-len(".xml")]
+    return nombre
+
+
+def encolar_receta(xml_path: str):
+    """Encola las etapas de una receta recién creada y despierta al worker."""
+    job_queue.encolar(COLA_PDF, [xml_path])
+    job_queue.encolar(COLA_UPLOAD, [xml_path])
+    _despertar.set()
+
+
+def estado_receta(id_receta: str) -> Dict[str, dict]:
+    """Estado de cada etapa: {"pdf": {...}, "email": {...}, "password": {...}, "upload": {...}}."""
+    por_cola = job_queue.estado_por_archivo(ruta_xml(id_receta), list(ETAPAS.values()))
+    return {etapa: por_cola.get(cola) for etapa, cola in ETAPAS.items()}
+
+
+def generar_password_pdf() -> str:
+    """Contraseña aleatoria (CSPRNG) distinta para cada PDF, como en jobs/receiver_job.py."""
+    return secrets.token_urlsafe(12)
+
+
+def etapa_pdf(archivo: str):
+    from services.pdf_generator import generate_receta_pdf
+
+    id_receta = id_receta_de_archivo(archivo)
+    db = SessionLocal()
+    try:
+        receta = db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta).first()
+        if not receta:
+            raise LookupError(f"Receta {id_receta} no encontrada")
+
+        receta_data = {
+            "id_receta": receta.id_receta,
+            "paciente_id": receta.paciente_id,
+            "medico_id": receta.medico_id,
+            "diagnostico": receta.diagnostico,
+            "indicaciones": receta.indicaciones,
+            "fecha_emision": receta.fecha_emision.isoformat() if receta.fecha_emision else None,
+            "checksum": receta.checksum,
+            "medicamentos": [
+                {"nombre": m.nombre, "dosis": m.dosis, "frecuencia": m.frecuencia, "duracion": m.duracion}
+                for m in db.query(MedicamentoWeb).filter(MedicamentoWeb.receta_id == receta.id).order_by(MedicamentoWeb.id)
+            ],
+        }
+        # PDF protegido con contraseña, generado y cifrado en un solo paso
+        pdf_password = generar_password_pdf()
+        receta.pdf_path = generate_receta_pdf(
+            receta_data, os.path.join(GENERADOS_DIR, f"receta_{id_receta}.pdf"), contrasena=pdf_password
+        )
+        receta.pdf_password = pdf_password
+        db.commit()
+        logger.info(f"[PIPELINE] PDF generado para receta {id_receta}: {receta.pdf_path}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    job_queue.encolar(COLA_EMAIL, [archivo])
+    _despertar.set()
+
+
+def _datos_correo(id_receta: str):
+    """(correo, nombre del paciente, nombre del médico, pdf_path, pdf_password) de la receta."""
+    db = SessionLocal()
+    try:
+        receta = db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta).first()
+        if not receta:
+            raise LookupError(f"Receta {id_receta} no encontrada")
+        if not receta.pdf_path or not receta.pdf_password:
+            raise EtapaPendiente(f"Receta {id_receta} todavía sin PDF")
+        paciente = db.get(PacienteWeb, receta.paciente_id)
+        medico = db.get(MedicoWeb, receta.medico_id)
+        if not paciente or not paciente.correo:
+            return None, None, None, None, None
+        return (paciente.correo, f"{paciente.nombre} {paciente.apellido}", medico.nombre if medico else "",
+                receta.pdf_path, receta.pdf_password)
+    finally:
+        db.close()
+
+
+def etapa_email(archivo: str):
+    from services.email_sender import EmailSender, EMAIL_PASSWORD_DELAY_SECONDS
+
+    id_receta = id_receta_de_archivo(archivo)
+    correo, paciente_nombre, medico_nombre, pdf_path, pdf_password = _datos_correo(id_receta)
+    if not correo:
+        logger.warning(f"[PIPELINE] Receta {id_receta}: paciente sin correo, no se envía")
+        return
+
+    enviado = EmailSender("gmail").enviar_receta_pdf(correo, pdf_path, pdf_password, paciente_nombre, medico_nombre)
+    if not enviado:
+        # EmailSender registra el detalle y devuelve False: se trata como transitorio
+        raise ConnectionError(f"No se pudo enviar el correo con el PDF de la receta {id_receta}")
+    logger.info(f"[PIPELINE] PDF enviado por correo para receta {id_receta}")
+
+    # El correo de la contraseña es otra etapa: un fallo ahí no reenvía el PDF
+    job_queue.encolar(COLA_PASSWORD, [archivo], retraso_segundos=EMAIL_PASSWORD_DELAY_SECONDS)
+    _despertar.set()
+
+
+def etapa_password(archivo: str):
+    from services.email_sender import EmailSender
+
+    id_receta = id_receta_de_archivo(archivo)
+    correo, paciente_nombre, _, _, pdf_password = _datos_correo(id_receta)
+    if not correo:
+        logger.warning(f"[PIPELINE] Receta {id_receta}: paciente sin correo, no se envía la contraseña")
+        return
+
+    if not EmailSender("gmail").enviar_contrasena_pdf(correo, pdf_password, paciente_nombre):
+        raise ConnectionError(f"No se pudo enviar la contraseña de la receta {id_receta}")
+    logger.info(f"[PIPELINE] Contraseña enviada por correo para receta {id_receta}")
+
+
+def etapa_upload(archivo: str):
+    from services.drive_service import upload_xml_bytes, FOLDER_OUTBOX_ID
+
+    id_receta = id_receta_de_archivo(archivo)
+    with open(archivo, "rb") as f:
+        xml_bytes = f.read()
+    res = upload_xml_bytes(os.path.basename(archivo), xml_bytes, FOLDER_OUTBOX_ID)
+
+    db = SessionLocal()
+    try:
+        db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta).update(
+            {RecetaWeb.sent: True}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(f"[PIPELINE] XML de receta {id_receta} subido -> {res}")
+
+
+_HANDLERS = {COLA_PDF: etapa_pdf, COLA_EMAIL: etapa_email, COLA_PASSWORD: etapa_password, COLA_UPLOAD: etapa_upload}
+
+
+def _ejecutar(trabajo):
+    try:
+        _HANDLERS[trabajo.cola](trabajo.archivo)
+        job_queue.completar(trabajo.id)
+        return True
+    except Exception as e:
+        job_queue.programar_reintento(trabajo, e)
+        return False
+
+
+def procesar_pendientes(limite: int = PIPELINE_BATCH_SIZE, executor: Optional[ThreadPoolExecutor] = None) -> int:
+    """Reclama y ejecuta los trabajos listos de todas las colas del pipeline. Devuelve cuántos se procesaron."""
+    trabajos = []
+    for cola in _HANDLERS:
+        trabajos.extend(job_queue.reclamar(cola, limite))
+    if not trabajos:
+        return 0
+
+    if executor is None:
+        for trabajo in trabajos:
+            _ejecutar(trabajo)
+    else:
+        list(executor.map(_ejecutar, trabajos))
+    return len(trabajos)
+
+
+def _loop():
+    logger.info(f"[PIPELINE] Worker iniciado ({PIPELINE_WORKERS} hilos)")
+    with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline") as executor:
+        while not _detener.is_set():
+            try:
+                # Vaciar lo que esté listo antes de volver a dormir
+                while not _detener.is_set() and procesar_pendientes(executor=executor):
+                    pass
+            except Exception as e:
+                logger.error(f"[PIPELINE] Error en el worker: {e}", exc_info=True)
+            _despertar.wait(PIPELINE_POLL_SECONDS)
+            _despertar.clear()
+    logger.info("[PIPELINE] Worker detenido")
+
+
+def iniciar_pipeline():
+    """Arranca el worker en un hilo daemon (idempotente)."""
+    global _hilo
+    if not PIPELINE_ENABLED:
+        logger.info("[PIPELINE] Deshabilitado en este proceso (PIPELINE_ENABLED=false)")
+        return
+    if _hilo and _hilo.is_alive():
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_loop, name="receta-pipeline", daemon=True)
+    _hilo.start()
+
+
+def detener_pipeline(timeout: float = 10):
+    _detener.set()
+    _despertar.set()
+    if _hilo:
+        _hilo.join(timeout)
+
+
+if __name__ == "__main__":
+    # Worker dedicado: python -m services.receta_pipeline
+    PIPELINE_ENABLED = True
+    iniciar_pipeline()
+    try:
+        while _hilo.is_alive():
+            _hilo.join(1)
+    except KeyboardInterrupt:
+        detener_pipeline()
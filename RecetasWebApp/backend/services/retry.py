@@ -0,0 +1,63 @@
+# backend/services/retry.py
+import os
+import time
+import random
+import socket
+from core.logger import logger
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("DRIVE_RETRY_MAX_ATTEMPTS", "6"))
+RETRY_BASE_SECONDS = float(os.getenv("DRIVE_RETRY_BASE_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.getenv("DRIVE_RETRY_MAX_SECONDS", "900"))
+
+# Códigos HTTP de Drive que vale la pena reintentar
+_HTTP_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+
+
+class ErrorReintentable(Exception):
+    """Error propio de la aplicación que se reintenta con backoff aunque no sea de red."""
+
+
+def calcular_backoff(intento: int, base: float = RETRY_BASE_SECONDS, maximo: float = RETRY_MAX_SECONDS) -> float:
+    """
+    Segundos de espera antes del reintento número `intento` (1, 2, 3...).
+    Backoff exponencial con "full jitter": uniforme en [0, min(maximo, base * 2^(intento-1))],
+    así los fallos simultáneos no se reintentan todos a la vez.
+    """
+    techo = min(maximo, base * (2 ** max(intento - 1, 0)))
+    return random.uniform(0, techo)
+
+
+def es_transitorio(error: Exception) -> bool:
+    """True si el error parece temporal (red, timeout, 429/5xx de Drive) o es un ErrorReintentable."""
+    if isinstance(error, ErrorReintentable):
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout)):
+        return True
+
+    status = getattr(getattr(error, "resp", None), "status", None)  # googleapiclient.errors.HttpError
+    if status is not None:
+        try:
+            return int(status) in _HTTP_TRANSITORIOS
+        except (TypeError, ValueError):
+            return False
+
+    nombre = type(error).__name__
+    # RefreshError no: un refresh token revocado (invalid_grant) no se arregla reintentando;
+    # los fallos de red durante el refresh ya llegan como TransportError
+    return nombre in ("TransportError", "ServerNotFoundError", "IncompleteRead")
+
+
+def con_reintentos(func, *args, intentos: int = 3, etiqueta: str = "RETRY", **kwargs):
+    """
+    Ejecuta func(*args, **kwargs) reintentando errores transitorios con backoff.
+    Los errores permanentes se relanzan inmediatamente.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if intento >= intentos or not es_transitorio(e):
+                raise
+            espera = calcular_backoff(intento)
+            logger.warning(f"[{etiqueta}] Error transitorio ({e}); reintento {intento}/{intentos - 1} en {espera:.1f}s")
+            time.sleep(espera)
@@ -0,0 +1,134 @@
+# backend/services/signing.py
+"""
+Firma electrónica de los XML de receta.
+
+La clave privada (SIGNING_KEY_PATH, opcionalmente cifrada con
+SIGNING_KEY_PASSWORD) se carga y descifra una sola vez por proceso; solo se
+vuelve a cargar si el archivo cambia en disco (mtime/tamaño), así rotar la
+clave no requiere reiniciar. El KDF de una clave cifrada ya no se paga en
+cada POST /recetas.
+"""
+import os
+import base64
+import threading
+from typing import Iterable, List, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from cryptography.exceptions import InvalidSignature
+from core.logger import logger
+
+SIGNING_KEY_PATH = os.getenv("SIGNING_KEY_PATH", "")
+SIGNING_PUB_KEY_PATH = os.getenv("SIGNING_PUB_KEY_PATH", "")
+
+
+class SigningService:
+    """Clave de firma cacheada con recarga por cambio de archivo. Seguro entre hilos."""
+
+    def __init__(self, key_path: str = SIGNING_KEY_PATH, pub_key_path: str = SIGNING_PUB_KEY_PATH,
+                 password: Optional[str] = None):
+        self.key_path = key_path
+        self.pub_key_path = pub_key_path
+        self.password = password if password is not None else (os.getenv("SIGNING_KEY_PASSWORD") or None)
+        self._lock = threading.Lock()
+        self._private_key = None
+        self._public_key = None
+        self._firma_archivo = None      # (mtime_ns, size) de la clave privada cargada
+        self._firma_pub = None          # idem para la clave pública
+        self.cargas = 0
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @property
+    def disponible(self) -> bool:
+        """True si hay clave privada configurada y existe en disco."""
+        return bool(self.key_path) and os.path.exists(self.key_path)
+
+    def _clave_privada(self):
+        estado = self._stat(self.key_path) if self.key_path else None
+        if estado is None:
+            raise FileNotFoundError(f"Clave de firma no encontrada: {self.key_path or '(SIGNING_KEY_PATH vacío)'}")
+        if estado == self._firma_archivo:
+            return self._private_key
+
+        with self._lock:
+            if estado != self._firma_archivo:
+                with open(self.key_path, "rb") as f:
+                    key_data = f.read()
+                password = self.password.encode() if self.password else None
+                self._private_key = load_pem_private_key(key_data, password=password)
+                self._firma_archivo = estado
+                self.cargas += 1
+                logger.info(f"[FIRMA] Clave privada cargada: {self.key_path}")
+            return self._private_key
+
+    def _clave_publica(self):
+        if self.pub_key_path:
+            estado = self._stat(self.pub_key_path)
+            if estado is not None:
+                if estado != self._firma_pub:
+                    with self._lock:
+                        if estado != self._firma_pub:
+                            with open(self.pub_key_path, "rb") as f:
+                                self._public_key = load_pem_public_key(f.read())
+                            self._firma_pub = estado
+                return self._public_key
+        # Sin clave pública configurada: derivarla de la privada
+        return self._clave_privada().public_key()
+
+    @staticmethod
+    def _firmar_con(key, data: bytes) -> bytes:
+        if isinstance(key, rsa.RSAPrivateKey):
+            return key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        if isinstance(key, ec.EllipticCurvePrivateKey):
+            return key.sign(data, ec.ECDSA(hashes.SHA256()))
+        return key.sign(data)  # Ed25519 / Ed448
+
+    def firmar(self, data: bytes) -> bytes:
+        """Firma `data` (RSA PKCS#1 v1.5 + SHA-256, como hasta ahora)."""
+        return self._firmar_con(self._clave_privada(), data)
+
+    def firmar_b64(self, data: bytes) -> str:
+        return base64.b64encode(self.firmar(data)).decode()
+
+    def firmar_lote(self, items: Iterable[bytes]) -> List[str]:
+        """Firma varios documentos (importaciones masivas) con una sola resolución de la clave."""
+        key = self._clave_privada()
+        return [base64.b64encode(self._firmar_con(key, data)).decode() for data in items]
+
+    def verificar(self, data: bytes, firma) -> bool:
+        """Comprueba una firma (bytes o base64) contra la clave pública."""
+        if isinstance(firma, str):
+            firma = base64.b64decode(firma)
+        key = self._clave_publica()
+        try:
+            if isinstance(key, rsa.RSAPublicKey):
+                key.verify(firma, data, padding.PKCS1v15(), hashes.SHA256())
+            elif isinstance(key, ec.EllipticCurvePublicKey):
+                key.verify(firma, data, ec.ECDSA(hashes.SHA256()))
+            else:
+                key.verify(firma, data)
+            return True
+        except InvalidSignature:
+            return False
+
+
+_service: Optional[SigningService] = None
+_service_lock = threading.Lock()
+
+
+def get_signing_service() -> SigningService:
+    """Instancia compartida del proceso (configurada con SIGNING_KEY_PATH)."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = SigningService()
+    return _service
@@ -0,0 +1,102 @@
+# backend/services/streaming_export.py
+"""
+Exportaciones masivas en streaming (NDJSON o CSV).
+
+Las filas se leen con yield_per (cursor del lado del servidor en PostgreSQL,
+lectura incremental en SQLite) y se escriben al cliente por bloques, así la
+memoria no depende del número de filas y el primer byte sale de inmediato.
+"""
+import io
+import os
+import csv
+import json
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, List, Sequence
+
+from fastapi.responses import StreamingResponse
+
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _valor(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+def iter_bloques(query, tamano: int = EXPORT_YIELD_PER) -> Iterator[list]:
+    """Recorre la consulta con yield_per y entrega listas de como mucho `tamano` filas."""
+    bloque = []
+    for fila in query.yield_per(tamano):
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def _celda(v):
+    # Los campos anidados (p.ej. medicamentos) van como JSON dentro de la celda
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, ensure_ascii=False)
+    return _valor(v)
+
+
+def _ndjson(bloques: Iterable[List[dict]]) -> Iterator[bytes]:
+    for bloque in bloques:
+        yield "".join(
+            json.dumps({k: _valor(v) for k, v in fila.items()}, ensure_ascii=False) + "\n"
+            for fila in bloque
+        ).encode("utf-8")
+
+
+def _csv(bloques: Iterable[List[dict]], campos: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(campos)
+    # La cabecera sale sola para que el cliente reciba el primer byte sin esperar a la consulta
+    yield buffer.getvalue().encode("utf-8")
+
+    for bloque in bloques:
+        buffer.seek(0)
+        buffer.truncate(0)
+        for fila in bloque:
+            writer.writerow([_celda(fila.get(c)) for c in campos])
+        yield buffer.getvalue().encode("utf-8")
+
+
+def streaming_export(session_factory: Callable, generar_filas: Callable, formato: str,
+                     campos: Sequence[str], nombre: str) -> StreamingResponse:
+    """
+    Construye la respuesta de exportación.
+
+    `generar_filas(db)` debe devolver un iterable de bloques (listas de dicts).
+    La sesión se abre y se cierra dentro del generador: vive lo que dura la
+    descarga, no la función del endpoint.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    def cuerpo():
+        db = session_factory()
+        try:
+            bloques = generar_filas(db)
+            if formato == "csv":
+                yield from _csv(bloques, campos)
+            else:
+                yield from _ndjson(bloques)
+        finally:
+            db.close()
+
+    filename = f"{nombre}_{datetime.now():%Y%m%d_%H%M%S}.{formato}"
+    return StreamingResponse(
+        cuerpo(),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
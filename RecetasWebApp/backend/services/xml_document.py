@@ -0,0 +1,42 @@
+# backend/services/xml_document.py
+import os
+from typing import Tuple
+from lxml import etree
+from services.checksum import validar_checksum_root
+from services.xsd_validator import validate_xml_tree
+from services.xml_generator import extraer_datos_receta
+
+
+class XmlDocument:
+    """
+    Documento XML parseado UNA sola vez.
+
+    Todas las etapas del receiver (XSD, checksum y extracción de campos)
+    trabajan sobre el mismo árbol en lugar de volver a leer el archivo.
+    """
+
+    def __init__(self, data: bytes, name: str = ""):
+        self.name = name
+        # Sin remove_blank_text: el checksum depende del texto EXACTO
+        parser = etree.XMLParser(remove_blank_text=False)
+        self.root = etree.fromstring(data, parser)
+
+    @classmethod
+    def from_path(cls, xml_path: str) -> "XmlDocument":
+        with open(xml_path, "rb") as f:
+            return cls(f.read(), os.path.basename(xml_path))
+
+    def validate(self, xsd_filename: str) -> Tuple[bool, str]:
+        """Valida contra el XSD (compilado y cacheado)."""
+        return validate_xml_tree(self.root, xsd_filename)
+
+    def validar_checksum(self):
+        """Mismo resultado que services.checksum.validar_checksum()."""
+        return validar_checksum_root(self.root)
+
+    def findtext(self, path: str, default=None):
+        return self.root.findtext(path, default)
+
+    def datos_receta(self) -> dict:
+        """Campos de la receta (ver services.xml_generator.parse_receta_xml)."""
+        return extraer_datos_receta(self.root)
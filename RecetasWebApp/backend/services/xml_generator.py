@@ -1,98 +1,51 @@
 # backend/services/xml_generator.py
 import uuid
+from dataclasses import dataclass
 from lxml import etree
 from datetime import datetime
 from core.logger import logger
 import hashlib
 
 XSI_NS = "http://www.w3.org/2001/XMLSchema-instance"
+# Así serializa lxml (pretty_print) el <checksum> vacío sobre el que se calcula el hash
+_CHECKSUM_VACIO = b"<checksum></checksum>"
+_CIERRE_METADATOS = b"  </metadatos>"
+# Misma declaración que etree.tostring(..., xml_declaration=True, encoding="utf-8")
+_DECLARACION = b"<?xml version='1.0' encoding='utf-8'?>\n"
 
-def generar_receta_xml_bytes(paciente_id, medico: dict, diagnostico: str, medicamentos: list, indicaciones: str = "", origen: str = "WEB", paciente_data: dict = None):
-    receta = etree.Element("receta", nsmap={})
-    # paciente
-    paciente = etree.SubElement(receta, "paciente")
-    etree.SubElement(paciente, "id").text = str(paciente_id)
-    # Si hay datos completos del paciente, incluirlos
-    if paciente_data:
-        etree.SubElement(paciente, "nombre").text = paciente_data.get("nombre", "")
-        etree.SubElement(paciente, "apellido").text = paciente_data.get("apellido", "")
-        if paciente_data.get("fecha_nacimiento"):
-            etree.SubElement(paciente, "fecha_nacimiento").text = paciente_data.get("fecha_nacimiento")
-        if paciente_data.get("sexo"):
-            etree.SubElement(paciente, "sexo").text = paciente_data.get("sexo")
-        if paciente_data.get("telefono"):
-            etree.SubElement(paciente, "telefono").text = paciente_data.get("telefono")
-        if paciente_data.get("correo"):
-            etree.SubElement(paciente, "correo").text = paciente_data.get("correo")
-    # medico
-    med = etree.SubElement(receta, "medico")
-    for k in ("id","nombre","cedula","correo"):
-        el = etree.SubElement(med, k)
-        el.text = medico.get(k,"")
-    # diagnostico
-    etree.SubElement(receta, "diagnostico").text = diagnostico
-    # medicamentos
-    meds = etree.SubElement(receta, "medicamentos")
-    for m in medicamentos:
-        mm = etree.SubElement(meds, "medicamento")
-        etree.SubElement(mm, "nombre").text = m.get("nombre","")
-        etree.SubElement(mm, "dosis").text = m.get("dosis","")
-        etree.SubElement(mm, "frecuencia").text = m.get("frecuencia","")
-        etree.SubElement(mm, "duracion").text = m.get("duracion","")
-    # indicaciones
-    etree.SubElement(receta, "indicaciones").text = indicaciones
-    # metadatos
-    meta = etree.SubElement(receta, "metadatos")
-    etree.SubElement(meta, "fecha_emision").text = datetime.utcnow().isoformat()
-    checksum_el = etree.SubElement(meta, "checksum"); checksum_el.text = ""  # empty for checksum calc
-    etree.SubElement(meta, "id_receta").text = str(uuid.uuid4())
-    etree.SubElement(meta, "origen").text = origen
 
-    # add xsi attr
-    receta.set("{%s}noNamespaceSchemaLocation" % XSI_NS, "receta.xsd")
-    receta.nsmap['xsi'] = XSI_NS
+class _HashWriter:
+    """Destino de la serialización: acumula los bloques y los va pasando por SHA-256."""
 
-    # compute checksum (serialize with empty checksum)
-    xml_bytes = etree.tostring(receta, pretty_print=True, xml_declaration=True, encoding="utf-8")
-    checksum = hashlib.sha256(xml_bytes).hexdigest()
-    checksum_el.text = checksum
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.partes = []
 
-    xml_bytes = etree.tostring(receta, pretty_print=True, xml_declaration=True, encoding="utf-8")
-    return xml_bytes
+    def write(self, data: bytes):
+        self.sha.update(data)
+        self.partes.append(data)
+        return len(data)
 
-def parse_receta_xml(xml_path: str) -> dict:
-    """
-    Parsea un archivo XML de receta y extrae los datos.
-    """
-    try:
-        tree = etree.parse(xml_path)
-        root = tree.getroot()
-
-        # Extraer datos según estructura REAL del XML
-        data = {
-            "id_receta": root.findtext("metadatos/id_receta", "").strip(),
-            "paciente_id": root.findtext("paciente/id", "").strip(),
-            "medico_id": root.findtext("medico/id", "").strip(),
-            "diagnostico": root.findtext("diagnostico", "").strip(),
-            "indicaciones": root.findtext("indicaciones", "").strip(),
-            "fecha_emision": root.findtext("metadatos/fecha_emision", datetime.utcnow().isoformat()).strip(),
-            "checksum": root.findtext("metadatos/checksum", "").strip(),
-        }
-
-        # Validar campos obligatorios
-        required = ["id_receta", "paciente_id", "medico_id"]
-        for field in required:
-            if not data[field]:
-                raise ValueError(f"Campo obligatorio faltante: {field}")
-
-        logger.info(f"[XML PARSE] ✅ Receta parseada: {data['id_receta']}")
-        return data
 
-    except Exception as e:
-        logger.error(f"[XML PARSE] Error parseando {xml_path}: {e}")
-        raise
+@dataclass(frozen=True)
+class RecetaXML:
+    """XML de receta ya serializado y los metadatos que necesita quien lo guarda."""
+    xml_bytes: bytes
+    id_receta: str
+    checksum: str
+    fecha_emision: datetime
 
-def generar_receta_xml_bytes(
+    def con_firma(self, firma_b64: str) -> bytes:
+        """
+        Añade <signature> al final de <metadatos> sin reparsear ni reserializar.
+        La firma se calcula sobre xml_bytes (con checksum), como hasta ahora.
+        """
+        i = self.xml_bytes.rindex(_CIERRE_METADATOS)
+        firma = b"    <signature>" + firma_b64.encode("ascii") + b"</signature>\n"
+        return self.xml_bytes[:i] + firma + self.xml_bytes[i:]
+
+
+def construir_receta_xml(
     paciente_id,
     medico: dict,
     diagnostico: str,
@@ -100,8 +53,14 @@ def generar_receta_xml_bytes(
     indicaciones: str = "",
     origen: str = "WEB",
     paciente_data: dict = None
-):
+) -> RecetaXML:
+    """
+    Genera el XML de una receta en una sola serialización.
 
+    El checksum es el SHA-256 del documento con <checksum></checksum> vacío
+    (mismo valor que antes). Se calcula mientras lxml escribe y después el hex
+    se inserta en esos bytes: al ser hexadecimal no cambia nada más del documento.
+    """
     # Crear raíz correctamente con namespace y schema
     receta = etree.Element(
         "receta",
@@ -139,28 +98,66 @@ def generar_receta_xml_bytes(
     etree.SubElement(receta, "indicaciones").text = indicaciones
 
     # --- METADATOS ---
+    fecha_emision = datetime.utcnow()
+    id_receta = str(uuid.uuid4())
     meta = etree.SubElement(receta, "metadatos")
-    etree.SubElement(meta, "fecha_emision").text = datetime.utcnow().isoformat()
+    etree.SubElement(meta, "fecha_emision").text = fecha_emision.isoformat()
+    etree.SubElement(meta, "checksum").text = ""  # se rellena sobre los bytes
+    etree.SubElement(meta, "id_receta").text = id_receta
+    etree.SubElement(meta, "origen").text = origen
 
-    checksum_el = etree.SubElement(meta, "checksum")
-    checksum_el.text = ""  # se rellena luego
+    # --- Serializar una vez, calculando el checksum en el camino ---
+    writer = _HashWriter()
+    writer.write(_DECLARACION)
+    etree.ElementTree(receta).write(writer, pretty_print=True, xml_declaration=False, encoding="utf-8")
+    checksum = writer.sha.hexdigest()
+    xml_bytes = b"".join(writer.partes).replace(
+        _CHECKSUM_VACIO, b"<checksum>" + checksum.encode("ascii") + b"</checksum>", 1
+    )
 
-    idr = etree.SubElement(meta, "id_receta")
-    idr.text = str(uuid.uuid4())
+    return RecetaXML(xml_bytes=xml_bytes, id_receta=id_receta, checksum=checksum, fecha_emision=fecha_emision)
 
-    etree.SubElement(meta, "origen").text = origen
 
-    # --- CHECKSUM sobre XML sin checksum ---
-    xml_bytes_tmp = etree.tostring(
-        receta, pretty_print=True, xml_declaration=True, encoding="utf-8"
-    )
+def generar_receta_xml_bytes(*args, **kwargs) -> bytes:
+    """Compatibilidad: solo los bytes de construir_receta_xml()."""
+    return construir_receta_xml(*args, **kwargs).xml_bytes
 
-    checksum = hashlib.sha256(xml_bytes_tmp).hexdigest()
-    checksum_el.text = checksum
+def parse_receta_xml(xml_path: str) -> dict:
+    """
+    Parsea un archivo XML de receta y extrae los datos.
+    """
+    try:
+        tree = etree.parse(xml_path)
+        return extraer_datos_receta(tree.getroot())
 
-    # XML final
-    xml_bytes = etree.tostring(
-        receta, pretty_print=True, xml_declaration=True, encoding="utf-8"
-    )
+    except Exception as e:
+        logger.error(f"[XML PARSE] Error parseando {xml_path}: {e}")
+        raise
 
-    return xml_bytes
+def extraer_datos_receta(root) -> dict:
+    """
+    Extrae los datos de una receta desde un árbol XML ya parseado.
+    """
+    # Extraer datos según estructura REAL del XML
+    data = {
+        "id_receta": root.findtext("metadatos/id_receta", "").strip(),
+        "paciente_id": root.findtext("paciente/id", "").strip(),
+        "medico_id": root.findtext("medico/id", "").strip(),
+        "diagnostico": root.findtext("diagnostico", "").strip(),
+        "indicaciones": root.findtext("indicaciones", "").strip(),
+        "fecha_emision": root.findtext("metadatos/fecha_emision", datetime.utcnow().isoformat()).strip(),
+        "checksum": root.findtext("metadatos/checksum", "").strip(),
+        "medicamentos": [
+            {k: (m.findtext(k) or "").strip() for k in ("nombre", "dosis", "frecuencia", "duracion")}
+            for m in root.iterfind("medicamentos/medicamento")
+        ],
+    }
+
+    # Validar campos obligatorios
+    required = ["id_receta", "paciente_id", "medico_id"]
+    for field in required:
+        if not data[field]:
+            raise ValueError(f"Campo obligatorio faltante: {field}")
+
+    logger.info(f"[XML PARSE] ✅ Receta parseada: {data['id_receta']}")
+    return data
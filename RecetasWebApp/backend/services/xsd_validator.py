@@ -1,6 +1,7 @@
 import os
+import threading
 from lxml import etree
-from typing import Tuple
+from typing import Dict, Tuple
 from core.logger import logger
 
 def get_xsd_path(xsd_filename: str) -> str:
@@ -12,6 +13,68 @@ def get_xsd_path(xsd_filename: str) -> str:
         logger.error(f"[XSD Path] NO EXISTE: {xsd_path}")
     return xsd_path
 
+
+class SchemaRegistry:
+    """
+    Registro de esquemas XSD compilados, compartido por todo el proceso.
+
+    Cada XSD se compila una sola vez y se reutiliza mientras su mtime no
+    cambie. Es seguro entre hilos: la compilación se hace bajo un lock, y
+    validar() serializa por esquema la validación y la lectura de su
+    error_log (el error_log pertenece al XMLSchema compartido).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # xsd_path -> (mtime, esquema, lock de validación del esquema)
+        self._schemas: Dict[str, Tuple[float, etree.XMLSchema, threading.Lock]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _entrada(self, xsd_filename: str) -> Tuple[float, etree.XMLSchema, threading.Lock]:
+        xsd_path = get_xsd_path(xsd_filename)
+        mtime = os.path.getmtime(xsd_path)
+
+        with self._lock:
+            cached = self._schemas.get(xsd_path)
+            if cached is not None and cached[0] == mtime:
+                self.hits += 1
+                return cached
+
+            self.misses += 1
+            with open(xsd_path, "rb") as f:
+                xsd_doc = etree.parse(f)
+            schema = etree.XMLSchema(xsd_doc)
+            entrada = (mtime, schema, threading.Lock())
+            self._schemas[xsd_path] = entrada
+            logger.info(f"[XSD Cache] Compilado {xsd_filename} (mtime={mtime})")
+            return entrada
+
+    def validar(self, xsd_filename: str, xml_doc) -> Tuple[bool, str]:
+        """Valida xml_doc (árbol o elemento); devuelve (es_valido, errores de esta validación)."""
+        _, schema, lock = self._entrada(xsd_filename)
+        with lock:
+            if schema.validate(xml_doc):
+                return True, ""
+            return False, "\n".join(str(e) for e in schema.error_log)
+
+    def clear(self):
+        """Vacía el registro (los esquemas se recompilan en el siguiente uso)."""
+        with self._lock:
+            self._schemas.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "schemas": sorted(os.path.basename(p) for p in self._schemas),
+            }
+
+
+schema_registry = SchemaRegistry()
+
+
 def validate_xml_against_xsd(xml_path: str, xsd_filename: str = None) -> Tuple[bool, str]:
     """
     Valida un archivo XML contra su XSD.
@@ -48,25 +111,17 @@ def validate_xml_against_xsd(xml_path: str, xsd_filename: str = None) -> Tuple[b
         if not os.path.exists(xsd_path):
             return False, f"Archivo XSD no encontrado: {xsd_path}"
         
-        # Parsear el XSD
-        with open(xsd_path, "r", encoding="utf-8") as f:
-            xsd_doc = etree.parse(f)
-        xsd_schema = etree.XMLSchema(xsd_doc)
-        
         # Parsear el XML
         with open(xml_path, "r", encoding="utf-8") as f:
             xml_doc = etree.parse(f)
         
-        # Validar
-        is_valid = xsd_schema.validate(xml_doc)
+        # Validar (el esquema es compartido: validar() serializa validate + error_log)
+        is_valid, errors = schema_registry.validar(xsd_filename, xml_doc)
         
         if is_valid:
             logger.info(f"[XSD] VALID: {os.path.basename(xml_path)}")
             return True, ""
         else:
-            # Obtener mensaje de error detallado
-            error_log = xsd_schema.error_log
-            errors = "\n".join([str(e) for e in error_log])
             logger.error(f"[XSD] INVALID: {os.path.basename(xml_path)} - {errors}")
             return False, errors
     
@@ -88,6 +143,22 @@ def validate_xml_against_xsd(xml_path: str, xsd_filename: str = None) -> Tuple[b
         return False, msg
 
 
+def validate_xml_tree(xml_doc, xsd_filename: str) -> Tuple[bool, str]:
+    """
+    Valida un árbol XML ya parseado (ElementTree o Element) contra un XSD.
+    
+    Returns:
+        Tupla (es_valido, mensaje_de_error)
+    """
+    try:
+        return schema_registry.validar(xsd_filename, xml_doc)
+    
+    except Exception as e:
+        msg = f"Error de validación: {str(e)}"
+        logger.error(f"[XSD] {msg}", exc_info=True)
+        return False, msg
+
+
 def validate_xml_string(xml_string: str, xsd_filename: str) -> Tuple[bool, str]:
     """
     Valida una cadena XML contra un XSD.
@@ -105,23 +176,11 @@ def validate_xml_string(xml_string: str, xsd_filename: str) -> Tuple[bool, str]:
         if not os.path.exists(xsd_path):
             return False, f"Archivo XSD no encontrado: {xsd_path}"
         
-        # Parsear el XSD
-        with open(xsd_path, "r", encoding="utf-8") as f:
-            xsd_doc = etree.parse(f)
-        xsd_schema = etree.XMLSchema(xsd_doc)
-        
         # Parsear el XML desde string
         xml_doc = etree.fromstring(xml_string.encode("utf-8"))
         
         # Validar
-        is_valid = xsd_schema.validate(xml_doc)
-        
-        if is_valid:
-            return True, ""
-        else:
-            error_log = xsd_schema.error_log
-            errors = "\n".join([str(e) for e in error_log])
-            return False, errors
+        return schema_registry.validar(xsd_filename, xml_doc)
     
     except Exception as e:
         msg = f"Error de validación: {str(e)}"
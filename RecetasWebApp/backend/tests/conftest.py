@@ -0,0 +1,12 @@
+# backend/tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Las BDs se configuran al importar database.base: apuntarlas a SQLite temporales antes de nada
+_tmp_dir = tempfile.mkdtemp(prefix="recetas_tests_")
+os.environ["WEB_DB_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'web.db')}"
+os.environ["LOCAL_DB_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'local.db')}"
+
+# Agregar el directorio backend al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,112 @@
+# backend/tests/test_job_queue.py
+"""Cola durable (services/job_queue.py) contra una BD local SQLite temporal."""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.base import LocalSessionLocal
+from database.queue_models import TrabajoCola
+from services import job_queue
+
+
+@pytest.fixture
+def cola(request):
+    """Nombre de cola propio de cada test, vaciado al terminar."""
+    nombre = f"test_{request.node.name}"
+    yield nombre
+    db = LocalSessionLocal()
+    try:
+        db.query(TrabajoCola).filter(TrabajoCola.cola == nombre).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _estado(trabajo_id: int) -> TrabajoCola:
+    db = LocalSessionLocal()
+    try:
+        trabajo = db.get(TrabajoCola, trabajo_id)
+        db.expunge(trabajo)
+        return trabajo
+    finally:
+        db.close()
+
+
+def test_workers_concurrentes_no_reclaman_el_mismo_trabajo(cola):
+    total = 300
+    job_queue.encolar(cola, [f"/tmp/receta_{i}.xml" for i in range(total)])
+
+    reclamados = {}
+    inicio = threading.Barrier(4)
+
+    def worker(worker_id):
+        inicio.wait()
+        ids = []
+        while True:
+            lote = job_queue.reclamar(cola, limite=25, worker_id=worker_id)
+            if not lote:
+                break
+            ids.extend(t.id for t in lote)
+        reclamados[worker_id] = ids
+
+    hilos = [threading.Thread(target=worker, args=(f"w{n}",)) for n in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    todos = [i for ids in reclamados.values() for i in ids]
+    assert len(todos) == len(set(todos)), "un trabajo fue reclamado por dos workers"
+    assert len(todos) == total
+
+
+def test_lease_vencido_se_vuelve_a_reclamar(cola):
+    job_queue.encolar(cola, ["/tmp/receta_lease.xml"])
+    [trabajo] = job_queue.reclamar(cola, worker_id="muerto")
+    assert trabajo.intentos == 1
+
+    # Con el lease vigente nadie más lo toma
+    assert job_queue.reclamar(cola, worker_id="otro") == []
+
+    db = LocalSessionLocal()
+    try:
+        db.query(TrabajoCola).filter(TrabajoCola.id == trabajo.id).update(
+            {TrabajoCola.lease_until: datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    [retomado] = job_queue.reclamar(cola, worker_id="otro")
+    assert retomado.id == trabajo.id
+    assert retomado.intentos == 2
+    assert retomado.worker_id.startswith("otro/")
+    assert retomado.estado == job_queue.EN_PROCESO
+
+
+def test_error_permanente_va_a_dead_letter(cola):
+    job_queue.encolar(cola, ["/tmp/receta_invalida.xml"])
+    [trabajo] = job_queue.reclamar(cola)
+
+    assert job_queue.programar_reintento(trabajo, ValueError("XSD inválido")) == "dead_letter"
+    guardado = _estado(trabajo.id)
+    assert guardado.estado == job_queue.DEAD_LETTER
+    assert guardado.ultimo_error == "XSD inválido"
+    assert job_queue.reclamar(cola) == []
+
+    # Un dead letter solo vuelve a la cola de forma explícita
+    assert job_queue.reintentar_dead_letters(cola) == 1
+    [reactivado] = job_queue.reclamar(cola)
+    assert reactivado.id == trabajo.id
+    assert reactivado.intentos == 1
+
+
+def test_error_transitorio_se_reintenta_con_backoff(cola):
+    job_queue.encolar(cola, ["/tmp/receta_red.xml"])
+    [trabajo] = job_queue.reclamar(cola)
+
+    assert job_queue.programar_reintento(trabajo, ConnectionError("timeout")) == "reintento"
+    guardado = _estado(trabajo.id)
+    assert guardado.estado == job_queue.PENDIENTE
+    assert guardado.next_run_at > datetime.utcnow()
@@ -1,8 +1,8 @@
 # backend/web/routers/auth.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from core.auth import authenticate_user, create_access_token, get_db, get_password_hash
+from core.auth import authenticate_user_async, create_access_token, get_db, hash_password_async
 from database.web_models import UserWeb
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -10,20 +10,20 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
 
 @router.post("/token")
-def login_for_access_token(
+async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+    ip = request.client.host if request.client else None
+    if not await authenticate_user_async(form_data.username, form_data.password, ip):
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
 
-    access_token = create_access_token(subject=user.username)
+    access_token = create_access_token(subject=form_data.username)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/create_user")
-def create_user(payload: dict, db: Session = Depends(get_db)):
+async def create_user(payload: dict, db: Session = Depends(get_db)):
     username = payload.get("username")
     password = payload.get("password")
 
@@ -34,7 +34,8 @@ def create_user(payload: dict, db: Session = Depends(get_db)):
     if exists:
         raise HTTPException(status_code=400, detail="Usuario ya existe")
 
-    hashed = get_password_hash(password)
+    # bcrypt en el pool de hashing: no bloquea el event loop
+    hashed = await hash_password_async(password)
     user = UserWeb(
         username=username,
         hashed_password=hashed,
@@ -1,50 +1,95 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from fastapi.responses import FileResponse
-from typing import Optional
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.auth import get_current_user
-from database.base import LocalSessionLocal
+from database.base import get_async_local_db
 from jobs.receiver_job import check_inbox
 
 
 from database.local_models import RecetaLocal
+from services import job_queue, pdf_backfill
+from services.pagination import (
+    keyset_page, count_total, count_cache, set_page_headers, CursorInvalido, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
+)
 from core.logger import logger
 import os
 
 # ✅ IMPORTANTE: Sin prefix aquí, se añade en app.py
 router = APIRouter(tags=["local_admin"])
 
+class ReintentarDeadLetterIn(BaseModel):
+    cola: Optional[str] = None
+    ids: Optional[List[int]] = None
+
+class RegenerarPdfsIn(BaseModel):
+    tabla: str = "web"                 # web | local
+    solo_faltantes: bool = True        # False: rehacer también los que ya tienen PDF
+    workers: Optional[int] = Field(None, ge=1, le=os.cpu_count() or 1)
+
 @router.get("/local-admin/recetas-locales", summary="Listar recetas locales")
-def listar_recetas_local(
+async def listar_recetas_local(
+    response: Response,
     filtro_origen: Optional[str] = None,
+    medico_id: Optional[str] = None,
+    paciente_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_local_db),
     user=Depends(get_current_user)
 ):
-    """Lista recetas locales procesadas."""
-    db = LocalSessionLocal()
+    """Lista recetas locales procesadas, por páginas (cursor en X-Next-Cursor)."""
     try:
-        query = db.query(RecetaLocal).order_by(RecetaLocal.created_at.desc())
+        stmt = select(RecetaLocal)
         
         if filtro_origen:
-            query = query.filter(RecetaLocal.origen == filtro_origen)
+            stmt = stmt.where(RecetaLocal.origen == filtro_origen)
+        if medico_id:
+            stmt = stmt.where(RecetaLocal.medico_id == medico_id)
+        if paciente_id:
+            stmt = stmt.where(RecetaLocal.paciente_id == paciente_id)
+        if desde:
+            stmt = stmt.where(RecetaLocal.created_at >= desde)
+        if hasta:
+            stmt = stmt.where(RecetaLocal.created_at <= hasta)
         
-        recetas = query.all()
+        recetas, next_cursor = await keyset_page(
+            db, stmt, [RecetaLocal.created_at, RecetaLocal.id_receta], limit, cursor, scalars=True
+        )
+
+        total = None
+        if include_total:
+            filtros = {
+                "origen": filtro_origen, "medico_id": medico_id, "paciente_id": paciente_id,
+                "desde": desde, "hasta": hasta
+            }
+            total = await count_cache.get_or_count("recetas_locales", filtros, lambda: count_total(db, stmt))
+        set_page_headers(response, next_cursor, total)
+
         logger.info(f"[LOCAL ADMIN] Listadas {len(recetas)} recetas")
         return recetas
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"[LOCAL ADMIN] Error listando: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.get("/local-admin/recetas-locales/{id_receta}", summary="Obtener receta local")
-def obtener_receta_local(
+async def obtener_receta_local(
     id_receta: str,
+    db: AsyncSession = Depends(get_async_local_db),
     user=Depends(get_current_user)
 ):
     """Obtiene una receta local específica."""
-    db = LocalSessionLocal()
     try:
-        receta = db.query(RecetaLocal).filter(RecetaLocal.id_receta == id_receta).first()
+        receta = await db.get(RecetaLocal, id_receta)
         if not receta:
             raise HTTPException(status_code=404, detail="Receta no encontrada")
         return receta
@@ -53,34 +98,35 @@ def obtener_receta_local(
     except Exception as e:
         logger.error(f"[LOCAL ADMIN] Error obteniendo receta: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.get("/local-admin/recetas-locales/{id_receta}/pdf", summary="Descargar PDF")
-def descargar_pdf_receta(
+async def descargar_pdf_receta(
     id_receta: str,
+    db: AsyncSession = Depends(get_async_local_db),
     user=Depends(get_current_user)
 ):
     """Descarga el PDF de una receta."""
-    db = LocalSessionLocal()
     try:
-        receta = db.query(RecetaLocal).filter(RecetaLocal.id_receta == id_receta).first()
-        if not receta:
+        fila = (await db.execute(
+            select(RecetaLocal.pdf_path).where(RecetaLocal.id_receta == id_receta)
+        )).first()
+        if not fila:
             logger.warning(f"[LOCAL ADMIN] Receta no encontrada: {id_receta}")
             raise HTTPException(status_code=404, detail="Receta no encontrada")
         
-        if not receta.pdf_path:
+        pdf_path = fila.pdf_path
+        if not pdf_path:
             logger.warning(f"[LOCAL ADMIN] PDF_PATH vacío para {id_receta}")
             raise HTTPException(status_code=404, detail="PDF no disponible (sin ruta)")
         
-        if not os.path.exists(receta.pdf_path):
-            logger.error(f"[LOCAL ADMIN] PDF no existe: {receta.pdf_path}")
+        if not os.path.exists(pdf_path):
+            logger.error(f"[LOCAL ADMIN] PDF no existe: {pdf_path}")
             raise HTTPException(status_code=404, detail=f"PDF no existe en servidor")
         
-        logger.info(f"[LOCAL ADMIN] Descargando PDF: {receta.pdf_path}")
+        logger.info(f"[LOCAL ADMIN] Descargando PDF: {pdf_path}")
         
         return FileResponse(
-            path=receta.pdf_path,
+            path=pdf_path,
             media_type="application/pdf",
             filename=f"receta_{id_receta}.pdf"
         )
@@ -89,18 +135,16 @@ def descargar_pdf_receta(
     except Exception as e:
         logger.error(f"[LOCAL ADMIN] Error descargando PDF: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.delete("/local-admin/recetas-locales/{id_receta}", summary="Eliminar receta")
-def eliminar_receta_local(
+async def eliminar_receta_local(
     id_receta: str,
+    db: AsyncSession = Depends(get_async_local_db),
     user=Depends(get_current_user)
 ):
     """Elimina una receta local."""
-    db = LocalSessionLocal()
     try:
-        receta = db.query(RecetaLocal).filter(RecetaLocal.id_receta == id_receta).first()
+        receta = await db.get(RecetaLocal, id_receta)
         if not receta:
             raise HTTPException(status_code=404, detail="Receta no encontrada")
         
@@ -111,32 +155,37 @@ def eliminar_receta_local(
             except Exception as e:
                 logger.warning(f"[LOCAL ADMIN] Error eliminando PDF: {e}")
         
-        db.delete(receta)
-        db.commit()
+        await db.delete(receta)
+        await db.commit()
+        count_cache.invalidate("recetas_locales")
         logger.info(f"[LOCAL ADMIN] Receta eliminada: {id_receta}")
         return {"msg": "Receta eliminada", "id_receta": id_receta}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"[LOCAL ADMIN] Error eliminando: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.get("/local-admin/stats", summary="Estadísticas")
-def obtener_stats(user=Depends(get_current_user)):
+async def obtener_stats(db: AsyncSession = Depends(get_async_local_db), user=Depends(get_current_user)):
     """Retorna estadísticas de recetas locales."""
-    db = LocalSessionLocal()
     try:
-        total = db.query(RecetaLocal).count()
-        por_origen = {}
-        for origen in ["drive", "local", "web"]:
-            count = db.query(RecetaLocal).filter(RecetaLocal.origen == origen).count()
-            if count > 0:
-                por_origen[origen] = count
-        
-        con_pdf = db.query(RecetaLocal).filter(RecetaLocal.pdf_path.isnot(None)).count()
+        # Una sola pasada agrupada, resuelta sobre el índice (origen, pdf_path)
+        filas = (await db.execute(
+            select(
+                RecetaLocal.origen,
+                func.count(),
+                func.count(RecetaLocal.pdf_path)
+            ).group_by(RecetaLocal.origen)
+        )).all()
+
+        total = sum(n for _, n, _ in filas)
+        con_pdf = sum(n_pdf for _, _, n_pdf in filas)
+        por_origen = {
+            origen: n for origen, n, _ in filas
+            if origen in ("drive", "local", "web") and n > 0
+        }
         
         return {
             "total": total,
@@ -147,16 +196,16 @@ def obtener_stats(user=Depends(get_current_user)):
     except Exception as e:
         logger.error(f"[LOCAL ADMIN] Error en stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.post("/local-admin/forzar-sincronizacion", summary="Forzar sincronización")
-def forzar_sincronizacion(user=Depends(get_current_user)):
+async def forzar_sincronizacion(user=Depends(get_current_user)):
     """Sincroniza Drive → Local y procesa XML."""
     try:
         logger.info("[LOCAL ADMIN] 🔄 Iniciando sincronización Drive → Local...")
 
-        nuevos = check_inbox()
+        # Descargas de Drive y procesado de XML: bloqueantes, van al threadpool
+        nuevos = await run_in_threadpool(check_inbox)
+        count_cache.invalidate("recetas_locales")
 
         return {
             "msg": "✔️ Sincronización completada",
@@ -167,3 +216,63 @@ def forzar_sincronizacion(user=Depends(get_current_user)):
     except Exception as e:
         logger.error(f"[LOCAL ADMIN] Error sincronizando: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/local-admin/cola", summary="Estado de la cola de trabajos")
+def estado_cola(cola: Optional[str] = None, user=Depends(get_current_user)):
+    """Conteo de trabajos por estado (sender, receiver, export)."""
+    try:
+        return {"cola": cola, "estados": job_queue.resumen(cola)}
+    except Exception as e:
+        logger.error(f"[LOCAL ADMIN] Error leyendo cola: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/local-admin/cola/dead-letter", summary="Listar dead letters")
+def listar_dead_letters(
+    cola: Optional[str] = None,
+    limite: int = 100,
+    user=Depends(get_current_user)
+):
+    """Trabajos que agotaron sus reintentos o fallaron de forma permanente."""
+    try:
+        return job_queue.listar_dead_letters(cola, limite)
+    except Exception as e:
+        logger.error(f"[LOCAL ADMIN] Error listando dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/local-admin/cola/dead-letter/reintentar", summary="Reintentar dead letters")
+def reintentar_dead_letters(payload: ReintentarDeadLetterIn, user=Depends(get_current_user)):
+    """Reactiva dead letters (todos los de la cola o solo los ids indicados)."""
+    try:
+        total = job_queue.reintentar_dead_letters(payload.cola, payload.ids)
+        return {"msg": "Dead letters reactivados", "reactivados": total}
+    except Exception as e:
+        logger.error(f"[LOCAL ADMIN] Error reactivando dead letters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/local-admin/pdfs/regenerar", summary="Regenerar PDFs en lote", status_code=202)
+def regenerar_pdfs(payload: RegenerarPdfsIn, user=Depends(get_current_user)):
+    """Lanza en segundo plano la regeneración masiva de PDFs (pool de procesos)."""
+    try:
+        estado = pdf_backfill.iniciar_backfill(
+            payload.tabla, payload.solo_faltantes, payload.workers or pdf_backfill.PDF_BACKFILL_WORKERS
+        )
+        return {"msg": "Regeneración de PDFs iniciada", "estado": estado}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"[LOCAL ADMIN] Error iniciando regeneración de PDFs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/local-admin/pdfs/regenerar", summary="Progreso de la regeneración de PDFs")
+def progreso_regenerar_pdfs(user=Depends(get_current_user)):
+    """Procesadas, errores, PDFs/s y ETA de la última regeneración lanzada."""
+    return {"estado": pdf_backfill.estado_backfill()}
+
+@router.post("/local-admin/pdfs/regenerar/cancelar", summary="Cancelar regeneración de PDFs")
+def cancelar_regenerar_pdfs(user=Depends(get_current_user)):
+    """Se detiene al terminar el bloque en curso; lo ya generado queda guardado."""
+    if not pdf_backfill.cancelar_backfill():
+        raise HTTPException(status_code=409, detail="No hay ninguna regeneración en curso")
+    return {"msg": "Cancelación solicitada"}
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.auth import get_current_user
-from database.base import SessionLocal
+from database.base import SessionLocal, get_async_db
 from database.web_models import MedicoWeb
 from core.logger import logger
+from services.streaming_export import streaming_export, iter_bloques
+from services.pagination import (
+    keyset_page, count_total, count_cache, set_page_headers, CursorInvalido, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
+)
 
 router = APIRouter(prefix="/medicos", tags=["medicos"])
 
@@ -20,7 +27,7 @@ async def export_medicos_xsd(user=Depends(get_current_user)):
     """Exporta todos los médicos a XML con validación XSD"""
     try:
         from scripts.export_medicos_xsd import export_all
-        result = export_all()
+        result = await run_in_threadpool(export_all)
         logger.info(f"Export medicos: {result}")
         return {"status": "ok", "result": result}
     except Exception as e:
@@ -32,42 +39,75 @@ async def import_medicos_xsd(user=Depends(get_current_user)):
     """Importa médicos desde XMLs en la carpeta local"""
     try:
         from scripts.import_medicos_xsd import import_all
-        result = import_all()
+        result = await run_in_threadpool(import_all)
+        count_cache.invalidate("medicos")
         logger.info(f"Import medicos: {result}")
         return {"status": "ok", "result": result}
     except Exception as e:
         logger.error(f"Error importando medicos XSD: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export", summary="Exportar médicos en streaming (NDJSON o CSV)")
+def exportar_medicos(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user=Depends(get_current_user)
+):
+    """Exporta todos los médicos leyendo por bloques (yield_per), con memoria constante"""
+    columnas = (
+        MedicoWeb.id,
+        MedicoWeb.nombre,
+        MedicoWeb.cedula,
+        MedicoWeb.correo
+    )
+
+    def generar_filas(db):
+        query = db.query(*columnas).order_by(MedicoWeb.id)
+        for bloque in iter_bloques(query):
+            yield [dict(fila._mapping) for fila in bloque]
+
+    return streaming_export(SessionLocal, generar_filas, formato, [c.key for c in columnas], "medicos")
+
 # ✅ DESPUÉS: endpoints genéricos
 @router.get("/", summary="Listar médicos")
-async def listar_medicos(user=Depends(get_current_user)):
-    """Lista todos los médicos"""
-    db = SessionLocal()
+async def listar_medicos(
+    response: Response,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user)
+):
+    """Lista médicos por páginas ordenados por ID (cursor en la cabecera X-Next-Cursor)"""
+    stmt = select(MedicoWeb.id, MedicoWeb.nombre, MedicoWeb.cedula, MedicoWeb.correo)
+    if q:
+        patron = f"%{q}%"
+        stmt = stmt.where(MedicoWeb.nombre.ilike(patron))
+
     try:
-        medicos = db.query(MedicoWeb).all()
-        return [{"id": m.id, "nombre": m.nombre, "cedula": m.cedula, "correo": m.correo} for m in medicos]
-    finally:
-        db.close()
+        medicos, next_cursor = await keyset_page(db, stmt, [MedicoWeb.id], limit, cursor, descending=False)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    total = None
+    if include_total:
+        total = await count_cache.get_or_count("medicos", {"q": q}, lambda: count_total(db, stmt))
+    set_page_headers(response, next_cursor, total)
+    return [{"id": m.id, "nombre": m.nombre, "cedula": m.cedula, "correo": m.correo} for m in medicos]
 
 @router.get("/{medico_id}", summary="Obtener médico por ID")
-async def obtener_medico(medico_id: str, user=Depends(get_current_user)):
+async def obtener_medico(medico_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
     """Obtiene un médico específico"""
-    db = SessionLocal()
-    try:
-        medico = db.query(MedicoWeb).filter(MedicoWeb.id == medico_id).first()
-        if not medico:
-            raise HTTPException(status_code=404, detail="Médico no encontrado")
-        return medico
-    finally:
-        db.close()
+    medico = await db.get(MedicoWeb, medico_id)
+    if not medico:
+        raise HTTPException(status_code=404, detail="Médico no encontrado")
+    return medico
 
 @router.post("/", summary="Crear médico")
-async def crear_medico(payload: MedicoIn, user=Depends(get_current_user)):
+async def crear_medico(payload: MedicoIn, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
     """Crea un nuevo médico"""
-    db = SessionLocal()
     try:
-        existente = db.query(MedicoWeb).filter(MedicoWeb.id == payload.id).first()
+        existente = await db.get(MedicoWeb, payload.id)
         if existente:
             raise HTTPException(status_code=400, detail="Médico con este ID ya existe")
         
@@ -78,14 +118,13 @@ async def crear_medico(payload: MedicoIn, user=Depends(get_current_user)):
             correo=payload.correo
         )
         db.add(medico)
-        db.commit()
+        await db.commit()
+        count_cache.invalidate("medicos")
         logger.info(f"Médico creado: {payload.id}")
         return {"msg": "Médico creado", "id": payload.id}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error al crear médico: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.auth import get_current_user
-from database.base import SessionLocal
+from database.base import SessionLocal, get_async_db
 from database.web_models import PacienteWeb
 from core.logger import logger
+from services.streaming_export import streaming_export, iter_bloques
+from services.pagination import (
+    keyset_page, count_total, count_cache, set_page_headers, CursorInvalido, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
+)
 
 router = APIRouter(prefix="/pacientes", tags=["pacientes"])
 
@@ -23,7 +30,7 @@ async def export_pacientes_xsd(user=Depends(get_current_user)):
     """Exporta todos los pacientes a XML con validación XSD"""
     try:
         from scripts.export_patients_xsd import export_all
-        result = export_all()
+        result = await run_in_threadpool(export_all)
         logger.info(f"Export pacientes: {result}")
         return {"status": "ok", "result": result}
     except Exception as e:
@@ -35,42 +42,78 @@ async def import_pacientes_xsd(user=Depends(get_current_user)):
     """Importa pacientes desde XMLs en la carpeta local"""
     try:
         from scripts.import_patients_xsd import import_all
-        result = import_all()
+        result = await run_in_threadpool(import_all)
+        count_cache.invalidate("pacientes")
         logger.info(f"Import pacientes: {result}")
         return {"status": "ok", "result": result}
     except Exception as e:
         logger.error(f"Error importando pacientes XSD: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export", summary="Exportar pacientes en streaming (NDJSON o CSV)")
+def exportar_pacientes(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    user=Depends(get_current_user)
+):
+    """Exporta todos los pacientes leyendo por bloques (yield_per), con memoria constante"""
+    columnas = (
+        PacienteWeb.id,
+        PacienteWeb.nombre,
+        PacienteWeb.apellido,
+        PacienteWeb.fecha_nacimiento,
+        PacienteWeb.sexo,
+        PacienteWeb.telefono,
+        PacienteWeb.correo
+    )
+
+    def generar_filas(db):
+        query = db.query(*columnas).order_by(PacienteWeb.id)
+        for bloque in iter_bloques(query):
+            yield [dict(fila._mapping) for fila in bloque]
+
+    return streaming_export(SessionLocal, generar_filas, formato, [c.key for c in columnas], "pacientes")
+
 # ✅ DESPUÉS: endpoints genéricos
 @router.get("/", summary="Listar pacientes")
-async def listar_pacientes(user=Depends(get_current_user)):
-    """Lista todos los pacientes"""
-    db = SessionLocal()
+async def listar_pacientes(
+    response: Response,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user)
+):
+    """Lista pacientes por páginas ordenados por ID (cursor en la cabecera X-Next-Cursor)"""
+    stmt = select(PacienteWeb.id, PacienteWeb.nombre, PacienteWeb.apellido, PacienteWeb.correo)
+    if q:
+        patron = f"%{q}%"
+        stmt = stmt.where(or_(PacienteWeb.nombre.ilike(patron), PacienteWeb.apellido.ilike(patron)))
+
     try:
-        pacientes = db.query(PacienteWeb).all()
-        return [{"id": p.id, "nombre": p.nombre, "apellido": p.apellido, "correo": p.correo} for p in pacientes]
-    finally:
-        db.close()
+        pacientes, next_cursor = await keyset_page(db, stmt, [PacienteWeb.id], limit, cursor, descending=False)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    total = None
+    if include_total:
+        total = await count_cache.get_or_count("pacientes", {"q": q}, lambda: count_total(db, stmt))
+    set_page_headers(response, next_cursor, total)
+    return [{"id": p.id, "nombre": p.nombre, "apellido": p.apellido, "correo": p.correo} for p in pacientes]
 
 @router.get("/{paciente_id}", summary="Obtener paciente por ID")
-async def obtener_paciente(paciente_id: str, user=Depends(get_current_user)):
+async def obtener_paciente(paciente_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
     """Obtiene un paciente específico"""
-    db = SessionLocal()
-    try:
-        paciente = db.query(PacienteWeb).filter(PacienteWeb.id == paciente_id).first()
-        if not paciente:
-            raise HTTPException(status_code=404, detail="Paciente no encontrado")
-        return paciente
-    finally:
-        db.close()
+    paciente = await db.get(PacienteWeb, paciente_id)
+    if not paciente:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    return paciente
 
 @router.post("/", summary="Crear paciente")
-async def crear_paciente(payload: PacienteIn, user=Depends(get_current_user)):
+async def crear_paciente(payload: PacienteIn, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
     """Crea un nuevo paciente"""
-    db = SessionLocal()
     try:
-        existente = db.query(PacienteWeb).filter(PacienteWeb.id == payload.id).first()
+        existente = await db.get(PacienteWeb, payload.id)
         if existente:
             raise HTTPException(status_code=400, detail="Paciente con este ID ya existe")
         
@@ -84,14 +127,13 @@ async def crear_paciente(payload: PacienteIn, user=Depends(get_current_user)):
             correo=payload.correo
         )
         db.add(paciente)
-        db.commit()
+        await db.commit()
+        count_cache.invalidate("pacientes")
         logger.info(f"Paciente creado: {payload.id}")
         return {"msg": "Paciente creado", "id": payload.id}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error al crear paciente: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
@@ -1,28 +1,29 @@
 # backend/web/routers/recetas.py  (actualizado)
 import os
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.auth import get_current_user
 from core.logger import logger
-from database.base import SessionLocal
+from database.base import SessionLocal, get_async_db
 from database.web_models import RecetaWeb, MedicamentoWeb, PacienteWeb, MedicoWeb
-from lxml import etree
 
-from services.xml_generator import generar_receta_xml_bytes
-from services.drive_service import upload_xml_bytes
-from services.pdf_generator import generate_receta_pdf
-from services.pdf_protect import proteger_pdf_con_contrasena
+from services.xml_generator import construir_receta_xml
 from services.email_sender import enviar_receta_completa
-
-# para firmar
-from cryptography.hazmat.primitives.serialization import load_pem_private_key
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import padding
-import base64
+from services.receta_pipeline import encolar_receta, estado_receta, ruta_xml, GENERADOS_DIR
+from services.streaming_export import streaming_export, iter_bloques
+from services.pagination import (
+    keyset_page, count_total, count_cache, set_page_headers, CursorInvalido, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
+)
+from services.signing import get_signing_service
 from fastapi.responses import FileResponse
 
-SIGNING_KEY_PATH = os.getenv("SIGNING_KEY_PATH", "")
+# Máximo de ids por IN (...) al cargar medicamentos del listado
+LISTADO_IN_CHUNK = 500
 
 router = APIRouter(prefix="/recetas", tags=["recetas"])
 
@@ -42,7 +43,7 @@ class RecetaIn(BaseModel):
 async def export_receta(user=Depends(get_current_user)):
     try:
         from scripts.export_recetas import export_pending
-        result = export_pending()
+        result = await run_in_threadpool(export_pending)
         logger.info(f"Export pendientes: {result}")
         return {"status": "ok", "result": result}
     except Exception as e:
@@ -79,9 +80,10 @@ def crear_receta(payload: RecetaIn, user=Depends(get_current_user)):
             )
             db.add(medico)
             db.commit()
+            count_cache.invalidate("medicos")
 
-        # generar XML bytes
-        xml_bytes = generar_receta_xml_bytes(
+        # generar XML (bytes + metadatos en una sola serialización)
+        receta_xml = construir_receta_xml(
             paciente_id=payload.paciente_id,
             medico=payload.medico,
             diagnostico=payload.diagnostico,
@@ -90,49 +92,23 @@ def crear_receta(payload: RecetaIn, user=Depends(get_current_user)):
             origen="WEB",
             paciente_data=paciente_data
         )
+        id_receta = receta_xml.id_receta
+        xml_bytes = receta_xml.xml_bytes
 
-        # Parsear XML para extraer metadatos
-        tree = etree.fromstring(xml_bytes)
-        id_receta = tree.findtext(".//metadatos/id_receta")
-        checksum = tree.findtext(".//metadatos/checksum")
-        fecha_emision_str = tree.findtext(".//metadatos/fecha_emision")
-
-        # firmar XML si existe clave privada
-        if SIGNING_KEY_PATH and os.path.exists(SIGNING_KEY_PATH):
-            with open(SIGNING_KEY_PATH, "rb") as f:
-                key_data = f.read()
-            password = os.getenv("SIGNING_KEY_PASSWORD") or None
-            private_key = load_pem_private_key(key_data, password=password.encode() if password else None)
-            signature = private_key.sign(
-                xml_bytes,
-                padding.PKCS1v15(),
-                hashes.SHA256()
-            )
-            sig_b64 = base64.b64encode(signature).decode()
-            meta = tree.find(".//metadatos")
-            if meta is None:
-                raise HTTPException(status_code=500, detail="XML sin metadatos")
-            sig_el = etree.SubElement(meta, "signature")
-            sig_el.text = sig_b64
-            xml_bytes = etree.tostring(tree, pretty_print=True, xml_declaration=True, encoding="utf-8")
-
-        # Guardar XML localmente y copiar a drive_outbox para el sender_job
-        xml_path = None
-        os.makedirs("data/generados", exist_ok=True)
-        xml_path = f"data/generados/receta_{id_receta}.xml"
+        # firmar XML si existe clave privada (cargada una vez, ver services/signing.py)
+        firmador = get_signing_service()
+        if firmador.disponible:
+            xml_bytes = receta_xml.con_firma(firmador.firmar_b64(xml_bytes))
+
+        # Guardar XML (durable antes de responder: lo leen las etapas del pipeline)
+        os.makedirs(GENERADOS_DIR, exist_ok=True)
+        xml_path = ruta_xml(id_receta)
         with open(xml_path, "wb") as f:
             f.write(xml_bytes)
-        
-        # Copiar también a drive_outbox para que el sender_job lo procese
-        drive_outbox = os.path.join("data", "drive_outbox")
-        os.makedirs(drive_outbox, exist_ok=True)
-        outbox_path = os.path.join(drive_outbox, f"receta_{id_receta}.xml")
-        with open(outbox_path, "wb") as f:
-            f.write(xml_bytes)
-        logger.info(f"XML copiado a drive_outbox: {outbox_path}")
+            f.flush()
+            os.fsync(f.fileno())
 
         # Guardar receta en BD Web
-        from datetime import datetime
         receta = RecetaWeb(
             id_receta=id_receta,
             paciente_id=payload.paciente_id,
@@ -140,8 +116,8 @@ def crear_receta(payload: RecetaIn, user=Depends(get_current_user)):
             diagnostico=payload.diagnostico,
             indicaciones=payload.indicaciones,
             xml_path=xml_path,
-            checksum=checksum,
-            fecha_emision=datetime.fromisoformat(fecha_emision_str.replace("Z", "+00:00")) if fecha_emision_str else datetime.utcnow(),
+            checksum=receta_xml.checksum,
+            fecha_emision=receta_xml.fecha_emision,
             sent=False
         )
         db.add(receta)
@@ -159,62 +135,25 @@ def crear_receta(payload: RecetaIn, user=Depends(get_current_user)):
             db.add(medicamento)
 
         db.commit()
+        count_cache.invalidate("recetas")
 
-        # Generar PDF inmediatamente
+        # PDF, correo y subida a Drive en segundo plano (services/receta_pipeline.py).
+        # Si encolar falla la receta ya existe: POST /recetas/reintentar la sube igual.
         try:
-            receta_data = {
-                "id_receta": id_receta,
-                "paciente_id": payload.paciente_id,
-                "medico_id": payload.medico.get("id"),
-                "diagnostico": payload.diagnostico,
-                "indicaciones": payload.indicaciones,
-                "fecha_emision": fecha_emision_str,
-                "checksum": checksum,
-            }
-
-            pdf_path = f"data/generados/receta_{id_receta}.pdf"
-
-            pdf_path = generate_receta_pdf(receta_data, pdf_path)
-
-            
-            # Proteger PDF con contraseña
-            pdf_password = os.getenv("PDF_PASSWORD", None)
-            if not pdf_password:
-                import random
-                import string
-                pdf_password = "".join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
-                print(f"Generada contraseña aleatoria para PDF: {pdf_password}")
-            
-            pdf_protected_path = proteger_pdf_con_contrasena(pdf_path, pdf_password)
-            
-            # Actualizar receta con ruta del PDF y contraseña
-            receta.pdf_path = pdf_protected_path
-            receta.pdf_password = pdf_password  # ✅ Guardar contraseña
-            db.commit()
-            
-            # ✅ ENVIAR CORREOS
-            try:
-                enviar_receta_completa(paciente.correo, pdf_protected_path, pdf_password)
-                logger.info(f"Correos enviados para receta {id_receta}")
-            except Exception as e:
-                logger.error(f"Error al enviar correos: {e}")
-                # No fallar la receta si falla el email
-
-            logger.info(f"PDF generado para receta {id_receta}: {pdf_protected_path}")
+            encolar_receta(xml_path)
         except Exception as e:
-            logger.error(f"Error al generar PDF para receta {id_receta}: {e}")
-            # No fallar la creación de la receta si el PDF falla
+            logger.error(f"Error encolando el pipeline de la receta {id_receta}: {e}")
 
-        # Subir a Drive (simulado o real)
-        filename = f"receta_{id_receta}.xml"
-        res = upload_xml_bytes(filename, xml_bytes)
-        
-        # Marcar como enviada
-        receta.sent = True
-        db.commit()
-
-        logger.info(f"Usuario {user.id} creó receta {id_receta} y fue subida -> {res}")
-        return {"status": "created", "id_receta": id_receta, "upload": res, "pdf_path": receta.pdf_path}
+        logger.info(f"Usuario {user.id} creó receta {id_receta}")
+        return {
+            "status": "created",
+            "id_receta": id_receta,
+            "estado_url": f"/api/recetas/{id_receta}/estado",
+            "pdf_path": None
+        }
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"Error al crear receta: {e}")
@@ -222,60 +161,178 @@ def crear_receta(payload: RecetaIn, user=Depends(get_current_user)):
     finally:
         db.close()
 
+COLUMNAS_LISTADO = (
+    RecetaWeb.id,
+    RecetaWeb.id_receta,
+    RecetaWeb.paciente_id,
+    RecetaWeb.medico_id,
+    RecetaWeb.diagnostico,
+    RecetaWeb.fecha_emision,
+    RecetaWeb.created_at,
+    RecetaWeb.sent,
+    RecetaWeb.pdf_path
+)
+CAMPOS_EXPORT = [c.key for c in COLUMNAS_LISTADO] + ["medicamentos"]
+
+def _filtrar_recetas(query, medico_id=None, paciente_id=None, desde=None, hasta=None, sent=None):
+    """Filtros comunes del listado (select) y la exportación (Query): ambos admiten .filter()."""
+    if medico_id:
+        query = query.filter(RecetaWeb.medico_id == medico_id)
+    if paciente_id:
+        query = query.filter(RecetaWeb.paciente_id == paciente_id)
+    if desde:
+        query = query.filter(RecetaWeb.created_at >= desde)
+    if hasta:
+        query = query.filter(RecetaWeb.created_at <= hasta)
+    if sent is not None:
+        query = query.filter(RecetaWeb.sent == sent)
+    return query
+
+def _receta_a_dict(r, medicamentos: list) -> dict:
+    return {
+        "id": r.id,
+        "id_receta": r.id_receta,
+        "paciente_id": r.paciente_id,
+        "medico_id": r.medico_id,
+        "diagnostico": r.diagnostico,
+        "fecha_emision": r.fecha_emision.isoformat() if r.fecha_emision else None,
+        "created_at": r.created_at.isoformat() if r.created_at else None,
+        "sent": r.sent,
+        "pdf_path": r.pdf_path,
+        "medicamentos": medicamentos
+    }
+
+def _stmt_medicamentos(receta_ids: list):
+    return select(
+        MedicamentoWeb.receta_id,
+        MedicamentoWeb.nombre,
+        MedicamentoWeb.dosis,
+        MedicamentoWeb.frecuencia
+    ).where(MedicamentoWeb.receta_id.in_(receta_ids)).order_by(MedicamentoWeb.id)
+
+def _agregar_medicamentos(por_receta: dict, filas):
+    for m in filas:
+        por_receta[m.receta_id].append({"nombre": m.nombre, "dosis": m.dosis, "frecuencia": m.frecuencia})
+
+def _medicamentos_por_receta(db, receta_ids: list) -> dict:
+    """
+    Medicamentos de varias recetas en una consulta por bloque (sin N+1).
+    Devuelve {receta_id: [dict, ...]} leyendo solo columnas, sin objetos ORM.
+    """
+    por_receta = {rid: [] for rid in receta_ids}
+    for i in range(0, len(receta_ids), LISTADO_IN_CHUNK):
+        _agregar_medicamentos(por_receta, db.execute(_stmt_medicamentos(receta_ids[i:i + LISTADO_IN_CHUNK])))
+    return por_receta
+
+async def _medicamentos_por_receta_async(db: AsyncSession, receta_ids: list) -> dict:
+    """Igual que _medicamentos_por_receta, sobre una AsyncSession."""
+    por_receta = {rid: [] for rid in receta_ids}
+    for i in range(0, len(receta_ids), LISTADO_IN_CHUNK):
+        _agregar_medicamentos(por_receta, await db.execute(_stmt_medicamentos(receta_ids[i:i + LISTADO_IN_CHUNK])))
+    return por_receta
+
 @router.get("/", summary="Listar recetas")
-def listar_recetas(user=Depends(get_current_user)):
-    db = SessionLocal()
+async def listar_recetas(
+    response: Response,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    medico_id: Optional[str] = None,
+    paciente_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    sent: Optional[bool] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user)
+):
+    """
+    Lista recetas por páginas (más recientes primero).
+    La siguiente página se pide con el valor de la cabecera X-Next-Cursor;
+    include_total=true añade X-Total-Count (cacheado unos segundos).
+    """
+    stmt = _filtrar_recetas(select(*COLUMNAS_LISTADO), medico_id, paciente_id, desde, hasta, sent)
+
     try:
-        recetas = db.query(RecetaWeb).order_by(RecetaWeb.created_at.desc()).all()
-        result = []
-        for r in recetas:
-            medicamentos = db.query(MedicamentoWeb).filter(MedicamentoWeb.receta_id == r.id).all()
-            result.append({
-                "id": r.id,
-                "id_receta": r.id_receta,
-                "paciente_id": r.paciente_id,
-                "medico_id": r.medico_id,
-                "diagnostico": r.diagnostico,
-                "fecha_emision": r.fecha_emision.isoformat() if r.fecha_emision else None,
-                "created_at": r.created_at.isoformat() if r.created_at else None,
-                "sent": r.sent,
-                "pdf_path": r.pdf_path,
-                "medicamentos": [{"nombre": m.nombre, "dosis": m.dosis, "frecuencia": m.frecuencia} for m in medicamentos]
-            })
-        return result
-    finally:
-        db.close()
+        recetas, next_cursor = await keyset_page(db, stmt, [RecetaWeb.created_at, RecetaWeb.id], limit, cursor)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    total = None
+    if include_total:
+        filtros = {"medico_id": medico_id, "paciente_id": paciente_id, "desde": desde, "hasta": hasta, "sent": sent}
+        total = await count_cache.get_or_count("recetas", filtros, lambda: count_total(db, stmt))
+    set_page_headers(response, next_cursor, total)
+
+    medicamentos = await _medicamentos_por_receta_async(db, [r.id for r in recetas])
+
+    return [_receta_a_dict(r, medicamentos[r.id]) for r in recetas]
+
+@router.get("/export", summary="Exportar recetas en streaming (NDJSON o CSV)")
+def exportar_recetas(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    medico_id: Optional[str] = None,
+    paciente_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    sent: Optional[bool] = None,
+    user=Depends(get_current_user)
+):
+    """
+    Exporta todas las recetas que cumplen los filtros, sin cargarlas en memoria:
+    se leen por bloques con yield_per y cada bloque trae sus medicamentos en una consulta.
+    """
+    def generar_filas(db):
+        query = _filtrar_recetas(db.query(*COLUMNAS_LISTADO), medico_id, paciente_id, desde, hasta, sent)
+        for bloque in iter_bloques(query.order_by(RecetaWeb.id)):
+            medicamentos = _medicamentos_por_receta(db, [r.id for r in bloque])
+            yield [_receta_a_dict(r, medicamentos[r.id]) for r in bloque]
+
+    logger.info(f"Usuario {user.id} exporta recetas ({formato})")
+    return streaming_export(SessionLocal, generar_filas, formato, CAMPOS_EXPORT, "recetas")
+
+@router.get("/{id_receta}/estado", summary="Estado del pipeline de la receta (PDF, correo, Drive)")
+async def estado_receta_web(id_receta: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    fila = (await db.execute(
+        select(RecetaWeb.sent, RecetaWeb.pdf_path).where(RecetaWeb.id_receta == id_receta)
+    )).first()
+    if not fila:
+        raise HTTPException(status_code=404, detail="Receta no encontrada")
+
+    etapas = await run_in_threadpool(estado_receta, id_receta)
+    completada = all(e is None or e["estado"] == "completado" for e in etapas.values()) and fila.sent
+    return {
+        "id_receta": id_receta,
+        "sent": fila.sent,
+        "pdf_disponible": bool(fila.pdf_path),
+        "etapas": etapas,
+        "completada": completada
+    }
 
 @router.get("/{id_receta}/pdf", summary="Descargar/ver PDF de receta web")
-def ver_pdf_receta_web(id_receta: str, user=Depends(get_current_user)):
-    db = SessionLocal()
-    try:
-        receta = db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta).first()
-        if not receta or not receta.pdf_path:
-            raise HTTPException(status_code=404, detail="PDF no encontrado para esta receta")
-        
-        # Asegurar ruta absoluta
-        pdf_path_abs = os.path.abspath(receta.pdf_path) if not os.path.isabs(receta.pdf_path) else receta.pdf_path
-        
-        if not os.path.exists(pdf_path_abs):
-            raise HTTPException(status_code=404, detail=f"Archivo PDF no existe en disco: {pdf_path_abs}")
-        return FileResponse(pdf_path_abs, media_type="application/pdf", filename=os.path.basename(pdf_path_abs))
-    finally:
-        db.close()
+async def ver_pdf_receta_web(id_receta: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    pdf_path = await db.scalar(select(RecetaWeb.pdf_path).where(RecetaWeb.id_receta == id_receta))
+    if not pdf_path:
+        raise HTTPException(status_code=404, detail="PDF no encontrado para esta receta")
+
+    # Asegurar ruta absoluta
+    pdf_path_abs = os.path.abspath(pdf_path) if not os.path.isabs(pdf_path) else pdf_path
+
+    if not os.path.exists(pdf_path_abs):
+        raise HTTPException(status_code=404, detail=f"Archivo PDF no existe en disco: {pdf_path_abs}")
+    return FileResponse(pdf_path_abs, media_type="application/pdf", filename=os.path.basename(pdf_path_abs))
 
 @router.post("/{id_receta}/reenviar-correo", summary="Reenviar correo con PDF")
-def reenviar_correo(id_receta: str, user=Depends(get_current_user)):
-    db = SessionLocal()
+async def reenviar_correo(id_receta: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
     try:
-        receta = db.query(RecetaWeb).filter(RecetaWeb.id_receta == id_receta).first()
+        receta = await db.scalar(select(RecetaWeb).where(RecetaWeb.id_receta == id_receta))
         if not receta:
             raise HTTPException(status_code=404, detail="Receta no encontrada")
         
-        paciente = db.query(PacienteWeb).filter(PacienteWeb.id == receta.paciente_id).first()
+        paciente = await db.get(PacienteWeb, receta.paciente_id)
         if not paciente:
             raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
-        medico = db.query(MedicoWeb).filter(MedicoWeb.id == receta.medico_id).first()
+        medico = await db.get(MedicoWeb, receta.medico_id)
         if not medico:
             raise HTTPException(status_code=404, detail="Médico no encontrado")
 
@@ -285,8 +342,9 @@ def reenviar_correo(id_receta: str, user=Depends(get_current_user)):
         if not os.path.exists(receta.pdf_path):
             raise HTTPException(status_code=400, detail="Archivo PDF no encontrado")
         
-        # Llamada correcta con todos los parámetros requeridos
-        enviar_receta_completa(
+        # El envío SMTP es bloqueante: se hace en el threadpool
+        await run_in_threadpool(
+            enviar_receta_completa,
             email_paciente=paciente.correo,
             pdf_path=receta.pdf_path,
             contrasena=receta.pdf_password,
@@ -297,8 +355,8 @@ def reenviar_correo(id_receta: str, user=Depends(get_current_user)):
         logger.info(f"Correo reenviado para receta {id_receta}")
         return {"status": "success", "message": "Correo reenviado exitosamente"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al reenviar: {e}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-    finally:
-        db.close()
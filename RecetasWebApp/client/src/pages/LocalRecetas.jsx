@@ -6,6 +6,8 @@ import {
 } from "@mui/material";
 import api from "../api";
 
+const PAGE_SIZE = 50;
+
 export default function LocalRecetas() {
   const [recetas, setRecetas] = useState([]);
   const [stats, setStats] = useState({});
@@ -14,15 +16,19 @@ export default function LocalRecetas() {
   const [selectedReceta, setSelectedReceta] = useState(null);
   const [openDetails, setOpenDetails] = useState(false);
   const [sincronizando, setSincronizando] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const cargar = async (origen = null) => {
+  // Sin cursor recarga la primera página del filtro; con cursor añade la siguiente
+  const cargar = async (origen = null, cursor = null) => {
     setLoading(true);
     try {
-      const params = origen ? `?filtro_origen=${origen}` : "";
-      const res = await api.get(`/local-admin/recetas-locales${params}`);
-      setRecetas(res.data);
+      const params = { limit: PAGE_SIZE, cursor };
+      if (origen) params.filtro_origen = origen;
+      const res = await api.get("/local-admin/recetas-locales", { params });
+      setRecetas((prev) => (cursor ? [...prev, ...res.data] : res.data));
+      setNextCursor(res.headers["x-next-cursor"] || null);
       setFiltroOrigen(origen);
-      loadStats();
+      if (!cursor) loadStats();
     } catch (err) {
       console.error("Error cargando recetas:", err);
       alert("Error: " + (err.response?.data?.detail || err.message));
@@ -230,6 +236,14 @@ export default function LocalRecetas() {
         </Table>
       </TableContainer>
 
+      {nextCursor && (
+        <Box sx={{ mt: 2, textAlign: "center" }}>
+          <Button variant="outlined" onClick={() => cargar(filtroOrigen, nextCursor)} disabled={loading}>
+            {loading ? "Cargando..." : "Cargar más"}
+          </Button>
+        </Box>
+      )}
+
       {/* Dialog de detalles */}
       <Dialog open={openDetails} onClose={() => setOpenDetails(false)} maxWidth="sm" fullWidth>
         <DialogTitle>Detalles de Receta</DialogTitle>
@@ -2,6 +2,8 @@ import { useEffect, useState } from "react";
 import { TextField, Button, Card, CardContent, Typography } from "@mui/material";
 import api from "../api";
 
+const PAGE_SIZE = 50;
+
 export default function Medicos() {
   const [data, setData] = useState([]);
   const [form, setForm] = useState({
@@ -11,8 +13,14 @@ export default function Medicos() {
     correo: "",
   });
 
-  const cargar = () => {
-    api.get("/medicos").then(r => setData(r.data));
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Sin cursor recarga desde el principio; con cursor añade la página siguiente
+  const cargar = (cursor = null) => {
+    api.get("/medicos", { params: { limit: PAGE_SIZE, cursor } }).then((r) => {
+      setData((prev) => (cursor ? [...prev, ...r.data] : r.data));
+      setNextCursor(r.headers["x-next-cursor"] || null);
+    });
   };
 
   useEffect(() => {
@@ -90,6 +98,11 @@ export default function Medicos() {
           </CardContent>
         </Card>
       ))}
+      {nextCursor && (
+        <Button variant="outlined" onClick={() => cargar(nextCursor)}>
+          Cargar más
+        </Button>
+      )}
 
       <div style={{ marginTop: 16, display: "flex", gap: "8px" }}>
         <Button variant="contained" color="success" onClick={exportMedicos}>
@@ -2,6 +2,8 @@ import { useEffect, useState } from "react";
 import { TextField, Button, Card, CardContent, Typography, MenuItem } from "@mui/material";
 import api from "../api";
 
+const PAGE_SIZE = 50;
+
 function Pacientes() {
   const [data, setData] = useState([]);
   const [form, setForm] = useState({
@@ -14,8 +16,14 @@ function Pacientes() {
     correo: "",
   });
 
-  const cargar = () => {
-    api.get("/pacientes").then((r) => setData(r.data));
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Sin cursor recarga desde el principio; con cursor añade la página siguiente
+  const cargar = (cursor = null) => {
+    api.get("/pacientes", { params: { limit: PAGE_SIZE, cursor } }).then((r) => {
+      setData((prev) => (cursor ? [...prev, ...r.data] : r.data));
+      setNextCursor(r.headers["x-next-cursor"] || null);
+    });
   };
 
   useEffect(() => {
@@ -114,6 +122,11 @@ function Pacientes() {
           </CardContent>
         </Card>
       ))}
+      {nextCursor && (
+        <Button variant="outlined" onClick={() => cargar(nextCursor)}>
+          Cargar más
+        </Button>
+      )}
 
       <div style={{ marginTop: 16, display: "flex", gap: "8px" }}>
         <Button variant="contained" color="success" onClick={exportPatients}>
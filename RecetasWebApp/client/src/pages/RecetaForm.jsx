@@ -2,6 +2,9 @@ import { useEffect, useState } from "react";
 import { TextField, Button, Card, CardContent, Typography, MenuItem } from "@mui/material";
 import api from "../api";
 
+// Página máxima del API (LIST_MAX_LIMIT): menos peticiones al cargar los selectores
+const PAGE_SIZE = 500;
+
 export default function RecetaForm() {
   const [pacientes, setPacientes] = useState([]);
   const [medicos, setMedicos] = useState([]);
@@ -17,8 +20,19 @@ export default function RecetaForm() {
   });
 
   useEffect(() => {
-    api.get("/pacientes").then(r => setPacientes(r.data));
-    api.get("/medicos").then(r => setMedicos(r.data));
+    // Los listados van paginados: los selectores siguen X-Next-Cursor hasta tener todos
+    const cargarTodos = async (ruta) => {
+      const todos = [];
+      let cursor = null;
+      do {
+        const r = await api.get(ruta, { params: { limit: PAGE_SIZE, cursor } });
+        todos.push(...r.data);
+        cursor = r.headers["x-next-cursor"] || null;
+      } while (cursor);
+      return todos;
+    };
+    cargarTodos("/pacientes").then(setPacientes);
+    cargarTodos("/medicos").then(setMedicos);
   }, []);
 
   const agregarMedicamento = () => {
@@ -70,10 +84,7 @@ export default function RecetaForm() {
       .then(r => {
         let mensaje = "✅ Receta creada exitosamente!\n\n";
         mensaje += `ID de Receta: ${r.data.id_receta}\n`;
-        if (r.data.pdf_path) {
-          mensaje += "✓ PDF generado correctamente\n";
-        }
-        mensaje += "✓ XML enviado al Drive";
+        mensaje += "⏳ PDF, correo al paciente y envío al Drive en proceso";
         alert(mensaje);
         // Limpiar formulario
         setForm({
@@ -49,24 +49,51 @@ const reenviarCorreo = async (idReceta) => {
 
 
 
+const exportarRecetas = async (formato) => {
+  try {
+    const res = await api.get("/recetas/export", { params: { formato }, responseType: "blob" });
+    const url = window.URL.createObjectURL(res.data);
+    const link = document.createElement("a");
+    link.href = url;
+    link.setAttribute("download", `recetas.${formato}`);
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    window.URL.revokeObjectURL(url);
+  } catch (error) {
+    alert("Error al exportar: " + (error.response?.data?.detail || error.message));
+  }
+};
+
+const PAGE_SIZE = 50;
+
 export default function RecetasList() {
   const [data, setData] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(null);
+  const [cargandoMas, setCargandoMas] = useState(false);
 
   useEffect(() => {
     cargarRecetas();
   }, []);
 
-  const cargarRecetas = () => {
-    setLoading(true);
-    api.get("/recetas")
+  // Primera página (con total) o, si se pasa cursor, la siguiente
+  const cargarRecetas = (cursor = null) => {
+    const params = cursor ? { limit: PAGE_SIZE, cursor } : { limit: PAGE_SIZE, include_total: true };
+    cursor ? setCargandoMas(true) : setLoading(true);
+    api.get("/recetas", { params })
       .then(r => {
-        setData(r.data);
-        setLoading(false);
+        setData(prev => (cursor ? [...prev, ...r.data] : r.data));
+        setNextCursor(r.headers["x-next-cursor"] || null);
+        if (r.headers["x-total-count"]) setTotal(Number(r.headers["x-total-count"]));
       })
       .catch(err => {
         console.error("Error al cargar recetas:", err);
+      })
+      .finally(() => {
         setLoading(false);
+        setCargandoMas(false);
       });
   };
 
@@ -76,7 +103,18 @@ export default function RecetasList() {
 
   return (
     <div>
-      <Typography variant="h4" sx={{ mb: 3 }}>Recetas Generadas</Typography>
+      <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', mb: 1 }}>
+        <Typography variant="h4">Recetas Generadas</Typography>
+        <Stack direction="row" spacing={1}>
+          <Button variant="outlined" onClick={() => exportarRecetas("csv")}>Exportar CSV</Button>
+          <Button variant="outlined" onClick={() => exportarRecetas("ndjson")}>Exportar NDJSON</Button>
+        </Stack>
+      </Box>
+      {total !== null && (
+        <Typography variant="body2" color="text.secondary" sx={{ mb: 3 }}>
+          Mostrando {data.length} de {total}
+        </Typography>
+      )}
 
       {data.length === 0 ? (
         <Card>
@@ -183,6 +221,12 @@ export default function RecetasList() {
           </Card>
         ))
       )}
+
+      {nextCursor && (
+        <Button variant="outlined" onClick={() => cargarRecetas(nextCursor)} disabled={cargandoMas}>
+          {cargandoMas ? "Cargando..." : "Cargar más"}
+        </Button>
+      )}
     </div>
   );
 }